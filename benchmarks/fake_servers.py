@@ -0,0 +1,382 @@
+"""
+Local fake Cerebras, Linkup and slide generation servers for the offline benchmarks.
+
+The servers speak the HTTP APIs the SDKs call (OpenAI compatible chat completions with
+streaming, Linkup search, slide generation), so the whole client stack is exercised. Each
+server draws its latency from a configurable distribution, fails a configurable share of the
+calls and sizes its answers as configured. The structured outputs are generated from the JSON
+schema sent with the request, so every schema of `utils/schemas.py` gets a valid answer.
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pydantic import BaseModel, Field
+from typing import Any, Dict, List, Literal, Optional
+import json
+import random
+import re
+import threading
+import time
+
+QUESTION_LINE_PATTERN = re.compile(r"^\s*(\d+)[.)]", re.MULTILINE)
+REQUESTED_ITEMS_PATTERN = re.compile(r"generate (\d+)")
+WORDS = ("benchmark", "latency", "throughput", "model", "provider", "market", "accuracy",
+         "pricing", "deployment", "dataset", "evaluation", "performance", "report", "source")
+
+class LatencyDistribution(BaseModel):
+    """Distribution of the response times of a fake server.
+
+    Attributes:
+        kind (str): fixed, uniform between low and high, or lognormal around the median.
+        median (float): Seconds of the fixed latency, median of the lognormal latency.
+        sigma (float): Shape of the lognormal latency, 0.5 gives a p99 about 3x the median.
+        low (float): Lower bound of the uniform latency.
+        high (float): Upper bound of the uniform latency.
+    """
+    kind: Literal["fixed", "uniform", "lognormal"] = "lognormal"
+    median: float = Field(default=0.05, ge=0)
+    sigma: float = Field(default=0.5, ge=0)
+    low: float = Field(default=0.0, ge=0)
+    high: float = Field(default=0.1, ge=0)
+
+    def sample(self) -> float:
+        if self.kind == "fixed":
+            return self.median
+        if self.kind == "uniform":
+            return random.uniform(self.low, self.high)
+        return random.lognormvariate(0, self.sigma) * self.median if self.median else 0.0
+
+class FakeBackendConfig(BaseModel):
+    """Behavior of a fake server.
+
+    Attributes:
+        latency (LatencyDistribution): Response times of the server.
+        error_rate (float): Share of the calls answered with `error_status`.
+        error_status (int): Status of the failed calls, 503 for outages or 429 for rate limits.
+        response_chars (int): Size of the free text answers (reports, analyses, search answers).
+        list_items (int): Number of items of the lists of the structured outputs.
+        malformed_rate (float): Share of the structured outputs wrapped in a markdown fence or truncated.
+    """
+    latency: LatencyDistribution = Field(default_factory=LatencyDistribution)
+    error_rate: float = Field(default=0.0, ge=0, le=1)
+    error_status: int = 503
+    response_chars: int = Field(default=2000, ge=1)
+    list_items: int = Field(default=3, ge=1)
+    malformed_rate: float = Field(default=0.0, ge=0, le=1)
+
+class CallCounter:
+    """Thread safe count of the calls served by a fake server."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+
+    def increment(self, name: str):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self.counts = {}
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self.counts)
+
+def make_text(chars: int) -> str:
+    words = []
+    length = 0
+    while length < chars:
+        word = random.choice(WORDS)
+        words.append(word)
+        length += len(word) + 1
+    return " ".join(words)
+
+def make_report(chars: int) -> str:
+    """Markdown report with a title and sections, as the report steps produce."""
+    sections = ["# Benchmark report"]
+    for number in range(1, 5):
+        sections.append(f"## Section {number}\n{make_text(max(chars // 4, 1))}")
+    return "\n\n".join(sections)
+
+def malform_json(content: str) -> str:
+    """Damage a JSON answer the way models do: fenced, or cut by the token limit."""
+    if random.random() < 0.5:
+        return f"```json\n{content}\n```"
+    return content[:random.randint(len(content) // 2, len(content) - 1)]
+
+def resolve_schema(schema: Dict[str, Any], root: Dict[str, Any]) -> Dict[str, Any]:
+    reference = schema.get("$ref")
+    if reference:
+        node = root
+        for part in reference.lstrip("#/").split("/"):
+            node = node[part]
+        return node
+    return schema
+
+def generate_instance(schema: Dict[str, Any],
+                      root: Dict[str, Any],
+                      config: FakeBackendConfig,
+                      prompt: str,
+                      name: str = "",
+                      list_items: Optional[int] = None) -> Any:
+    """Generate a value valid against a JSON schema, with plausible values for the pipeline fields.
+
+    Args:
+        schema (Dict[str, Any]): schema of the value
+        root (Dict[str, Any]): whole schema, holding the $defs
+        config (FakeBackendConfig): sizes of the generated values
+        prompt (str): user prompt of the call, numbered questions are answered one item each
+        name (str): name of the property holding the value
+        list_items (int, optional): number of items of the lists, `config.list_items` by default
+
+    Returns:
+        Any: generated value
+    """
+    schema = resolve_schema(schema, root)
+    if "anyOf" in schema:
+        return generate_instance(schema["anyOf"][0], root, config, prompt, name, list_items)
+    if "enum" in schema:
+        return random.choice(schema["enum"])
+    schema_type = schema.get("type", "object")
+    if schema_type == "object":
+        return {key: generate_instance(value, root, config, prompt, key, list_items)
+                for key, value in schema.get("properties", {}).items()}
+    if schema_type == "array":
+        item_schema = resolve_schema(schema.get("items", {}), root)
+        question_numbers = [int(number) for number in QUESTION_LINE_PATTERN.findall(prompt)]
+        if "question_number" in item_schema.get("properties", {}) and question_numbers:
+            items = []
+            for question_number in question_numbers:
+                item = generate_instance(item_schema, root, config, prompt)
+                item["question_number"] = question_number
+                items.append(item)
+            return items
+        return [generate_instance(item_schema, root, config, prompt, list_items= list_items)
+                for _ in range(list_items or config.list_items)]
+    if schema_type == "integer":
+        return 1
+    if schema_type == "number":
+        return 1.0
+    if schema_type == "boolean":
+        return True
+    if name == "from_date":
+        return "2024-01-01"
+    if name == "to_date":
+        return "2025-06-30"
+    if name in ("content", "analysis"):
+        return make_text(config.response_chars // 4)
+    return make_text(min(config.response_chars, 80))
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    # the default backlog of 5 connections resets the connections of load tests
+    request_queue_size = 1024
+
+class FakeServer:
+    """Threaded HTTP server answering with the handler of a fake backend.
+
+    Args:
+        config (FakeBackendConfig): Behavior of the server.
+    """
+
+    def __init__(self, config: FakeBackendConfig):
+        self.config = config
+        self.calls = CallCounter()
+        self._server = FakeHTTPServer(("127.0.0.1", 0), self.make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target= self._server.serve_forever, daemon= True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def make_handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format: str, *args):
+                pass
+
+            def send_json(self, status: int, payload: Any):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                # connection warm-up of the SDKs
+                self.send_json(200, {})
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                time.sleep(server.config.latency.sample())
+                if random.random() < server.config.error_rate:
+                    server.calls.increment("errors")
+                    self.send_json(server.config.error_status, server.error_payload())
+                    return
+                server.handle(self, self.path, payload)
+
+        return Handler
+
+    def error_payload(self) -> Dict[str, Any]:
+        return {"error": {"code": "FAKE_ERROR", "message": "Simulated failure", "details": []}}
+
+    def handle(self, handler: BaseHTTPRequestHandler, path: str, payload: Dict[str, Any]):
+        raise NotImplementedError
+
+class FakeLLMServer(FakeServer):
+    """OpenAI compatible chat completions (Cerebras, SambaNova), streamed or not."""
+
+    def handle(self, handler: BaseHTTPRequestHandler, path: str, payload: Dict[str, Any]):
+        if not path.endswith("/chat/completions"):
+            handler.send_json(404, {"error": {"message": f"Unknown path {path}"}})
+            return
+        self.calls.increment("chat_completions")
+        content = self.make_content(payload)
+        prompt_chars = sum(len(message.get("content") or "") for message in payload.get("messages", []))
+        usage = {"prompt_tokens": prompt_chars // 4,
+                 "completion_tokens": len(content) // 4,
+                 "total_tokens": (prompt_chars + len(content)) // 4}
+        if payload.get("stream"):
+            self.stream(handler, payload["model"], content, usage)
+            return
+        handler.send_json(200, {"id": f"chatcmpl-{random.getrandbits(32):x}",
+                                "object": "chat.completion",
+                                "created": int(time.time()),
+                                "model": payload["model"],
+                                "system_fingerprint": "fake",
+                                "choices": [{"index": 0,
+                                             "finish_reason": "stop",
+                                             "message": {"role": "assistant", "content": content}}],
+                                "usage": usage,
+                                "time_info": {}})
+
+    def make_content(self, payload: Dict[str, Any]) -> str:
+        messages = payload.get("messages", [])
+        prompt = messages[-1].get("content", "") if messages else ""
+        response_format = payload.get("response_format") or {}
+        if response_format.get("type") == "json_schema":
+            schema = response_format["json_schema"]["schema"]
+            # the decomposition and next questions steps ask for a number of questions
+            requested_items = REQUESTED_ITEMS_PATTERN.search(" ".join(message.get("content") or "" for message in messages))
+            list_items = int(requested_items.group(1)) if requested_items else None
+            content = json.dumps(generate_instance(schema, schema, self.config, prompt, list_items= list_items))
+            if random.random() < self.config.malformed_rate:
+                content = malform_json(content)
+            return content
+        if response_format.get("type") == "json_object":
+            return json.dumps({"answer": make_text(self.config.response_chars)})
+        content = make_report(self.config.response_chars)
+        if "thinking" in payload.get("model", ""):
+            content = f"<think>{make_text(200)}</think>{content}"
+        return content
+
+    def stream(self, handler: BaseHTTPRequestHandler, model: str, content: str, usage: Dict[str, int]):
+        handler.send_response(200)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.send_header("Connection", "close")
+        handler.end_headers()
+        tokens = re.findall(r"\S+\s*", content) or [content]
+        for i, token in enumerate(tokens):
+            is_last = i == len(tokens) - 1
+            chunk = {"id": "chatcmpl-stream",
+                     "object": "chat.completion.chunk",
+                     "created": int(time.time()),
+                     "model": model,
+                     "system_fingerprint": "fake",
+                     "choices": [{"index": 0,
+                                  "delta": {"content": token},
+                                  "finish_reason": "stop" if is_last else None}]}
+            if is_last:
+                chunk["usage"] = usage
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        handler.wfile.write(b"data: [DONE]\n\n")
+        handler.wfile.flush()
+        handler.close_connection = True
+
+class FakeLinkupServer(FakeServer):
+    """Linkup search API, answering sourced answers."""
+
+    def handle(self, handler: BaseHTTPRequestHandler, path: str, payload: Dict[str, Any]):
+        if not path.endswith("/search"):
+            handler.send_json(404, self.error_payload())
+            return
+        self.calls.increment("search")
+        sources = [{"name": f"Source {i}",
+                    "url": f"https://example.com/{i}",
+                    "snippet": make_text(200)} for i in range(self.config.list_items)]
+        if payload.get("outputType") == "searchResults":
+            handler.send_json(200, {"results": [dict(source, type="text", content=source["snippet"])
+                                                for source in sources]})
+            return
+        handler.send_json(200, {"answer": f"{payload.get('q', '')}: {make_text(self.config.response_chars)}",
+                                "sources": sources})
+
+class FakeSlidesServer(FakeServer):
+    """Slide generation service."""
+
+    def handle(self, handler: BaseHTTPRequestHandler, path: str, payload: Dict[str, Any]):
+        self.calls.increment("presentation")
+        presentation_id = f"{random.getrandbits(32):x}"
+        handler.send_json(200, {"presentation_id": presentation_id,
+                                "path": f"/presentations/{presentation_id}.pptx",
+                                "edit_path": f"/presentations/{presentation_id}/edit"})
+
+class FakeBackends:
+    """The fake Cerebras, Linkup and slide servers of a benchmark run.
+
+    Args:
+        llm_config (FakeBackendConfig): Behavior of the LLM server.
+        search_config (FakeBackendConfig): Behavior of the Linkup server.
+        slides_config (FakeBackendConfig, optional): Behavior of the slide server.
+    """
+
+    def __init__(self,
+                 llm_config: FakeBackendConfig,
+                 search_config: FakeBackendConfig,
+                 slides_config: Optional[FakeBackendConfig] = None):
+        self.llm = FakeLLMServer(llm_config)
+        self.search = FakeLinkupServer(search_config)
+        self.slides = FakeSlidesServer(slides_config or FakeBackendConfig(latency= LatencyDistribution(kind="fixed", median=0.0)))
+
+    def start(self) -> "FakeBackends":
+        for server in self.servers():
+            server.start()
+        return self
+
+    def stop(self):
+        for server in self.servers():
+            server.stop()
+
+    def servers(self) -> List[FakeServer]:
+        return [self.llm, self.search, self.slides]
+
+    def environment(self) -> Dict[str, str]:
+        """Settings pointing the pipeline to the fake servers."""
+        return {"LLM_PROVIDERS": "cerebras",
+                "LLM_PROVIDER_BASE_URLS": f"cerebras={self.llm.url}",
+                "LINKUP_BASE_URL": f"{self.search.url}/v1",
+                "SLIDES_URL": f"{self.slides.url}/api/v1/ppt/presentation/generate"}
+
+    def reset_counts(self):
+        for server in self.servers():
+            server.calls.reset()
+
+    def call_counts(self) -> Dict[str, int]:
+        return {"llm_calls": self.llm.calls.snapshot().get("chat_completions", 0),
+                "llm_errors": self.llm.calls.snapshot().get("errors", 0),
+                "search_calls": self.search.calls.snapshot().get("search", 0),
+                "search_errors": self.search.calls.snapshot().get("errors", 0),
+                "slide_calls": self.slides.calls.snapshot().get("presentation", 0)}
@@ -0,0 +1,391 @@
+"""
+Load test of the FastAPI app served by uvicorn, against the fake backends.
+
+The load generator sends `SearchRequest` payloads at a target arrival rate (open loop: a
+request is sent on schedule whether or not the previous ones are answered), one stage per
+rate. The payloads are drawn from a weighted mix of sub question and iteration counts:
+
+    python -m benchmarks.load_test --rates 0.5,1,2,4 --stage-seconds 30 --mix 2x1:3,4x1:2,4x2:1 --workers 1
+
+Every request records its latency and status. Every second the app's `/metrics` is scraped
+for the requests in progress and the tasks of the pipeline executor, and the resident memory
+of the uvicorn processes is read. The report gives, by stage, the throughput, the latency
+percentiles, the error rate, the executor saturation and the memory growth, and the first
+rate past the concurrency knee: the answers served fall behind the requests sent, the p95
+latency doubles from the first stage or more than 1% of the requests fail. The answers are
+counted over the stage shifted by its median latency, the stages should last much longer
+than the requests for the counts to settle.
+
+With several uvicorn workers each process keeps its own metrics, the saturation is sampled
+from the worker answering the scrape while the memory is summed over all of them.
+"""
+from benchmarks.fake_servers import FakeBackends
+from benchmarks.run_benchmark import BENCHMARK_ENVIRONMENT, FAKE_KEYS_ENVIRONMENT, make_config, percentile
+from prometheus_client.parser import text_string_to_metric_families
+from typing import Any, Dict, List, Optional, Tuple
+import argparse
+import asyncio
+import httpx
+import json
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+KNEE_THROUGHPUT_RATIO = 0.9
+KNEE_LATENCY_RATIO = 2.0
+KNEE_ERROR_RATE = 0.01
+
+def parse_float_list(value: str) -> List[float]:
+    return [float(item) for item in value.split(",") if item.strip()]
+
+def parse_mix(value: str) -> List[Tuple[int, int, float]]:
+    """Parse a request mix like `2x1:3,4x2:1` into (sub questions, iterations, weight) items."""
+    mix = []
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        shape, _, weight = item.partition(":")
+        sub_questions, _, iterations = shape.partition("x")
+        mix.append((int(sub_questions), int(iterations or 1), float(weight or 1)))
+    return mix
+
+def get_free_port() -> int:
+    with socket.socket() as free_socket:
+        free_socket.bind(("127.0.0.1", 0))
+        return free_socket.getsockname()[1]
+
+def get_process_tree_rss(pid: int) -> Optional[float]:
+    """Resident memory in MB of a process and its descendants, None where /proc is not available."""
+    pids = [pid]
+    rss_pages = 0
+    try:
+        while pids:
+            current_pid = pids.pop()
+            with open(f"/proc/{current_pid}/statm") as statm_file:
+                rss_pages += int(statm_file.read().split()[1])
+            for task in os.listdir(f"/proc/{current_pid}/task"):
+                with open(f"/proc/{current_pid}/task/{task}/children") as children_file:
+                    pids.extend(int(child) for child in children_file.read().split())
+    except (FileNotFoundError, ProcessLookupError):
+        if rss_pages == 0:
+            return None
+    return rss_pages * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+def parse_metrics(text: str) -> Dict[str, float]:
+    """Pick the saturation gauges out of a Prometheus scrape."""
+    values = {"requests_in_progress": 0.0}
+    for family in text_string_to_metric_families(text):
+        for sample in family.samples:
+            if sample.name == "http_requests_in_progress":
+                values["requests_in_progress"] += sample.value
+            elif sample.name == "executor_tasks":
+                values[f"executor_{sample.labels['state']}"] = sample.value
+            elif sample.name in ("executor_workers", "executor_max_workers"):
+                values[sample.name] = sample.value
+    return values
+
+class AppProcess:
+    """The app served by uvicorn in a child process.
+
+    Args:
+        workers (int): Uvicorn worker processes.
+        environment (Dict[str, str]): Environment of the app, added to the current one.
+        log_path (str, optional): File the output of the app is written to, discarded if None.
+    """
+
+    def __init__(self, workers: int, environment: Dict[str, str], log_path: Optional[str] = None):
+        self.port = get_free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.workers = workers
+        self.environment = environment
+        self.log_path = log_path
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float = 60.0) -> "AppProcess":
+        output = open(self.log_path, "a") if self.log_path else subprocess.DEVNULL
+        self.process = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app",
+                                         "--host", "127.0.0.1", "--port", str(self.port),
+                                         "--workers", str(self.workers), "--log-level", "warning"],
+                                        cwd= ROOT_DIRECTORY,
+                                        env= {**os.environ, **self.environment},
+                                        stdout= output,
+                                        stderr= subprocess.STDOUT)
+        if self.log_path:
+            output.close()
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"The app exited with code {self.process.returncode}")
+            try:
+                if httpx.get(f"{self.url}/", timeout= 1).status_code == 200:
+                    return self
+            except httpx.TransportError:
+                pass
+            time.sleep(0.2)
+        self.stop()
+        raise TimeoutError(f"The app did not answer within {timeout}s")
+
+    def stop(self):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            try:
+                self.process.wait(timeout= 15)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+
+class LoadGenerator:
+    """Open loop generator of search requests, with a sampler of the app saturation.
+
+    Args:
+        app (AppProcess): App under load.
+        endpoint (str): Path of the search endpoint.
+        mix (List[Tuple[int, int, float]]): Weighted (sub questions, iterations) shapes of the requests.
+        query (str): Query of the requests.
+        arrival (str): poisson for exponential gaps between the requests, constant for even gaps.
+        request_timeout (float): Seconds after which a request counts as failed.
+        sample_interval (float): Seconds between two samples of the app saturation.
+        seed (int): Seed of the arrivals and the mix.
+    """
+
+    def __init__(self,
+                 app: AppProcess,
+                 endpoint: str,
+                 mix: List[Tuple[int, int, float]],
+                 query: str,
+                 arrival: str,
+                 request_timeout: float,
+                 sample_interval: float,
+                 seed: int):
+        self.app = app
+        self.endpoint = endpoint
+        self.mix = mix
+        self.query = query
+        self.arrival = arrival
+        self.request_timeout = request_timeout
+        self.sample_interval = sample_interval
+        self.random = random.Random(seed)
+        self.in_flight = 0
+        self.requests: List[Dict[str, Any]] = []
+        self.samples: List[Dict[str, Any]] = []
+        self.start_time = 0.0
+
+    def next_payload(self) -> Dict[str, Any]:
+        sub_questions, iterations, _ = self.random.choices(self.mix, weights= [weight for _, _, weight in self.mix])[0]
+        return {"query": self.query, "max_sub_questions": sub_questions, "max_iterations": iterations}
+
+    def next_gap(self, rate: float) -> float:
+        return self.random.expovariate(rate) if self.arrival == "poisson" else 1 / rate
+
+    async def send(self, client: httpx.AsyncClient, stage: int, payload: Dict[str, Any]):
+        record = {"stage": stage,
+                  "sent_at": time.monotonic() - self.start_time,
+                  "sub_questions": payload["max_sub_questions"],
+                  "iterations": payload["max_iterations"],
+                  "status": None,
+                  "error": None}
+        self.in_flight += 1
+        start = time.perf_counter()
+        try:
+            response = await client.post(self.endpoint, json= payload)
+            record["status"] = response.status_code
+        except httpx.HTTPError as e:
+            record["error"] = type(e).__name__
+        finally:
+            self.in_flight -= 1
+            record["latency"] = time.perf_counter() - start
+            self.requests.append(record)
+
+    async def sample(self, client: httpx.AsyncClient, stop: asyncio.Event):
+        while not stop.is_set():
+            sample = {"time": time.monotonic() - self.start_time,
+                      "in_flight": self.in_flight,
+                      "rss_mb": get_process_tree_rss(self.app.process.pid)}
+            try:
+                response = await client.get("/metrics", timeout= self.sample_interval * 5)
+                sample.update(parse_metrics(response.text))
+            except httpx.HTTPError as e:
+                logger.warning(f"Could not scrape the metrics of the app: {e!r}")
+            self.samples.append(sample)
+            try:
+                await asyncio.wait_for(stop.wait(), timeout= self.sample_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def run(self, rates: List[float], stage_seconds: float) -> List[Tuple[float, float]]:
+        """Send the stages of requests and wait for their answers.
+
+        Returns:
+            List[Tuple[float, float]]: start and end offsets of the stages
+        """
+        limits = httpx.Limits(max_connections= None, max_keepalive_connections= 100)
+        stages = []
+        async with httpx.AsyncClient(base_url= self.app.url, timeout= self.request_timeout, limits= limits) as client:
+            self.start_time = time.monotonic()
+            stop = asyncio.Event()
+            sampler = asyncio.create_task(self.sample(client, stop))
+            tasks = []
+            for stage, rate in enumerate(rates):
+                stage_start = time.monotonic() - self.start_time
+                next_send = time.monotonic()
+                stage_end = next_send + stage_seconds
+                while next_send < stage_end:
+                    await asyncio.sleep(max(0.0, next_send - time.monotonic()))
+                    tasks.append(asyncio.create_task(self.send(client, stage, self.next_payload())))
+                    next_send += self.next_gap(rate)
+                await asyncio.sleep(max(0.0, stage_end - time.monotonic()))
+                stages.append((stage_start, time.monotonic() - self.start_time))
+                logger.warning(f"Stage {stage + 1}/{len(rates)} at {rate} req/s sent, {self.in_flight} requests in flight")
+            await asyncio.gather(*tasks)
+            stop.set()
+            await sampler
+        return stages
+
+def summarize_stage(stage: int,
+                    rate: float,
+                    window: Tuple[float, float],
+                    requests: List[Dict[str, Any]],
+                    samples: List[Dict[str, Any]],
+                    previous_rss: Optional[float]) -> Dict[str, Any]:
+    """Aggregate the requests sent during a stage and the samples taken during it."""
+    stage_requests = [request for request in requests if request["stage"] == stage]
+    succeeded = [request for request in stage_requests if request["status"] == 200]
+    latencies = [request["latency"] for request in succeeded]
+    duration = window[1] - window[0]
+    # answers served during the stage, whatever stage sent them, the window shifted by the
+    # median latency so that the answers of the stage's requests fall in it
+    lag = percentile(latencies, 0.50)
+    served = [request for request in requests
+              if request["status"] == 200 and window[0] + lag <= request["sent_at"] + request["latency"] <= window[1] + lag]
+    stage_samples = [sample for sample in samples if window[0] <= sample["time"] <= window[1]]
+    running = [sample.get("executor_running", 0) for sample in stage_samples]
+    queued = [sample.get("executor_queued", 0) for sample in stage_samples]
+    max_workers = max((sample.get("executor_max_workers", 0) for sample in stage_samples), default= 0)
+    rss = [sample["rss_mb"] for sample in stage_samples if sample.get("rss_mb") is not None]
+    end_rss = rss[-1] if rss else None
+    return {"stage": stage + 1,
+            "offered_rate": rate,
+            "requests": len(stage_requests),
+            "errors": len(stage_requests) - len(succeeded),
+            "error_rate": (len(stage_requests) - len(succeeded)) / len(stage_requests) if stage_requests else 0.0,
+            "sent_rate": len(stage_requests) / duration if duration > 0 else 0.0,
+            "throughput": len(served) / duration if duration > 0 else 0.0,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "max_in_flight": max((sample["in_flight"] for sample in stage_samples), default= 0),
+            "max_requests_in_progress": max((sample.get("requests_in_progress", 0) for sample in stage_samples), default= 0),
+            "executor_saturation": max(running, default= 0) / max_workers if max_workers else 0.0,
+            "mean_executor_queued": sum(queued) / len(queued) if queued else 0.0,
+            "rss_mb": end_rss,
+            "rss_growth_mb": end_rss - previous_rss if end_rss is not None and previous_rss is not None else None}
+
+def find_knee(stages: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Get the first stage past the concurrency knee, None if no stage is."""
+    if not stages:
+        return None
+    baseline_p95 = stages[0]["p95"]
+    for stage in stages:
+        if (stage["throughput"] < KNEE_THROUGHPUT_RATIO * stage["sent_rate"]
+                or (baseline_p95 and stage["p95"] > KNEE_LATENCY_RATIO * baseline_p95)
+                or stage["error_rate"] > KNEE_ERROR_RATE):
+            return stage
+    return None
+
+def format_report(stages: List[Dict[str, Any]], knee: Optional[Dict[str, Any]], workers: int) -> str:
+    columns = [("stage", "stage", "{:d}"), ("offered_rate", "offered/s", "{:.2f}"), ("sent_rate", "sent/s", "{:.2f}"),
+               ("throughput", "served/s", "{:.2f}"),
+               ("requests", "reqs", "{:d}"), ("error_rate", "errors", "{:.1%}"), ("p50", "p50 s", "{:.2f}"),
+               ("p95", "p95 s", "{:.2f}"), ("p99", "p99 s", "{:.2f}"), ("max_in_flight", "in flight", "{:d}"),
+               ("executor_saturation", "executor", "{:.0%}"), ("mean_executor_queued", "queued", "{:.1f}"),
+               ("rss_mb", "rss MB", "{:.0f}"), ("rss_growth_mb", "rss +MB", "{:+.0f}")]
+    rows = [[header for _, header, _ in columns]]
+    rows += [[template.format(stage[key]) if stage[key] is not None else "-" for key, _, template in columns]
+             for stage in stages]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    lines = ["  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows]
+    if knee is None:
+        lines.append(f"No knee up to {stages[-1]['offered_rate']} req/s with {workers} worker(s)" if stages else "No stage")
+    else:
+        lines.append(f"Knee at {knee['offered_rate']} req/s with {workers} worker(s): "
+                     f"{knee['throughput']:.2f} of {knee['sent_rate']:.2f} req/s served, p95 {knee['p95']:.2f}s, {knee['error_rate']:.1%} errors")
+    return "\n".join(lines)
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description= "Load test the app against local fake backends")
+    parser.add_argument("--rates", type= parse_float_list, default= [0.5, 1, 2, 4], help= "comma separated request rates of the stages, per second")
+    parser.add_argument("--stage-seconds", type= float, default= 30, help= "seconds of every stage")
+    parser.add_argument("--mix", type= parse_mix, default= parse_mix("2x1:3,4x1:2,4x2:1"),
+                        help= "comma separated SUB_QUESTIONSxITERATIONS:WEIGHT shapes of the requests")
+    parser.add_argument("--arrival", choices= ["poisson", "constant"], default= "poisson", help= "gaps between the requests")
+    parser.add_argument("--endpoint", default= "/messages/", help= "search endpoint of the app")
+    parser.add_argument("--query", default= "Benchmark the latest open weight LLMs", help= "query of the requests")
+    parser.add_argument("--workers", type= int, default= 1, help= "uvicorn worker processes")
+    parser.add_argument("--executor-workers", type= int, help= "EXECUTOR_MAX_WORKERS of the app")
+    parser.add_argument("--request-timeout", type= float, default= 300, help= "seconds after which a request fails")
+    parser.add_argument("--sample-interval", type= float, default= 1.0, help= "seconds between the samples of the app")
+    parser.add_argument("--seed", type= int, default= 0, help= "seed of the arrivals and the mix")
+    parser.add_argument("--llm-latency", type= float, default= 0.05, help= "median seconds of the LLM calls")
+    parser.add_argument("--search-latency", type= float, default= 0.2, help= "median seconds of the searches")
+    parser.add_argument("--latency-sigma", type= float, default= 0.5, help= "lognormal shape of the latencies, 0 for fixed")
+    parser.add_argument("--llm-error-rate", type= float, default= 0.0, help= "share of the LLM calls failing")
+    parser.add_argument("--search-error-rate", type= float, default= 0.0, help= "share of the searches failing")
+    parser.add_argument("--error-status", type= int, default= 503, help= "status of the failed calls")
+    parser.add_argument("--response-chars", type= int, default= 2000, help= "size of the free text answers")
+    parser.add_argument("--app-log", help= "file the output of the app is written to")
+    parser.add_argument("--output", help= "JSON file the stages, requests and samples are written to")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level= logging.WARNING, format= "%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    backends = FakeBackends(llm_config= make_config(args.llm_latency, args.latency_sigma, args.llm_error_rate,
+                                                    args.error_status, args.response_chars),
+                            search_config= make_config(args.search_latency, args.latency_sigma, args.search_error_rate,
+                                                       args.error_status, args.response_chars)).start()
+    environment = {key: os.environ.get(key, value) for key, value in BENCHMARK_ENVIRONMENT.items()}
+    environment.update({**FAKE_KEYS_ENVIRONMENT, **backends.environment()})
+    if args.executor_workers:
+        environment["EXECUTOR_MAX_WORKERS"] = str(args.executor_workers)
+    app = AppProcess(workers= args.workers, environment= environment, log_path= args.app_log)
+    try:
+        app.start()
+        generator = LoadGenerator(app= app,
+                                  endpoint= args.endpoint,
+                                  mix= args.mix,
+                                  query= args.query,
+                                  arrival= args.arrival,
+                                  request_timeout= args.request_timeout,
+                                  sample_interval= args.sample_interval,
+                                  seed= args.seed)
+        windows = asyncio.run(generator.run(args.rates, args.stage_seconds))
+    finally:
+        app.stop()
+        backends.stop()
+
+    stages = []
+    previous_rss = generator.samples[0].get("rss_mb") if generator.samples else None
+    for stage, (rate, window) in enumerate(zip(args.rates, windows)):
+        stages.append(summarize_stage(stage, rate, window, generator.requests, generator.samples, previous_rss))
+        previous_rss = stages[-1]["rss_mb"] if stages[-1]["rss_mb"] is not None else previous_rss
+    knee = find_knee(stages)
+    print(format_report(stages, knee, args.workers), flush= True)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump({"workers": args.workers,
+                       "executor_workers": args.executor_workers,
+                       "stages": stages,
+                       "knee": knee,
+                       "requests": generator.requests,
+                       "samples": generator.samples,
+                       "call_counts": backends.call_counts()}, output_file, indent= 2)
+
+if __name__ == "__main__":
+    main()
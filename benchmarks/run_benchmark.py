@@ -0,0 +1,224 @@
+"""
+Offline end-to-end benchmark of `search_pipeline` against the fake backends.
+
+Every scenario of the grid (sub questions x iterations x concurrency) sends the same number
+of requests through the pipeline, `concurrency` of them at a time, and reports the throughput,
+the p50/p95/p99 request latencies and the LLM and search calls served by the fakes.
+
+    python -m benchmarks.run_benchmark --sub-questions 2,4,8 --iterations 1,2 --concurrency 1,4
+
+The caches, the rate limiters and the trace export are disabled unless set in the
+environment, so that the runs are comparable.
+
+The fakes do not reproduce the sizes of real prompts and responses. To benchmark on real
+traffic, record a run against the providers configured in the environment, then replay it
+offline with the recorded latencies (see utils/cassette.py):
+
+    python -m benchmarks.run_benchmark --mode record --cassette run.jsonl --requests 1 --concurrency 1
+    python -m benchmarks.run_benchmark --mode replay --cassette run.jsonl --latency-scale 0.5
+"""
+from benchmarks.fake_servers import FakeBackends, FakeBackendConfig, LatencyDistribution
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+import argparse
+import functools
+import itertools
+import json
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+FAKE_KEYS_ENVIRONMENT = {
+    "CEREBRAS_API_KEY": "benchmark",
+    "LINKUP_API_KEY": "benchmark",
+    "SAMBANOVA_API_KEY": "benchmark",
+}
+
+BENCHMARK_ENVIRONMENT = {
+    "LLM_CACHE_ENABLED": "false",
+    "SEARCH_CACHE_ENABLED": "false",
+    "RATE_LIMIT_ENABLED": "false",
+    "TRACING_EXPORT_PATH": "",
+}
+
+def percentile(values: List[float], share: float) -> float:
+    """Nearest rank percentile of the values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(share * len(ordered)) - 1)]
+
+def parse_int_list(value: str) -> List[int]:
+    return [int(item) for item in value.split(",") if item.strip()]
+
+def run_scenario(search_pipeline: Callable,
+                 search_request: Callable[..., Any],
+                 get_call_counts: Callable[[], Dict[str, int]],
+                 reset_call_counts: Callable[[], None],
+                 query: str,
+                 sub_questions: int,
+                 iterations: int,
+                 concurrency: int,
+                 requests: int) -> Dict[str, Any]:
+    """Send the requests of a scenario and measure them.
+
+    Args:
+        search_pipeline (Callable): pipeline endpoint function
+        search_request (Callable[..., Any]): SearchRequest model
+        get_call_counts (Callable[[], Dict[str, int]]): calls served by the backends since the reset
+        reset_call_counts (Callable[[], None]): resets the call counts of the backends
+        query (str): query of the requests
+        sub_questions (int): sub questions per request
+        iterations (int): iterations per request
+        concurrency (int): requests in flight at the same time
+        requests (int): requests of the scenario
+
+    Returns:
+        Dict[str, Any]: throughput, latencies and call counts of the scenario
+    """
+    reset_call_counts()
+    request = search_request(query= query,
+                             max_sub_questions= sub_questions,
+                             max_iterations= iterations)
+    latencies = []
+    errors = 0
+
+    def timed_request(_: int) -> float:
+        start = time.perf_counter()
+        search_pipeline(request)
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers= concurrency) as pool:
+        futures = [pool.submit(timed_request, i) for i in range(requests)]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                errors += 1
+                logger.warning(f"Benchmark request failed: {e!r}")
+    wall_seconds = time.perf_counter() - start
+    call_counts = get_call_counts()
+    return {"sub_questions": sub_questions,
+            "iterations": iterations,
+            "concurrency": concurrency,
+            "requests": requests,
+            "errors": errors,
+            "wall_seconds": wall_seconds,
+            "throughput": len(latencies) / wall_seconds if wall_seconds else 0.0,
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "llm_calls_per_request": call_counts["llm_calls"] / requests,
+            "search_calls_per_request": call_counts["search_calls"] / requests,
+            **call_counts}
+
+def format_results(results: List[Dict[str, Any]]) -> str:
+    columns = [("sub_questions", "subq", "{:d}"), ("iterations", "iter", "{:d}"), ("concurrency", "conc", "{:d}"),
+               ("requests", "reqs", "{:d}"), ("errors", "errs", "{:d}"), ("throughput", "req/s", "{:.2f}"),
+               ("p50", "p50 s", "{:.2f}"), ("p95", "p95 s", "{:.2f}"), ("p99", "p99 s", "{:.2f}"),
+               ("llm_calls_per_request", "llm/req", "{:.1f}"), ("search_calls_per_request", "search/req", "{:.1f}"),
+               ("llm_errors", "llm errs", "{:d}"), ("search_errors", "search errs", "{:d}")]
+    rows = [[header for _, header, _ in columns]]
+    rows += [[template.format(result[key]) for key, _, template in columns] for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    return "\n".join("  ".join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description= "Benchmark the pipeline against local fake backends")
+    parser.add_argument("--mode", choices= ["fake", "record", "replay"], default= "fake",
+                        help= "call the fake backends, record the calls to the providers, or replay a recording")
+    parser.add_argument("--cassette", default= "cassette.jsonl", help= "recording of the record and replay modes")
+    parser.add_argument("--latency-scale", type= float, default= 1.0, help= "factor of the replayed latencies")
+    parser.add_argument("--query", default= "Benchmark the latest open weight LLMs", help= "query of the requests")
+    parser.add_argument("--sub-questions", type= parse_int_list, default= [2, 4], help= "comma separated sub question counts")
+    parser.add_argument("--iterations", type= parse_int_list, default= [1], help= "comma separated iteration counts")
+    parser.add_argument("--concurrency", type= parse_int_list, default= [1, 4], help= "comma separated concurrent requests")
+    parser.add_argument("--requests", type= int, default= 8, help= "requests per scenario")
+    parser.add_argument("--llm-latency", type= float, default= 0.05, help= "median seconds of the LLM calls")
+    parser.add_argument("--search-latency", type= float, default= 0.2, help= "median seconds of the searches")
+    parser.add_argument("--latency-sigma", type= float, default= 0.5, help= "lognormal shape of the latencies, 0 for fixed")
+    parser.add_argument("--llm-error-rate", type= float, default= 0.0, help= "share of the LLM calls failing")
+    parser.add_argument("--search-error-rate", type= float, default= 0.0, help= "share of the searches failing")
+    parser.add_argument("--malformed-rate", type= float, default= 0.0, help= "share of the structured LLM answers malformed")
+    parser.add_argument("--error-status", type= int, default= 503, help= "status of the failed calls")
+    parser.add_argument("--response-chars", type= int, default= 2000, help= "size of the free text answers")
+    parser.add_argument("--output", help= "JSON file the results are written to")
+    return parser.parse_args()
+
+def make_config(latency: float, sigma: float, error_rate: float, error_status: int, response_chars: int) -> FakeBackendConfig:
+    kind = "lognormal" if sigma > 0 else "fixed"
+    return FakeBackendConfig(latency= LatencyDistribution(kind= kind, median= latency, sigma= sigma),
+                             error_rate= error_rate,
+                             error_status= error_status,
+                             response_chars= response_chars)
+
+def get_cassette_counts() -> Dict[str, int]:
+    from utils.cassette import get_cassette
+    cassette_stats = get_cassette().stats()
+    return {"llm_calls": cassette_stats.get("llm_replayed", 0) + cassette_stats.get("llm_recorded", 0),
+            "llm_errors": 0,
+            "search_calls": cassette_stats.get("search_replayed", 0) + cassette_stats.get("search_recorded", 0),
+            "search_errors": 0,
+            "slide_calls": cassette_stats.get("slides_replayed", 0) + cassette_stats.get("slides_recorded", 0),
+            "unmatched_calls": sum(count for counter, count in cassette_stats.items() if counter.endswith("_unmatched"))}
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level= logging.WARNING, format= "%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    backends = None
+    environment = dict(BENCHMARK_ENVIRONMENT)
+    if args.mode == "fake":
+        llm_config = make_config(args.llm_latency, args.latency_sigma, args.llm_error_rate,
+                                 args.error_status, args.response_chars).model_copy(update= {"malformed_rate": args.malformed_rate})
+        backends = FakeBackends(llm_config= llm_config,
+                                search_config= make_config(args.search_latency, args.latency_sigma, args.search_error_rate,
+                                                           args.error_status, args.response_chars)).start()
+        environment.update({**FAKE_KEYS_ENVIRONMENT, **backends.environment()})
+    else:
+        environment.update({"CASSETTE_MODE": args.mode,
+                            "CASSETTE_PATH": args.cassette,
+                            "CASSETTE_LATENCY_SCALE": str(args.latency_scale)})
+        if args.mode == "replay":
+            environment.update(FAKE_KEYS_ENVIRONMENT)
+    for key, value in environment.items():
+        os.environ.setdefault(key, value)
+    # imported once the environment points to the fakes, the settings are read on first use
+    from routers.messages import search_pipeline
+    from utils.pydantic_models import SearchRequest
+    from utils.cassette import get_cassette
+    from utils.llm_router import get_llm_router
+    from utils.search_utils import get_shared_linkup_client
+    from utils.structured_output import get_structured_output_stats
+    logging.getLogger().setLevel(logging.WARNING)
+
+    results = []
+    print(format_results([]), flush= True)
+    try:
+        for sub_questions, iterations, concurrency in itertools.product(args.sub_questions, args.iterations, args.concurrency):
+            result = run_scenario(search_pipeline= functools.partial(search_pipeline,
+                                                                     cerebras_client= get_llm_router(),
+                                                                     linkup_client= get_shared_linkup_client()),
+                                  search_request= SearchRequest,
+                                  get_call_counts= backends.call_counts if backends else get_cassette_counts,
+                                  reset_call_counts= backends.reset_counts if backends else get_cassette().reset_stats,
+                                  query= args.query,
+                                  sub_questions= sub_questions,
+                                  iterations= iterations,
+                                  concurrency= concurrency,
+                                  requests= args.requests)
+            results.append(result)
+            print(format_results([result]).splitlines()[-1], flush= True)
+    finally:
+        if backends:
+            backends.stop()
+    print(f"structured outputs: {get_structured_output_stats()}")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent= 2)
+
+if __name__ == "__main__":
+    main()
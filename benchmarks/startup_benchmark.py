@@ -0,0 +1,119 @@
+"""
+Cold start cost of a worker: the import time of the application, the heaviest modules it
+imports, and the time until uvicorn answers its first request once the warm-up is done.
+
+Every measure runs in a fresh interpreter so the module caches of a previous run do not
+hide the cost:
+
+    python -m benchmarks.startup_benchmark --runs 5 --max-import-seconds 2.5
+
+With --max-import-seconds the command fails when the median import time exceeds the limit,
+so the startup cost can be tracked in CI.
+"""
+from benchmarks.fake_servers import FakeBackends, FakeBackendConfig
+from benchmarks.load_test import AppProcess, ROOT_DIRECTORY
+from benchmarks.run_benchmark import BENCHMARK_ENVIRONMENT, FAKE_KEYS_ENVIRONMENT
+from typing import Dict, List, Tuple
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+def parse_import_times(output: str) -> Dict[str, int]:
+    """Cumulative microseconds of every module in a `-X importtime` output."""
+    import_times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, module = line.split("|")
+        cumulative = cumulative.strip()
+        if cumulative.isdigit():
+            import_times[module.strip()] = int(cumulative)
+    return import_times
+
+def measure_import(module: str, environment: Dict[str, str]) -> Tuple[float, Dict[str, int]]:
+    """Import a module in a fresh interpreter.
+
+    Returns:
+        Tuple[float, Dict[str, int]]: seconds of the import and cumulative microseconds by module
+    """
+    code = f"import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)"
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code],
+                               cwd= ROOT_DIRECTORY,
+                               env= {**os.environ, **environment},
+                               capture_output= True,
+                               text= True,
+                               check= True)
+    return float(completed.stdout.strip().splitlines()[-1]), parse_import_times(completed.stderr)
+
+def measure_first_response(environment: Dict[str, str]) -> float:
+    """Seconds from the start of uvicorn to the first answer of the app, warm-up included."""
+    app = AppProcess(workers= 1, environment= environment)
+    start = time.perf_counter()
+    try:
+        app.start()
+        return time.perf_counter() - start
+    finally:
+        app.stop()
+
+def top_modules(import_times: List[Dict[str, int]], count: int) -> List[Tuple[str, float]]:
+    """Modules with the highest median cumulative import time, in milliseconds."""
+    modules = set().union(*import_times)
+    medians = {module: statistics.median(times.get(module, 0) for times in import_times) / 1000 for module in modules}
+    return sorted(medians.items(), key=lambda item: item[1], reverse=True)[:count]
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description= "Measure the cold start of the app")
+    parser.add_argument("--module", default= "main", help= "module imported by the workers")
+    parser.add_argument("--runs", type= int, default= 5, help= "fresh interpreters measured")
+    parser.add_argument("--top", type= int, default= 15, help= "heaviest modules reported")
+    parser.add_argument("--skip-serve", action= "store_true", help= "do not measure the time to the first answer")
+    parser.add_argument("--max-import-seconds", type= float, help= "fail when the median import time is higher")
+    parser.add_argument("--output", help= "JSON file the measures are written to")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level= logging.WARNING, format= "%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+    backends = FakeBackends(llm_config= FakeBackendConfig(), search_config= FakeBackendConfig()).start()
+    environment = {key: os.environ.get(key, value) for key, value in BENCHMARK_ENVIRONMENT.items()}
+    environment.update({**FAKE_KEYS_ENVIRONMENT, **backends.environment()})
+    try:
+        import_seconds = []
+        import_times = []
+        for _ in range(args.runs):
+            seconds, module_times = measure_import(args.module, environment)
+            import_seconds.append(seconds)
+            import_times.append(module_times)
+        serve_seconds = [] if args.skip_serve else [measure_first_response(environment) for _ in range(args.runs)]
+    finally:
+        backends.stop()
+
+    results = {"module": args.module,
+               "import_seconds": import_seconds,
+               "median_import_seconds": statistics.median(import_seconds),
+               "first_response_seconds": serve_seconds,
+               "median_first_response_seconds": statistics.median(serve_seconds) if serve_seconds else None,
+               "top_modules_ms": top_modules(import_times, args.top)}
+    print(f"import {args.module}: median {results['median_import_seconds']:.3f}s "
+          f"(min {min(import_seconds):.3f}s, max {max(import_seconds):.3f}s over {args.runs} runs)")
+    if serve_seconds:
+        print(f"first answer of uvicorn: median {results['median_first_response_seconds']:.3f}s")
+    print("heaviest imports (cumulative ms):")
+    for module, milliseconds in results["top_modules_ms"]:
+        print(f"  {milliseconds:9.1f}  {module}")
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(results, output_file, indent= 2)
+    if args.max_import_seconds is not None and results["median_import_seconds"] > args.max_import_seconds:
+        print(f"median import time above {args.max_import_seconds}s", file= sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,13 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
-from routers import messages
-from starlette.middleware.base import BaseHTTPMiddleware
+from routers import messages, jobs
 from utils.logging_config import setup_logging
+from utils.http_utils import close_http_clients
+from utils.metrics import register_pipeline_collector, RequestMetricsMiddleware
+from utils.tracing import get_trace_exporter
+from utils.warmup import warm_up
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+import asyncio
 import logging
 
 setup_logging()
@@ -26,14 +31,34 @@ app.add_middleware(
     expose_headers=["*"],
 )
 
+register_pipeline_collector()
+
+app.add_middleware(RequestMetricsMiddleware)
+
 logger.info("Starting the API...")
 # Include routers
 app.include_router(messages.router, prefix="/messages", tags=["Messages"])
+app.include_router(jobs.router, prefix="/jobs", tags=["Jobs"])
 
 @app.on_event("startup")
-def startup_event():
+async def startup_event():
+    await warm_up()
+    # the job store opens its SQLite file, kept off the event loop
+    job_manager = await asyncio.to_thread(jobs.get_job_manager)
+    await job_manager.start()
     logger.info("API started.")
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await jobs.get_job_manager().stop()
+    await close_http_clients()
+    get_trace_exporter().flush()
+    logger.info("API stopped.")
+
+@app.get("/metrics", tags=["Monitoring"])
+def metrics():
+    return Response(content= generate_latest(), media_type= CONTENT_TYPE_LATEST)
+
 # Health check endpoint
 @app.get("/", tags=["Health Check"])
 def health_check():
@@ -0,0 +1,72 @@
+from fastapi import APIRouter, Depends, HTTPException
+from steps.pipeline import run_search_pipeline_async
+from utils.llm_router import get_async_llm_router
+from utils.search_utils import get_shared_linkup_client
+from utils.job_store import JobStore
+from utils.job_manager import JobManager
+from utils.pydantic_models import SearchRequest, JobRecord, JobArtifact
+from utils.config import get_settings
+from functools import lru_cache
+from typing import Any, Callable, List
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+JOB_MANAGER_LOCK = threading.Lock()
+
+async def run_job_pipeline(request: SearchRequest, model_name: str, on_event: Callable[[str, Any], None]):
+    return await run_search_pipeline_async(request= request,
+                                           model_name= model_name,
+                                           cerebras_client= get_async_llm_router(),
+                                           linkup_client= get_shared_linkup_client(),
+                                           on_event= on_event)
+
+def get_job_manager() -> JobManager:
+    """Get the process wide job manager, its store is opened on first use and not on import.
+
+    Returns:
+        JobManager: manager of the jobs persisted in JOB_STORE_PATH.
+    """
+    with JOB_MANAGER_LOCK:
+        return build_job_manager()
+
+@lru_cache
+def build_job_manager() -> JobManager:
+    settings = get_settings()
+    return JobManager(store= JobStore(settings.job_store_path),
+                      runner= run_job_pipeline,
+                      max_concurrency= settings.job_max_concurrency)
+
+def get_job_or_404(job_manager: JobManager, job_id: str) -> JobRecord:
+    job = job_manager.store.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found")
+    return job
+
+@router.post("/", status_code=202)
+async def submit_job(request: SearchRequest,
+                     model_name: str = "llama-4-scout-17b-16e-instruct",
+                     job_manager: JobManager = Depends(get_job_manager)) -> JobRecord:
+    return await job_manager.submit(request, model_name)
+
+@router.get("/{job_id}")
+def get_job(job_id: str, job_manager: JobManager = Depends(get_job_manager)) -> JobRecord:
+    return get_job_or_404(job_manager, job_id)
+
+@router.get("/{job_id}/artifacts")
+def get_job_artifacts(job_id: str, after: int = 0, job_manager: JobManager = Depends(get_job_manager)) -> List[JobArtifact]:
+    get_job_or_404(job_manager, job_id)
+    return job_manager.store.list_artifacts(job_id, after_sequence= after)
+
+@router.get("/{job_id}/result")
+def get_job_result(job_id: str, job_manager: JobManager = Depends(get_job_manager)):
+    job = get_job_or_404(job_manager, job_id)
+    if job.status == "failed":
+        # the pipeline of the job failed, not the request
+        raise HTTPException(status_code=424, detail=f"Job {job_id} failed: {job.error}")
+    if job.status != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job.status}")
+    return job.result
@@ -1,75 +1,78 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends
+from fastapi.responses import StreamingResponse
 from dotenv import load_dotenv
 from steps.query_decomposition import query_decomposition_step
-from steps.extract_metadata import metadata_extraction_step
 from steps.sub_question_search import parallelize_question_search
-from steps.process_queries import process_queries_step, map_queries_to_enhanced_queries, map_query_to_enhanced_query
+from steps.preprocess_queries import questions_preprocessing
 from steps.insight_analysis import insight_analysis, format_insights
+from steps.question_chains import run_question_chains
 from steps.report_generation import report_generation
 from steps.extract_next_questions import next_query_creation
-from steps.explore_next_question import simplified_pipeline
+from steps.explore_next_question import simplified_pipeline, parallel_exploration_pipeline
 from steps.slide_generation import slide_outline_generation, slides_content_generation
 from steps.create_slides import create_presentation
-from utils.llm_utils import get_cerebras_client, get_sambanova_client
-from utils.search_utils import get_linkup_client
+from steps.pipeline import run_search_pipeline_async
+from utils.llm_utils import get_llm_cache
+from utils.llm_router import LLMRouter, AsyncLLMRouter, get_llm_router, get_async_llm_router
+from utils.search_utils import get_shared_linkup_client, get_search_cache
 from utils.pydantic_models import SearchRequest, PresentenOutput
-from utils.utils import (parallel_run_metadata, 
-                         format_all_questions_output, 
-                         parallel_process_queries, 
-                         parallel_analyze_output,
+from utils.config import get_settings
+from utils.stream_utils import format_sse_event, format_sse_comment
+from utils.utils import (parallel_map,
                          format_search_outputs)
+from utils.executor import get_executor
+from utils.rate_limit import get_rate_limit_stats
+from utils.structured_output import get_structured_output_stats
+from utils.tracing import traced, set_span_attributes
+from linkup import LinkupClient
+import asyncio
 import logging
-import os
 
 logger = logging.getLogger(__name__)
 
 load_dotenv()
 router = APIRouter()
 
-cerebras_client = get_cerebras_client(os.environ.get("CEREBRAS_API_KEY"))
-
-linkup_client = get_linkup_client(os.environ.get("LINKUP_API_KEY"))
-
-sambanova_client = get_sambanova_client(os.environ.get("SAMBANOVA_API_KEY"))
-
 @router.post("/")
+@traced("search_pipeline", kind="server")
 def search_pipeline(request: SearchRequest,
-                    model_name: str = "llama-4-scout-17b-16e-instruct"):
+                    model_name: str = "llama-4-scout-17b-16e-instruct",
+                    cerebras_client: LLMRouter = Depends(get_llm_router),
+                    linkup_client: LinkupClient = Depends(get_shared_linkup_client)):
+    settings = get_settings()
     query = request.query
     max_sub_questions = request.max_sub_questions
     num_iterations = request.max_iterations
+    set_span_attributes(query= query,
+                        max_sub_questions= max_sub_questions,
+                        max_iterations= num_iterations,
+                        pipeline_mode= settings.pipeline_mode)
     sub_queries = query_decomposition_step(main_query= query,
                                            model_name= model_name,
                                            num_sub_questions= max_sub_questions,
                                            client= cerebras_client)
     questions = [query] + sub_queries.sub_questions
-    logger.info(f"Starting the metadata extraction for {len(questions)} questions")
-    results = parallel_run_metadata(function= metadata_extraction_step, 
-                                    num_max_workers= max_sub_questions, 
-                                    params= questions, 
-                                    client= cerebras_client, 
-                                    model_name= model_name)
-    logger.info("Formatting the results for the main query and the sub queries")
-    formatted_result = format_all_questions_output(results)
-    logger.info("Starting the queries processing for the main query and the sub queries")
-    enhanced_search_queries = parallel_process_queries(function= process_queries_step, 
-                                    num_max_workers= max_sub_questions, 
-                                    params= questions, 
-                                    client= cerebras_client, 
-                                    model_name= model_name)
-    search_queries_with_metadata = map_queries_to_enhanced_queries(formatted_result, enhanced_search_queries)
-    logger.info("Starting the question search for the main query and the sub queries")
-    all_search_results = parallelize_question_search(all_questions=search_queries_with_metadata,
-                                client= linkup_client)
-    logger.info("Analyzing all of the outputs of the search")
-    search_analysis_params = format_search_outputs(all_search_results)
-    analysis = parallel_analyze_output(function= insight_analysis, 
-                            num_max_workers= max_sub_questions,
-                            client= cerebras_client,
-                            model_name="qwen-3-235b-a22b-thinking-2507",
-                            main_question= query,
-                            params= search_analysis_params)
-    all_queries_with_analysis = format_insights(analysis)
+    if settings.pipeline_mode == "chained":
+        all_queries_with_analysis = run_question_chains(questions= questions,
+                                                        model_name= model_name,
+                                                        cerebras_client= cerebras_client,
+                                                        linkup_client= linkup_client)
+    else:
+        search_queries_with_metadata = questions_preprocessing(questions= questions,
+                                                               client= cerebras_client,
+                                                               model_name= model_name,
+                                                               num_max_workers= max_sub_questions,
+                                                               preprocessing_mode= settings.preprocessing_mode)
+        logger.info("Starting the question search for the main query and the sub queries")
+        all_search_results = parallelize_question_search(all_questions=search_queries_with_metadata,
+                                    client= linkup_client)
+        logger.info("Analyzing all of the outputs of the search")
+        search_analysis_params = format_search_outputs(all_search_results)
+        analysis = parallel_map(function= insight_analysis, 
+                                params= [(query, sub_question, search_result, cerebras_client, "qwen-3-235b-a22b-thinking-2507")
+                                         for sub_question, search_result in search_analysis_params],
+                                max_concurrency= max_sub_questions)
+        all_queries_with_analysis = format_insights(analysis)
     logger.info("Generating Report")
     report = report_generation(queries_with_analysis= all_queries_with_analysis,
                       client= cerebras_client,
@@ -82,6 +85,14 @@ def search_pipeline(request: SearchRequest,
                                 model_name=model_name,
                                 client= cerebras_client)
             next_questions = next_queries.next_questions
+            if settings.exploration_mode == "parallel":
+                report = parallel_exploration_pipeline(queries= next_questions,
+                                                       original_question= query,
+                                                       model_name= model_name,
+                                                       cerebras_client= cerebras_client,
+                                                       linkup_client= linkup_client,
+                                                       report= report)
+                continue
             for qst in next_questions:
                 logger.info(f"Handling next question {qst}")
                 report = simplified_pipeline(query= qst,
@@ -101,4 +112,68 @@ def search_pipeline(request: SearchRequest,
                                          model_name= "qwen-3-235b-a22b-instruct-2507")
     
     presentation = create_presentation(contents)
-    return presentation
\ No newline at end of file
+    logger.info(f"LLM cache stats: {get_llm_cache().stats.as_dict()}")
+    logger.info(f"Search cache stats: {get_search_cache().stats.as_dict()}")
+    logger.info(f"Executor stats: {get_executor().stats()}")
+    logger.info(f"LLM router stats: {get_llm_router().stats()}")
+    logger.info(f"Rate limiter stats: {get_rate_limit_stats()}")
+    logger.info(f"Structured output stats: {get_structured_output_stats()}")
+    return presentation
+
+@router.post("/async")
+async def async_search_pipeline(request: SearchRequest,
+                                model_name: str = "llama-4-scout-17b-16e-instruct",
+                                async_cerebras_client: AsyncLLMRouter = Depends(get_async_llm_router),
+                                linkup_client: LinkupClient = Depends(get_shared_linkup_client)):
+    presentation = await run_search_pipeline_async(request= request,
+                                                   model_name= model_name,
+                                                   cerebras_client= async_cerebras_client,
+                                                   linkup_client= linkup_client)
+    return presentation
+
+@router.post("/stream")
+async def stream_search_pipeline(request: SearchRequest,
+                                 model_name: str = "llama-4-scout-17b-16e-instruct",
+                                 async_cerebras_client: AsyncLLMRouter = Depends(get_async_llm_router),
+                                 linkup_client: LinkupClient = Depends(get_shared_linkup_client)):
+    settings = get_settings()
+    events = asyncio.Queue()
+
+    def on_event(event: str, data):
+        events.put_nowait((event, data))
+
+    async def run_pipeline():
+        try:
+            await run_search_pipeline_async(request= request,
+                                            model_name= model_name,
+                                            cerebras_client= async_cerebras_client,
+                                            linkup_client= linkup_client,
+                                            on_event= on_event)
+            on_event("done", {})
+        except Exception as e:
+            logger.exception(f"Streaming pipeline failed for {request.query}")
+            on_event("error", {"detail": str(e)})
+        finally:
+            on_event(None, None)
+
+    async def event_stream():
+        pipeline_task = asyncio.create_task(run_pipeline())
+        try:
+            yield format_sse_event("started", {"query": request.query})
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(events.get(), timeout= settings.stream_heartbeat_interval)
+                except asyncio.TimeoutError:
+                    yield format_sse_comment("keep-alive")
+                    continue
+                if event is None:
+                    break
+                yield format_sse_event(event, data)
+        finally:
+            if not pipeline_task.done():
+                logger.info(f"Client disconnected, cancelling the pipeline for {request.query}")
+                pipeline_task.cancel()
+
+    return StreamingResponse(event_stream(),
+                             media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -1,5 +1,6 @@
-from utils.slide_utils import generate_slides, format_presenten_outputs
+from utils.slide_utils import generate_slides, generate_slides_async, format_presenten_outputs
 from utils.pydantic_models import PresentationContents, PresentenOutput
+from utils.metrics import track_step
 from typing import Dict
 
 def format_slide_contents_for_prompt(content: PresentationContents) -> str:
@@ -15,6 +16,7 @@ def formulate_slide_generation_prompt(str_slide_contents: str,
     prompt = f"generate me a benchmark presentation with tables that contains the following information: \n {str_slide_contents} by {company_name}"
     return prompt
 
+@track_step("presentation")
 def create_presentation(contents: PresentationContents) -> Dict[str, str]:
     str_slide_contents = format_slide_contents_for_prompt(content = contents)
 
@@ -27,3 +29,15 @@ def create_presentation(contents: PresentationContents) -> Dict[str, str]:
     # presentation_obj = format_presenten_outputs(output)
 
     return output
+
+@track_step("presentation")
+async def create_presentation_async(contents: PresentationContents) -> Dict[str, str]:
+    str_slide_contents = format_slide_contents_for_prompt(content = contents)
+
+    prompt = formulate_slide_generation_prompt(str_slide_contents)
+
+    num_slides = contents.num_of_slides
+
+    output = await generate_slides_async(prompt, num_slides, "english", "general", "pptx")
+
+    return output
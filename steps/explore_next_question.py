@@ -1,25 +1,42 @@
-from steps.extract_metadata import metadata_extraction_step
-from steps.process_queries import process_queries_step, map_query_to_enhanced_query
-from steps.update_report import report_update
-from utils.search_utils import search_linkup, format_single_output
-from utils.pydantic_models import QueryReport
-from steps.insight_analysis import insight_analysis
-from cerebras.cloud.sdk import Cerebras
+from steps.extract_metadata import metadata_extraction_step, metadata_extraction_step_async
+from steps.process_queries import process_queries_step, process_queries_step_async, map_query_to_enhanced_query
+from steps.update_report import (report_update, 
+                                 report_update_async, 
+                                 report_merged_update, 
+                                 report_merged_update_async, 
+                                 report_patch_update, 
+                                 report_patch_update_async)
+from utils.search_utils import search_linkup, search_linkup_async, format_single_output
+from utils.pydantic_models import QueryReport, QueryExploration
+from steps.insight_analysis import insight_analysis, insight_analysis_async
+from steps.preprocess_queries import fused_preprocessing_step, fused_preprocessing_step_async
+from utils.utils import parallel_map
+from utils.config import get_settings
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
 from linkup import LinkupClient
+from typing import List
+import asyncio
+import logging
 
-def simplified_pipeline(query: str, 
-                        original_question: str, 
-                        model_name: str, 
-                        cerebras_client: Cerebras, 
-                        linkup_client: LinkupClient, 
-                        report: QueryReport) -> QueryReport:
-    results = metadata_extraction_step(query= query,
-                                       client= cerebras_client,
-                                       model_name= model_name)
-    # formatted_result = format_all_questions_output([results])
-    enhanced_search_query = process_queries_step(query= query,
-                         client= cerebras_client,
-                         model_name= model_name)
+logger = logging.getLogger(__name__)
+
+def explore_question(query: str, 
+                     original_question: str, 
+                     model_name: str, 
+                     cerebras_client: Cerebras, 
+                     linkup_client: LinkupClient) -> QueryExploration:
+    if get_settings().preprocessing_mode == "separate":
+        results = metadata_extraction_step(query= query,
+                                           client= cerebras_client,
+                                           model_name= model_name)
+        # formatted_result = format_all_questions_output([results])
+        enhanced_search_query = process_queries_step(query= query,
+                             client= cerebras_client,
+                             model_name= model_name)
+    else:
+        results, enhanced_search_query = fused_preprocessing_step(query= query,
+                                                                  client= cerebras_client,
+                                                                  model_name= model_name)
     search_query_with_metadata = map_query_to_enhanced_query(results, enhanced_search_query)
     search_result = search_linkup(client= linkup_client,
                   query= search_query_with_metadata.enhanced_query,
@@ -34,11 +51,130 @@ def simplified_pipeline(query: str,
                                 search_result= search_analysis_param.answer,
                                 client= cerebras_client,
                                 model_name="qwen-3-235b-a22b-thinking-2507")
+    return QueryExploration(query= query, search_results= search_analysis_param, analysis= analysis)
+
+def simplified_pipeline(query: str, 
+                        original_question: str, 
+                        model_name: str, 
+                        cerebras_client: Cerebras, 
+                        linkup_client: LinkupClient, 
+                        report: QueryReport) -> QueryReport:
+    exploration = explore_question(query= query,
+                                   original_question= original_question,
+                                   model_name= model_name,
+                                   cerebras_client= cerebras_client,
+                                   linkup_client= linkup_client)
+    if get_settings().report_update_mode == "patch":
+        return report_patch_update(report_obj= report,
+                                   explorations= [exploration],
+                                   client= cerebras_client,
+                                   model_name="qwen-3-235b-a22b-instruct-2507")
     updated_report = report_update(report_obj= report,
-                                   analysis_obj= analysis,
+                                   analysis_obj= exploration.analysis,
                                    next_query= query,
-                                   search_results_obj= search_analysis_param,
+                                   search_results_obj= exploration.search_results,
+                                   client= cerebras_client,
+                                   model_name="qwen-3-235b-a22b-instruct-2507")
+    return updated_report
+
+def parallel_exploration_pipeline(queries: List[str], 
+                                  original_question: str, 
+                                  model_name: str, 
+                                  cerebras_client: Cerebras, 
+                                  linkup_client: LinkupClient, 
+                                  report: QueryReport) -> QueryReport:
+    logger.info(f"Exploring {len(queries)} next questions in parallel")
+    explorations = parallel_map(function= explore_question,
+                                params= [(query, original_question, model_name, cerebras_client, linkup_client)
+                                         for query in queries])
+    if get_settings().report_update_mode == "patch":
+        return report_patch_update(report_obj= report,
+                                   explorations= explorations,
                                    client= cerebras_client,
                                    model_name="qwen-3-235b-a22b-instruct-2507")
+    updated_report = report_merged_update(report_obj= report,
+                                          explorations= explorations,
+                                          client= cerebras_client,
+                                          model_name="qwen-3-235b-a22b-instruct-2507")
+    return updated_report
+
+async def explore_question_async(query: str, 
+                                 original_question: str, 
+                                 model_name: str, 
+                                 cerebras_client: AsyncCerebras, 
+                                 linkup_client: LinkupClient) -> QueryExploration:
+    if get_settings().preprocessing_mode == "separate":
+        results, enhanced_search_query = await asyncio.gather(
+            metadata_extraction_step_async(query= query,
+                                           client= cerebras_client,
+                                           model_name= model_name),
+            process_queries_step_async(query= query,
+                                       client= cerebras_client,
+                                       model_name= model_name))
+    else:
+        results, enhanced_search_query = await fused_preprocessing_step_async(query= query,
+                                                                              client= cerebras_client,
+                                                                              model_name= model_name)
+    search_query_with_metadata = map_query_to_enhanced_query(results, enhanced_search_query)
+    search_result = await search_linkup_async(client= linkup_client,
+                                              query= search_query_with_metadata.enhanced_query,
+                                              search_mode= 'deep',
+                                              from_date= search_query_with_metadata.from_date,
+                                              to_date= search_query_with_metadata.to_date
+                                              )
+    search_analysis_param = format_single_output(query= query,
+                         search_result= search_result)
+    analysis = await insight_analysis_async(main_question=original_question,
+                                            sub_question= query,
+                                            search_result= search_analysis_param.answer,
+                                            client= cerebras_client,
+                                            model_name="qwen-3-235b-a22b-thinking-2507")
+    return QueryExploration(query= query, search_results= search_analysis_param, analysis= analysis)
+
+async def simplified_pipeline_async(query: str, 
+                                    original_question: str, 
+                                    model_name: str, 
+                                    cerebras_client: AsyncCerebras, 
+                                    linkup_client: LinkupClient, 
+                                    report: QueryReport) -> QueryReport:
+    exploration = await explore_question_async(query= query,
+                                               original_question= original_question,
+                                               model_name= model_name,
+                                               cerebras_client= cerebras_client,
+                                               linkup_client= linkup_client)
+    if get_settings().report_update_mode == "patch":
+        return await report_patch_update_async(report_obj= report,
+                                               explorations= [exploration],
+                                               client= cerebras_client,
+                                               model_name="qwen-3-235b-a22b-instruct-2507")
+    updated_report = await report_update_async(report_obj= report,
+                                               analysis_obj= exploration.analysis,
+                                               next_query= query,
+                                               search_results_obj= exploration.search_results,
+                                               client= cerebras_client,
+                                               model_name="qwen-3-235b-a22b-instruct-2507")
+    return updated_report
+
+async def parallel_exploration_pipeline_async(queries: List[str], 
+                                              original_question: str, 
+                                              model_name: str, 
+                                              cerebras_client: AsyncCerebras, 
+                                              linkup_client: LinkupClient, 
+                                              report: QueryReport) -> QueryReport:
+    logger.info(f"Exploring {len(queries)} next questions in parallel")
+    explorations = await asyncio.gather(*[explore_question_async(query= query,
+                                                                 original_question= original_question,
+                                                                 model_name= model_name,
+                                                                 cerebras_client= cerebras_client,
+                                                                 linkup_client= linkup_client)
+                                          for query in queries])
+    if get_settings().report_update_mode == "patch":
+        return await report_patch_update_async(report_obj= report,
+                                               explorations= explorations,
+                                               client= cerebras_client,
+                                               model_name="qwen-3-235b-a22b-instruct-2507")
+    updated_report = await report_merged_update_async(report_obj= report,
+                                                      explorations= explorations,
+                                                      client= cerebras_client,
+                                                      model_name="qwen-3-235b-a22b-instruct-2507")
     return updated_report
-    
\ No newline at end of file
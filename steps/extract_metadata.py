@@ -1,12 +1,15 @@
 from datetime import date, datetime
-from cerebras.cloud.sdk import Cerebras
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
 from utils.prompts import METADATA_EXTRACTION_PROMPT
 from utils.pydantic_models import QuerySearchMetadata
 from utils.schemas import SearchDates
 import logging
-from utils.llm_utils import format_output_schema, call_cerebras_model
-from typing import Tuple
-import json
+from utils.structured_output import call_structured_model, call_structured_model_async
+from utils.date_parser import parse_search_dates
+from utils.config import get_settings
+from utils.metrics import track_step, DATE_EXTRACTIONS
+from utils.tracing import set_span_attributes
+from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
@@ -26,33 +29,74 @@ def format_metadata_types(to_date: str, from_date: str) -> Tuple[date, date]:
     return to_date, from_date
     
 
-def extract_output_dict(response, query) -> QuerySearchMetadata:
-    response_dict = json.loads(response.choices[0].message.content)
-    to_date = response_dict['to_date']
-    from_date = response_dict['from_date']
-    to_date, from_date = format_metadata_types(to_date, from_date)
-    metadata_object = QuerySearchMetadata(query=query,
-                                          from_date= from_date,
-                                          to_date= to_date)
-    return metadata_object
+def format_query_metadata(query: str, from_date: Optional[date], to_date: Optional[date]) -> QuerySearchMetadata:
+    kwargs = {
+        "query": query,
+        "from_date": from_date,
+        "to_date": to_date
+    }
+    kwargs = {k: v for k, v in kwargs.items() if v is not None}
+    return QuerySearchMetadata(**kwargs)
+
+def format_search_dates(search_dates: SearchDates, query) -> QuerySearchMetadata:
+    to_date, from_date = format_metadata_types(search_dates.to_date, search_dates.from_date)
+    return format_query_metadata(query, from_date, to_date)
+
+def extract_rule_based_dates(query: str, current_date: date) -> Optional[QuerySearchMetadata]:
+    """Extract the search dates without the LLM, None when the query is ambiguous."""
+    if not get_settings().rule_based_dates_enabled:
+        return None
+    search_dates = parse_search_dates(query, current_date)
+    if search_dates is None:
+        logger.debug(f"Ambiguous temporal expression in {query}, extracting the dates with the LLM")
+        DATE_EXTRACTIONS.labels("llm").inc()
+        return None
+    set_span_attributes(date_extraction= "rules")
+    DATE_EXTRACTIONS.labels("rules").inc()
+    return format_query_metadata(query, *search_dates)
 
+@track_step("metadata")
 def metadata_extraction_step(query: str, 
                              client: Cerebras,
                              model_name: str,
-                             current_date: date = date.today())-> QuerySearchMetadata:
-    
+                             current_date: date = None)-> QuerySearchMetadata:
+    current_date = current_date or date.today()
+    query_metadata_obj = extract_rule_based_dates(query, current_date)
+    if query_metadata_obj is not None:
+        return query_metadata_obj
+
     logger.info(f"Decomposing research query: {query}")
     prompt_subfix = f"\nFor more details here is the current date {current_date}."
     system_prompt = METADATA_EXTRACTION_PROMPT + prompt_subfix
 
-    pydantic_schema = SearchDates.model_json_schema()
+    try:
+        search_dates = call_structured_model(client, system_prompt, model_name, query, SearchDates, step_name= "metadata_extraction")
+        query_metadata_obj = format_search_dates(search_dates, query)
+    except Exception as e:
+        logger.warning(f"Metadata extraction failed for {query}, searching without dates: {e!r}")
+        query_metadata_obj = fallback_date_outputs(query)
+
+    return query_metadata_obj
+
+@track_step("metadata")
+async def metadata_extraction_step_async(query: str, 
+                                         client: AsyncCerebras,
+                                         model_name: str,
+                                         current_date: date = None)-> QuerySearchMetadata:
+    current_date = current_date or date.today()
+    query_metadata_obj = extract_rule_based_dates(query, current_date)
+    if query_metadata_obj is not None:
+        return query_metadata_obj
 
-    output_schema = format_output_schema(pydantic_schema)
+    logger.info(f"Decomposing research query: {query}")
+    prompt_subfix = f"\nFor more details here is the current date {current_date}."
+    system_prompt = METADATA_EXTRACTION_PROMPT + prompt_subfix
 
     try:
-        output = call_cerebras_model(client, system_prompt, model_name, query, output_schema)
-        query_metadata_obj = extract_output_dict(output, query)
-    except:
+        search_dates = await call_structured_model_async(client, system_prompt, model_name, query, SearchDates, step_name= "metadata_extraction")
+        query_metadata_obj = format_search_dates(search_dates, query)
+    except Exception as e:
+        logger.warning(f"Metadata extraction failed for {query}, searching without dates: {e!r}")
         query_metadata_obj = fallback_date_outputs(query)
 
     return query_metadata_obj
\ No newline at end of file
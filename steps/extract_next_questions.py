@@ -1,23 +1,17 @@
 from utils.pydantic_models import QueryReport, ReportNextSteps
 from utils.prompts import NEXT_QUESTIONS_PROMPT
 from utils.schemas import NextQuestionList, NextQuestion
-from utils.llm_utils import format_output_schema, call_cerebras_model
+from utils.structured_output import call_structured_model, call_structured_model_async
 import logging
-from cerebras.cloud.sdk import Cerebras
-from typing import List, Dict
-import json
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
+from typing import List
 
 logger = logging.getLogger(__name__)
 
-def extract_output_dict(response) -> List[Dict[str, str]]:
-    response_dict = json.loads(response.choices[0].message.content)
-    question_list = response_dict["questions"]
-    return question_list
-
-def format_query_decompositon_output(question_list, query, report) -> ReportNextSteps:
+def format_query_decompositon_output(question_list: List[NextQuestion], query, report) -> ReportNextSteps:
     all_questions = []
     for question_obj in question_list:
-        question = question_obj["question"]
+        question = question_obj.question
         all_questions.append(question)
     query_with_sub_queries = ReportNextSteps(main_query= query,
                                                next_questions= all_questions,
@@ -38,13 +32,31 @@ def next_query_creation(report_obj: QueryReport,
 
     logger.info(f"Calling {model_name} to generate {num_next_questions} questions to be explored")
 
-    pydantic_schema = NextQuestionList.model_json_schema()
+    next_question_list = call_structured_model(client, system_prompt, model_name, report, NextQuestionList, step_name= "next_questions")
+
+    question_list = next_question_list.questions
+
+    next_queries_obj = format_query_decompositon_output(question_list, original_question, report)
+    
+    return next_queries_obj
+
+async def next_query_creation_async(report_obj: QueryReport,
+                                    num_next_questions: int,
+                                    model_name: str,
+                                    client: AsyncCerebras) -> ReportNextSteps:
+    report = report_obj.report
+
+    original_question = report_obj.main_query
+
+    prompt_subfix = f"\nPlease generate {num_next_questions} questions to be explored."
 
-    output_schema = format_output_schema(pydantic_schema)
+    system_prompt = NEXT_QUESTIONS_PROMPT + prompt_subfix
+
+    logger.info(f"Calling {model_name} to generate {num_next_questions} questions to be explored")
 
-    output = call_cerebras_model(client, system_prompt, model_name, report, output_schema)
+    next_question_list = await call_structured_model_async(client, system_prompt, model_name, report, NextQuestionList, step_name= "next_questions")
 
-    question_list = extract_output_dict(output)
+    question_list = next_question_list.questions
 
     next_queries_obj = format_query_decompositon_output(question_list, original_question, report)
     
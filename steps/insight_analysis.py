@@ -1,27 +1,34 @@
 # from sambanova import SambaNova
-from cerebras.cloud.sdk import Cerebras
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
 from utils.prompts import INSIGHT_ANALYSIS_PROMPT
-from utils.llm_utils import call_cerebras_model, process_reasoning_output
+from utils.llm_utils import call_cerebras_model, call_cerebras_model_async, process_reasoning_output
 from utils.pydantic_models import QueryAnalysis, QueriesInsightAnalysis
 import logging
-from typing import List
+from utils.token_budget import PromptBudget, compact_prompt
+from utils.metrics import track_step
+from typing import List, Optional
 
 logger = logging.getLogger(__name__)
 
 def formulate_insight_analysis_prompt(main_question: str,
                                       sub_question: str,
-                                      search_result: str):
+                                      search_result: str,
+                                      budget: Optional[PromptBudget] = None):
+    if budget is not None:
+        fixed_prompt = formulate_insight_analysis_prompt(main_question, sub_question, "")
+        search_result, = budget.fit(fixed_prompt, [search_result], [1.0])
     prompt = f"""The general question and topic of discussion is the following {main_question}.
     The sub question extracted from that main question is {sub_question}.
     Here is the internet search result for the information wanted {search_result}"""
 
-    return prompt
+    return compact_prompt(prompt)
 
 def format_insights(parallelized_insight_out: List[QueryAnalysis])->QueriesInsightAnalysis:
     main_question_insights = parallelized_insight_out[0]
     sub_question_insights = parallelized_insight_out[1:]
     return QueriesInsightAnalysis(main_query= main_question_insights, sub_queries= sub_question_insights)
 
+@track_step("insight")
 def insight_analysis(main_question: str, 
                      sub_question: str,
                      search_result: str,
@@ -31,14 +38,43 @@ def insight_analysis(main_question: str,
     
     logger.info(f"Analyzing sub question: {sub_question} outputs")
     system_prompt = INSIGHT_ANALYSIS_PROMPT
-    prompt = formulate_insight_analysis_prompt(main_question, sub_question, search_result)
+    budget = PromptBudget(model_name= model_name, step_name= "insight_analysis", system_prompt= system_prompt)
+    prompt = formulate_insight_analysis_prompt(main_question, sub_question, search_result, budget)
+    budget.log_usage(prompt)
     output = call_cerebras_model(client = client,
                                   model_name= model_name,
                                   system_prompt= system_prompt,
-                                  prompt= prompt
+                                  prompt= prompt,
+                                  step_name= "insight_analysis"
                                   )
     output_content = output.choices[0].message.content
     processed_output = process_reasoning_output(output_content)
+    query_analysis_obj = QueryAnalysis(query= sub_question,
+                                       search_result= search_result,
+                                       analysis= processed_output)
+    return query_analysis_obj
+
+@track_step("insight")
+async def insight_analysis_async(main_question: str, 
+                                 sub_question: str,
+                                 search_result: str,
+                                 client: AsyncCerebras,
+                                 model_name: str
+                                 ) -> QueryAnalysis:
+    
+    logger.info(f"Analyzing sub question: {sub_question} outputs")
+    system_prompt = INSIGHT_ANALYSIS_PROMPT
+    budget = PromptBudget(model_name= model_name, step_name= "insight_analysis", system_prompt= system_prompt)
+    prompt = formulate_insight_analysis_prompt(main_question, sub_question, search_result, budget)
+    budget.log_usage(prompt)
+    output = await call_cerebras_model_async(client = client,
+                                             model_name= model_name,
+                                             system_prompt= system_prompt,
+                                             prompt= prompt,
+                                             step_name= "insight_analysis"
+                                             )
+    output_content = output.choices[0].message.content
+    processed_output = process_reasoning_output(output_content)
     query_analysis_obj = QueryAnalysis(query= sub_question,
                                        search_result= search_result,
                                        analysis= processed_output)
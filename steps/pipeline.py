@@ -0,0 +1,171 @@
+"""
+Asynchronous orchestration of all the steps of the benchmarking pipeline
+"""
+from steps.query_decomposition import query_decomposition_step_async
+from steps.preprocess_queries import questions_preprocessing_async
+from steps.sub_question_search import parallelize_question_search_async
+from steps.insight_analysis import insight_analysis_async, format_insights
+from steps.question_chains import run_question_chains_async
+from steps.report_generation import report_generation_stream_async
+from steps.extract_next_questions import next_query_creation_async
+from steps.explore_next_question import simplified_pipeline_async, parallel_exploration_pipeline_async
+from steps.slide_generation import slide_outline_generation_async, slides_content_generation_async
+from steps.create_slides import create_presentation_async
+from utils.pydantic_models import SearchRequest, QueriesInsightAnalysis
+from utils.llm_utils import get_llm_cache
+from utils.search_utils import get_search_cache
+from utils.config import get_settings
+from utils.utils import format_search_outputs
+from utils.tracing import traced, set_span_attributes
+from cerebras.cloud.sdk import AsyncCerebras
+from linkup import LinkupClient
+from typing import Any, Callable, Dict, List
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+PipelineEventHandler = Callable[[str, Any], None]
+
+def ignore_event(event: str, data: Any):
+    pass
+
+async def run_question_stages_async(questions: List[str],
+                                    model_name: str,
+                                    cerebras_client: AsyncCerebras,
+                                    linkup_client: LinkupClient,
+                                    on_event: PipelineEventHandler = ignore_event) -> QueriesInsightAnalysis:
+    """Preprocess, search and analyze the questions stage by stage, every stage waiting for all the questions.
+
+    Args:
+        questions (List[str]): main question followed by the sub questions.
+        model_name (str): model used for the preprocessing steps.
+        cerebras_client (AsyncCerebras): asynchronous cerebras client for LLM calls.
+        linkup_client (LinkupClient): linkup client for searches.
+        on_event (PipelineEventHandler, optional): called with the intermediate artifacts.
+
+    Returns:
+        QueriesInsightAnalysis: analysis of every question.
+    """
+    search_queries_with_metadata = await questions_preprocessing_async(questions= questions,
+                                                                       client= cerebras_client,
+                                                                       model_name= model_name,
+                                                                       preprocessing_mode= get_settings().preprocessing_mode)
+    on_event("preprocessing", search_queries_with_metadata)
+    logger.info("Starting the question search for the main query and the sub queries")
+    all_search_results = await parallelize_question_search_async(
+        all_questions=search_queries_with_metadata,
+        client= linkup_client,
+        on_search_done= lambda search_query, search_result: on_event("search", {"query": search_query,
+                                                                                "answer": search_result.answer,
+                                                                                "sources": search_result.sources}))
+    logger.info("Analyzing all of the outputs of the search")
+    search_analysis_params = format_search_outputs(all_search_results)
+
+    async def analyze(sub_question: str, search_result: str):
+        query_analysis = await insight_analysis_async(main_question= questions[0],
+                                                      sub_question= sub_question,
+                                                      search_result= search_result,
+                                                      client= cerebras_client,
+                                                      model_name="qwen-3-235b-a22b-thinking-2507")
+        on_event("insight", query_analysis)
+        return query_analysis
+
+    analysis = await asyncio.gather(*[analyze(sub_question, search_result)
+                                      for sub_question, search_result in search_analysis_params])
+    return format_insights(analysis)
+
+@traced("search_pipeline_async", kind="server")
+async def run_search_pipeline_async(request: SearchRequest,
+                                    model_name: str,
+                                    cerebras_client: AsyncCerebras,
+                                    linkup_client: LinkupClient,
+                                    on_event: PipelineEventHandler = ignore_event) -> Dict[str, str]:
+    """Run the whole pipeline on the event loop, reporting every intermediate artifact as it is produced.
+
+    Args:
+        request (SearchRequest): benchmark request.
+        model_name (str): model used for the decomposition, preprocessing and next questions steps.
+        cerebras_client (AsyncCerebras): asynchronous cerebras client for LLM calls.
+        linkup_client (LinkupClient): linkup client for searches.
+        on_event (PipelineEventHandler, optional): called with the name and the payload of every
+            pipeline event. Defaults to ignoring them.
+
+    Returns:
+        Dict[str, str]: output of the slide generation service.
+    """
+    settings = get_settings()
+    query = request.query
+    max_sub_questions = request.max_sub_questions
+    num_iterations = request.max_iterations
+    set_span_attributes(query= query,
+                        max_sub_questions= max_sub_questions,
+                        max_iterations= num_iterations,
+                        pipeline_mode= settings.pipeline_mode)
+    sub_queries = await query_decomposition_step_async(main_query= query,
+                                                       model_name= model_name,
+                                                       num_sub_questions= max_sub_questions,
+                                                       client= cerebras_client)
+    on_event("decomposition", sub_queries)
+    questions = [query] + sub_queries.sub_questions
+    if settings.pipeline_mode == "chained":
+        all_queries_with_analysis = await run_question_chains_async(questions= questions,
+                                                                    model_name= model_name,
+                                                                    cerebras_client= cerebras_client,
+                                                                    linkup_client= linkup_client,
+                                                                    on_event= on_event)
+    else:
+        all_queries_with_analysis = await run_question_stages_async(questions= questions,
+                                                                    model_name= model_name,
+                                                                    cerebras_client= cerebras_client,
+                                                                    linkup_client= linkup_client,
+                                                                    on_event= on_event)
+    logger.info("Generating Report")
+    report = await report_generation_stream_async(queries_with_analysis= all_queries_with_analysis,
+                                                  client= cerebras_client,
+                                                  model_name= "qwen-3-235b-a22b-instruct-2507",
+                                                  on_token= lambda token: on_event("report_token", {"token": token}))
+    on_event("report", report)
+    if num_iterations>1:
+        for i in range(num_iterations-1):
+            logger.info("Generating next step")
+            next_queries = await next_query_creation_async(report_obj= report,
+                                                           num_next_questions= 5,
+                                                           model_name=model_name,
+                                                           client= cerebras_client)
+            next_questions = next_queries.next_questions
+            on_event("next_questions", {"iteration": i + 1, "questions": next_questions})
+            if settings.exploration_mode == "parallel":
+                report = await parallel_exploration_pipeline_async(queries= next_questions,
+                                                                   original_question= query,
+                                                                   model_name= model_name,
+                                                                   cerebras_client= cerebras_client,
+                                                                   linkup_client= linkup_client,
+                                                                   report= report)
+                on_event("report_update", {"iteration": i + 1, "questions": next_questions, "report": report.report})
+                continue
+            for qst in next_questions:
+                logger.info(f"Handling next question {qst}")
+                report = await simplified_pipeline_async(query= qst,
+                                                         original_question= query,
+                                                         model_name= model_name,
+                                                         cerebras_client= cerebras_client,
+                                                         linkup_client= linkup_client,
+                                                         report= report)
+                on_event("report_update", {"iteration": i + 1, "question": qst, "report": report.report})
+    outline = await slide_outline_generation_async(report= report,
+                                                   client= cerebras_client,
+                                                   num_of_slides= 5,
+                                                   model_name= "qwen-3-235b-a22b-instruct-2507")
+    on_event("outline", {"outline": outline.outline})
+    
+    contents = await slides_content_generation_async(client= cerebras_client,
+                                                     outline= outline,
+                                                     model_name= "qwen-3-235b-a22b-instruct-2507")
+    on_event("slides_content", contents)
+    
+    presentation = await create_presentation_async(contents)
+    on_event("presentation", presentation)
+    logger.info(f"LLM cache stats: {get_llm_cache().stats.as_dict()}")
+    logger.info(f"Search cache stats: {get_search_cache().stats.as_dict()}")
+    return presentation
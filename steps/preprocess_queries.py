@@ -0,0 +1,210 @@
+from steps.extract_metadata import (format_metadata_types, 
+                                    fallback_date_outputs, 
+                                    metadata_extraction_step, 
+                                    metadata_extraction_step_async)
+from steps.process_queries import (fallback_search_query_outputs, 
+                                   process_queries_step, 
+                                   process_queries_step_async, 
+                                   map_queries_to_enhanced_queries)
+from utils.prompts import QUERY_PREPROCESSING_PROMPT
+from utils.schemas import EnhancedSearchQuery, PreprocessedQuery, NumberedPreprocessedQuery, PreprocessedQueryList
+from utils.pydantic_models import QuerySearchMetadata, SubQueriesSearchMetadata, EnhancedQueryList
+from utils.structured_output import call_structured_model, call_structured_model_async
+from utils.utils import parallel_map, format_all_questions_output
+from utils.metrics import track_step
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
+from datetime import date
+from typing import List, Tuple, Dict, Literal, Union
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+def format_preprocessed_query(preprocessed_query: Union[PreprocessedQuery, NumberedPreprocessedQuery],
+                              query: str) -> Tuple[QuerySearchMetadata, EnhancedSearchQuery]:
+    to_date, from_date = format_metadata_types(preprocessed_query.to_date, preprocessed_query.from_date)
+    kwargs = {
+        "query": query,
+        "from_date": from_date,
+        "to_date": to_date
+    }
+    kwargs = {k: v for k, v in kwargs.items() if v is not None}
+    metadata_object = QuerySearchMetadata(**kwargs)
+    enhanced_search_query = EnhancedSearchQuery(search_query= preprocessed_query.search_query,
+                                                reasoning= preprocessed_query.reasoning)
+    return metadata_object, enhanced_search_query
+
+def fallback_preprocessed_query(query: str) -> Tuple[QuerySearchMetadata, EnhancedSearchQuery]:
+    return fallback_date_outputs(query), fallback_search_query_outputs(query)
+
+def formulate_batched_prompt(questions: List[str]) -> str:
+    numbered_questions = [f"{i}. {question}" for i, question in enumerate(questions, start=1)]
+    return "\n".join(numbered_questions)
+
+def format_batched_preprocessed_queries(preprocessed_query_list: PreprocessedQueryList,
+                                        questions: List[str]) -> Dict[int, Tuple[QuerySearchMetadata, EnhancedSearchQuery]]:
+    preprocessed_queries = {}
+    for numbered_query in preprocessed_query_list.queries:
+        index = numbered_query.question_number - 1
+        if 0 <= index < len(questions) and index not in preprocessed_queries:
+            try:
+                preprocessed_queries[index] = format_preprocessed_query(numbered_query, questions[index])
+            except ValueError as e:
+                logger.warning(f"Discarding malformed preprocessing of question {index + 1}: {e}")
+    return preprocessed_queries
+
+def split_preprocessed_queries(preprocessed_queries: List[Tuple[QuerySearchMetadata, EnhancedSearchQuery]]
+                               ) -> Tuple[SubQueriesSearchMetadata, List[EnhancedSearchQuery]]:
+    all_metadata = [metadata for metadata, _ in preprocessed_queries]
+    enhanced_search_queries = [enhanced_query for _, enhanced_query in preprocessed_queries]
+    return format_all_questions_output(all_metadata), enhanced_search_queries
+
+@track_step("preprocessing")
+def fused_preprocessing_step(query: str, 
+                             client: Cerebras,
+                             model_name: str,
+                             current_date: date = None) -> Tuple[QuerySearchMetadata, EnhancedSearchQuery]:
+    current_date = current_date or date.today()
+    logger.info(f"Preprocessing query: {query}")
+    prompt_subfix = f"\nFor more details here is the current date {current_date}."
+    system_prompt = QUERY_PREPROCESSING_PROMPT + prompt_subfix
+
+    try:
+        output = call_structured_model(client, system_prompt, model_name, query, PreprocessedQuery, step_name= "query_preprocessing")
+        preprocessed_query = format_preprocessed_query(output, query)
+    except Exception as e:
+        logger.warning(f"Preprocessing failed for {query}, using the query as is: {e!r}")
+        preprocessed_query = fallback_preprocessed_query(query)
+
+    return preprocessed_query
+
+@track_step("preprocessing")
+def batched_preprocessing_step(questions: List[str], 
+                               client: Cerebras,
+                               model_name: str,
+                               current_date: date = None) -> Tuple[SubQueriesSearchMetadata, List[EnhancedSearchQuery]]:
+    current_date = current_date or date.today()
+    logger.info(f"Preprocessing {len(questions)} queries in a single call")
+    prompt_subfix = f"\nFor more details here is the current date {current_date}."
+    system_prompt = QUERY_PREPROCESSING_PROMPT + prompt_subfix
+
+    prompt = formulate_batched_prompt(questions)
+
+    try:
+        output = call_structured_model(client, system_prompt, model_name, prompt, PreprocessedQueryList, step_name= "query_preprocessing")
+        preprocessed_queries = format_batched_preprocessed_queries(output, questions)
+    except Exception as e:
+        logger.warning(f"Batched preprocessing failed, preprocessing the questions one by one: {e!r}")
+        preprocessed_queries = {}
+
+    missing_indexes = [i for i in range(len(questions)) if i not in preprocessed_queries]
+    if missing_indexes:
+        logger.warning(f"Batched preprocessing missed {len(missing_indexes)} questions, preprocessing them one by one")
+    for i in missing_indexes:
+        preprocessed_queries[i] = fused_preprocessing_step(questions[i], client, model_name, current_date)
+
+    return split_preprocessed_queries([preprocessed_queries[i] for i in range(len(questions))])
+
+def questions_preprocessing(questions: List[str],
+                            client: Cerebras,
+                            model_name: str,
+                            num_max_workers: int,
+                            preprocessing_mode: Literal["separate", "fused", "batched"] = "separate") -> EnhancedQueryList:
+    if preprocessing_mode == "batched":
+        formatted_result, enhanced_search_queries = batched_preprocessing_step(questions= questions,
+                                                                               client= client,
+                                                                               model_name= model_name)
+    elif preprocessing_mode == "fused":
+        logger.info(f"Starting the fused preprocessing for {len(questions)} questions")
+        preprocessed_queries = parallel_map(function= fused_preprocessing_step,
+                                            params= [(question, client, model_name) for question in questions],
+                                            max_concurrency= num_max_workers)
+        formatted_result, enhanced_search_queries = split_preprocessed_queries(preprocessed_queries)
+    else:
+        logger.info(f"Starting the metadata extraction for {len(questions)} questions")
+        results = parallel_map(function= metadata_extraction_step, 
+                               params= [(question, client, model_name) for question in questions],
+                               max_concurrency= num_max_workers)
+        logger.info("Formatting the results for the main query and the sub queries")
+        formatted_result = format_all_questions_output(results)
+        logger.info("Starting the queries processing for the main query and the sub queries")
+        enhanced_search_queries = parallel_map(function= process_queries_step, 
+                                               params= [(question, client, model_name) for question in questions],
+                                               max_concurrency= num_max_workers)
+    return map_queries_to_enhanced_queries(formatted_result, enhanced_search_queries)
+
+@track_step("preprocessing")
+async def fused_preprocessing_step_async(query: str, 
+                                         client: AsyncCerebras,
+                                         model_name: str,
+                                         current_date: date = None) -> Tuple[QuerySearchMetadata, EnhancedSearchQuery]:
+    current_date = current_date or date.today()
+    logger.info(f"Preprocessing query: {query}")
+    prompt_subfix = f"\nFor more details here is the current date {current_date}."
+    system_prompt = QUERY_PREPROCESSING_PROMPT + prompt_subfix
+
+    try:
+        output = await call_structured_model_async(client, system_prompt, model_name, query, PreprocessedQuery, step_name= "query_preprocessing")
+        preprocessed_query = format_preprocessed_query(output, query)
+    except Exception as e:
+        logger.warning(f"Preprocessing failed for {query}, using the query as is: {e!r}")
+        preprocessed_query = fallback_preprocessed_query(query)
+
+    return preprocessed_query
+
+@track_step("preprocessing")
+async def batched_preprocessing_step_async(questions: List[str], 
+                                           client: AsyncCerebras,
+                                           model_name: str,
+                                           current_date: date = None) -> Tuple[SubQueriesSearchMetadata, List[EnhancedSearchQuery]]:
+    current_date = current_date or date.today()
+    logger.info(f"Preprocessing {len(questions)} queries in a single call")
+    prompt_subfix = f"\nFor more details here is the current date {current_date}."
+    system_prompt = QUERY_PREPROCESSING_PROMPT + prompt_subfix
+
+    prompt = formulate_batched_prompt(questions)
+
+    try:
+        output = await call_structured_model_async(client, system_prompt, model_name, prompt, PreprocessedQueryList, step_name= "query_preprocessing")
+        preprocessed_queries = format_batched_preprocessed_queries(output, questions)
+    except Exception as e:
+        logger.warning(f"Batched preprocessing failed, preprocessing the questions one by one: {e!r}")
+        preprocessed_queries = {}
+
+    missing_indexes = [i for i in range(len(questions)) if i not in preprocessed_queries]
+    if missing_indexes:
+        logger.warning(f"Batched preprocessing missed {len(missing_indexes)} questions, preprocessing them one by one")
+        recovered_queries = await asyncio.gather(*[fused_preprocessing_step_async(questions[i], client, model_name, current_date)
+                                                   for i in missing_indexes])
+        preprocessed_queries.update(zip(missing_indexes, recovered_queries))
+
+    return split_preprocessed_queries([preprocessed_queries[i] for i in range(len(questions))])
+
+async def questions_preprocessing_async(questions: List[str],
+                                        client: AsyncCerebras,
+                                        model_name: str,
+                                        preprocessing_mode: Literal["separate", "fused", "batched"] = "separate") -> EnhancedQueryList:
+    if preprocessing_mode == "batched":
+        formatted_result, enhanced_search_queries = await batched_preprocessing_step_async(questions= questions,
+                                                                                           client= client,
+                                                                                           model_name= model_name)
+    elif preprocessing_mode == "fused":
+        logger.info(f"Starting the fused preprocessing for {len(questions)} questions")
+        preprocessed_queries = await asyncio.gather(*[fused_preprocessing_step_async(query= question,
+                                                                                     client= client,
+                                                                                     model_name= model_name)
+                                                      for question in questions])
+        formatted_result, enhanced_search_queries = split_preprocessed_queries(preprocessed_queries)
+    else:
+        logger.info(f"Starting the metadata extraction and queries processing for {len(questions)} questions")
+        metadata_tasks = asyncio.gather(*[metadata_extraction_step_async(query= question,
+                                                                         client= client,
+                                                                         model_name= model_name)
+                                          for question in questions])
+        processing_tasks = asyncio.gather(*[process_queries_step_async(query= question,
+                                                                       client= client,
+                                                                       model_name= model_name)
+                                            for question in questions])
+        results, enhanced_search_queries = await asyncio.gather(metadata_tasks, processing_tasks)
+        formatted_result = format_all_questions_output(results)
+    return map_queries_to_enhanced_queries(formatted_result, enhanced_search_queries)
@@ -1,20 +1,14 @@
 from utils.prompts import DEFAULT_SEARCH_QUERY_PROMPT
 from utils.schemas import EnhancedSearchQuery
 from utils.pydantic_models import EnhancedQuerywithMetadata, SubQueriesSearchMetadata, EnhancedQueryList, QuerySearchMetadata
-from utils.llm_utils import format_output_schema, call_cerebras_model
-from cerebras.cloud.sdk import Cerebras
+from utils.structured_output import call_structured_model, call_structured_model_async
+from utils.metrics import track_step
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
 import logging
-import json
 from datetime import date
 from typing import List
 logger = logging.getLogger(__name__)
 
-def extract_output_dict(response) -> EnhancedSearchQuery:
-    response_dict = json.loads(response.choices[0].message.content)
-    search_query = response_dict["search_query"]
-    reasoning = response_dict["reasoning"]
-    return EnhancedSearchQuery(search_query=search_query, reasoning=reasoning)
-
 def fallback_search_query_outputs(query) -> EnhancedSearchQuery:
     return EnhancedSearchQuery(search_query=query, reasoning="No search query was generated")
 
@@ -60,24 +54,39 @@ def map_queries_to_enhanced_queries(queries_with_metadata: SubQueriesSearchMetad
     return search_queries_obj
 
 
+@track_step("enhancement")
 def process_queries_step(query: str, 
                              client: Cerebras,
                              model_name: str,
-                             current_date: date = date.today())-> EnhancedSearchQuery:
-    
+                             current_date: date = None)-> EnhancedSearchQuery:
+    current_date = current_date or date.today()
     logger.info(f"Processing query: {query}")
     prompt_subfix = f"\nFor more details here is the current date {current_date}."
     system_prompt = DEFAULT_SEARCH_QUERY_PROMPT + prompt_subfix
 
-    pydantic_schema = EnhancedSearchQuery.model_json_schema()
+    try:
+        enhanced_search_query = call_structured_model(client, system_prompt, model_name, query, EnhancedSearchQuery, step_name= "query_processing")
+    except Exception as e:
+        logger.warning(f"Query processing failed for {query}, searching the query as is: {e!r}")
+        enhanced_search_query = fallback_search_query_outputs(query)
+
+    return enhanced_search_query
 
-    output_schema = format_output_schema(pydantic_schema)
+
+@track_step("enhancement")
+async def process_queries_step_async(query: str, 
+                                     client: AsyncCerebras,
+                                     model_name: str,
+                                     current_date: date = None)-> EnhancedSearchQuery:
+    current_date = current_date or date.today()
+    logger.info(f"Processing query: {query}")
+    prompt_subfix = f"\nFor more details here is the current date {current_date}."
+    system_prompt = DEFAULT_SEARCH_QUERY_PROMPT + prompt_subfix
 
     try:
-        output = call_cerebras_model(client, system_prompt, model_name, query, output_schema)
-        enhanced_search_query = extract_output_dict(output)
-    except:
+        enhanced_search_query = await call_structured_model_async(client, system_prompt, model_name, query, EnhancedSearchQuery, step_name= "query_processing")
+    except Exception as e:
+        logger.warning(f"Query processing failed for {query}, searching the query as is: {e!r}")
         enhanced_search_query = fallback_search_query_outputs(query)
 
     return enhanced_search_query
-
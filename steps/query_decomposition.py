@@ -1,35 +1,20 @@
 import logging
-import langchain
-import json
-from typing import List, Dict
+from typing import List
 from utils.prompts import QUERY_DECOMPOSITION_PROMPT
-from utils.schemas import SubQuestionList
-from utils.llm_utils import format_output_schema, call_cerebras_model
+from utils.schemas import SubQuestion, SubQuestionList
+from utils.structured_output import call_structured_model, call_structured_model_async
 from utils.pydantic_models import QuerySubQuestions
-from cerebras.cloud.sdk import Cerebras
-from cerebras.cloud.sdk.types.chat.chat_completion import ChatCompletion
+from utils.metrics import track_step
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
 
 logger = logging.getLogger(__name__)
 
-def extract_output_dict(response: ChatCompletion) -> List[Dict[str, str]]:
-    """Extract the subquestions from the response
-
-    Args:
-        response (ChatCompletion): LLM output
-
-    Returns:
-        List[Dict[str, str]]: list of subquestions
-    """    
-    response_dict = json.loads(response.choices[0].message.content)
-    question_list = response_dict["questions"]
-    return question_list
-
-def format_query_decompositon_output(question_list: Dict[str, str], 
+def format_query_decompositon_output(question_list: List[SubQuestion], 
                                      query: str) -> QuerySubQuestions:
     """format the generated subquestions
 
     Args:
-        question_list (Dict[str, str]): list of sub-questions
+        question_list (List[SubQuestion]): list of sub-questions
         query (str): original query
 
     Returns:
@@ -38,8 +23,8 @@ def format_query_decompositon_output(question_list: Dict[str, str],
     all_questions = []
     all_reasons = []
     for question_obj in question_list:
-        question = question_obj["sub_question"]
-        reason = question_obj["reasoning"]
+        question = question_obj.sub_question
+        reason = question_obj.reasoning
         all_questions.append(question)
         all_reasons.append(reason)
     query_with_sub_queries = QuerySubQuestions(main_query= query,
@@ -47,32 +32,27 @@ def format_query_decompositon_output(question_list: Dict[str, str],
                                                justifications= all_reasons)
     return query_with_sub_queries
 
-def generate_fallback_questions(main_query: str) -> List[Dict[str, str]]:
+def generate_fallback_questions(main_query: str) -> List[SubQuestion]:
     """In case of an error this is a list of fallback questions to rely on
 
     Args:
         main_query (str): original query
 
     Returns:
-        List[Dict[str, str]]: predifined list of subqueries
+        List[SubQuestion]: predifined list of subqueries
     """    
     fallback_questions = [
-                            {
-                                "sub_question": f"What is {main_query}?",
-                                "reasoning": "Basic understanding of the topic",
-                            },
-                            {
-                                "sub_question": f"What are the key aspects of {main_query}?",
-                                "reasoning": "Exploring important dimensions",
-                            },
-                            {
-                                "sub_question": f"What are the implications of {main_query}?",
-                                "reasoning": "Understanding broader impact",
-                            },
+                            SubQuestion(sub_question= f"What is {main_query}?",
+                                        reasoning= "Basic understanding of the topic"),
+                            SubQuestion(sub_question= f"What are the key aspects of {main_query}?",
+                                        reasoning= "Exploring important dimensions"),
+                            SubQuestion(sub_question= f"What are the implications of {main_query}?",
+                                        reasoning= "Understanding broader impact"),
                         ]
     return fallback_questions
 
 
+@track_step("decomposition")
 def query_decomposition_step(main_query: str,
                              model_name: str,
                              num_sub_questions: int,
@@ -96,14 +76,46 @@ def query_decomposition_step(main_query: str,
 
     logger.info(f"Calling {model_name} to decompose query into {num_sub_questions} sub-questions")
 
-    pydantic_schema = SubQuestionList.model_json_schema()
+    try:
+        sub_question_list = call_structured_model(client, system_prompt, model_name, main_query, SubQuestionList, step_name= "query_decomposition")
+        question_list = sub_question_list.questions
+    except Exception as e:
+        logger.warning(f"Query decomposition failed for {main_query}, using the fallback questions: {e!r}")
+        question_list = generate_fallback_questions(main_query)
+
+    list_of_all_questions = format_query_decompositon_output(question_list, main_query)
+
+    return list_of_all_questions
 
-    output_schema = format_output_schema(pydantic_schema)
+@track_step("decomposition")
+async def query_decomposition_step_async(main_query: str,
+                                         model_name: str,
+                                         num_sub_questions: int,
+                                         client: AsyncCerebras) -> QuerySubQuestions:
+    """Asynchronous step for decomposing the main query into multiple subqueries
+
+    Args:
+        main_query (str): main query to be divided
+        model_name (str): name of the model
+        num_sub_questions (int): number of the subquestions to be generated
+        client (AsyncCerebras): asynchronous cerebras client for LLM call
+
+    Returns:
+        QuerySubQuestions: final queries object
+    """
+    logger.info(f"Decomposing research query: {main_query}")
+
+    prompt_subfix = f"\nPlease generate {num_sub_questions} sub-questions."
+
+    system_prompt = QUERY_DECOMPOSITION_PROMPT + prompt_subfix
+
+    logger.info(f"Calling {model_name} to decompose query into {num_sub_questions} sub-questions")
 
     try:
-        output = call_cerebras_model(client, system_prompt, model_name, main_query, output_schema)
-        question_list = extract_output_dict(output)
-    except:
+        sub_question_list = await call_structured_model_async(client, system_prompt, model_name, main_query, SubQuestionList, step_name= "query_decomposition")
+        question_list = sub_question_list.questions
+    except Exception as e:
+        logger.warning(f"Query decomposition failed for {main_query}, using the fallback questions: {e!r}")
         question_list = generate_fallback_questions(main_query)
 
     list_of_all_questions = format_query_decompositon_output(question_list, main_query)
@@ -0,0 +1,177 @@
+"""
+Per question chains running the preprocessing, the search and the insight analysis of every
+question independently, so that a question done early does not wait for the slowest one of
+each stage. Only the report generation joins the chains.
+"""
+from steps.extract_metadata import metadata_extraction_step, metadata_extraction_step_async
+from steps.process_queries import process_queries_step, process_queries_step_async, map_query_to_enhanced_query
+from steps.preprocess_queries import fused_preprocessing_step, fused_preprocessing_step_async
+from steps.insight_analysis import insight_analysis, insight_analysis_async, format_insights
+from utils.search_utils import search_linkup, search_linkup_async, format_single_output, fallback_search_output
+from utils.pydantic_models import QueryAnalysis, QueriesInsightAnalysis, EnhancedQuerywithMetadata
+from utils.utils import parallel_map
+from utils.config import get_settings
+from utils.rate_limit import limit_concurrency
+from utils.metrics import track_step
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
+from linkup import LinkupClient
+from typing import Any, Callable, List, Literal
+import asyncio
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+def preprocess_question(question: str,
+                        client: Cerebras,
+                        model_name: str) -> EnhancedQuerywithMetadata:
+    if get_settings().preprocessing_mode == "separate":
+        results = metadata_extraction_step(query= question,
+                                           client= client,
+                                           model_name= model_name)
+        enhanced_search_query = process_queries_step(query= question,
+                                                     client= client,
+                                                     model_name= model_name)
+    else:
+        results, enhanced_search_query = fused_preprocessing_step(query= question,
+                                                                  client= client,
+                                                                  model_name= model_name)
+    return map_query_to_enhanced_query(results, enhanced_search_query)
+
+async def preprocess_question_async(question: str,
+                                    client: AsyncCerebras,
+                                    model_name: str) -> EnhancedQuerywithMetadata:
+    if get_settings().preprocessing_mode == "separate":
+        results, enhanced_search_query = await asyncio.gather(
+            metadata_extraction_step_async(query= question,
+                                           client= client,
+                                           model_name= model_name),
+            process_queries_step_async(query= question,
+                                       client= client,
+                                       model_name= model_name))
+    else:
+        results, enhanced_search_query = await fused_preprocessing_step_async(query= question,
+                                                                              client= client,
+                                                                              model_name= model_name)
+    return map_query_to_enhanced_query(results, enhanced_search_query)
+
+def question_chain(question: str,
+                   main_question: str,
+                   model_name: str,
+                   cerebras_client: Cerebras,
+                   linkup_client: LinkupClient,
+                   search_semaphore: threading.Semaphore,
+                   search_mode: Literal["standard", "deep"] = "standard") -> QueryAnalysis:
+    with track_step("question_chain", question= question):
+        search_query = preprocess_question(question, cerebras_client, model_name)
+        with search_semaphore:
+            logger.info(f"Searching: {search_query.enhanced_query} ...")
+            try:
+                search_result = search_linkup(client= linkup_client,
+                                              query= search_query.enhanced_query,
+                                              search_mode= search_mode,
+                                              from_date= search_query.from_date,
+                                              to_date= search_query.to_date,
+                                              timeout= get_settings().search_timeout)
+            except Exception as e:
+                logger.warning(f"Search failed for {search_query.enhanced_query}: {e}")
+                search_result = fallback_search_output(search_query.enhanced_query)
+        search_output = format_single_output(query= search_query.enhanced_query,
+                                             search_result= search_result,
+                                             search_mode= search_mode)
+        return insight_analysis(main_question= main_question,
+                                sub_question= search_output.query,
+                                search_result= search_output.answer,
+                                client= cerebras_client,
+                                model_name="qwen-3-235b-a22b-thinking-2507")
+
+async def question_chain_async(question: str,
+                               main_question: str,
+                               model_name: str,
+                               cerebras_client: AsyncCerebras,
+                               linkup_client: LinkupClient,
+                               search_semaphore: asyncio.Semaphore,
+                               on_event: Callable[[str, Any], None],
+                               search_mode: Literal["standard", "deep"] = "standard") -> QueryAnalysis:
+    with track_step("question_chain", question= question):
+        search_query = await preprocess_question_async(question, cerebras_client, model_name)
+        on_event("question_preprocessing", search_query)
+        async with search_semaphore:
+            logger.info(f"Searching: {search_query.enhanced_query} ...")
+            try:
+                search_result = await asyncio.wait_for(search_linkup_async(client= linkup_client,
+                                                                           query= search_query.enhanced_query,
+                                                                           search_mode= search_mode,
+                                                                           from_date= search_query.from_date,
+                                                                           to_date= search_query.to_date),
+                                                       timeout= get_settings().search_timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Search timed out after {get_settings().search_timeout}s for {search_query.enhanced_query}")
+                search_result = fallback_search_output(search_query.enhanced_query)
+            except Exception as e:
+                logger.warning(f"Search failed for {search_query.enhanced_query}: {e}")
+                search_result = fallback_search_output(search_query.enhanced_query)
+        on_event("search", {"query": search_query.enhanced_query,
+                            "answer": search_result.answer,
+                            "sources": search_result.sources})
+        search_output = format_single_output(query= search_query.enhanced_query,
+                                             search_result= search_result,
+                                             search_mode= search_mode)
+        query_analysis = await insight_analysis_async(main_question= main_question,
+                                                      sub_question= search_output.query,
+                                                      search_result= search_output.answer,
+                                                      client= cerebras_client,
+                                                      model_name="qwen-3-235b-a22b-thinking-2507")
+        on_event("insight", query_analysis)
+        return query_analysis
+
+def run_question_chains(questions: List[str],
+                        model_name: str,
+                        cerebras_client: Cerebras,
+                        linkup_client: LinkupClient) -> QueriesInsightAnalysis:
+    """Run a chain per question on the shared executor and join them for the report.
+
+    Args:
+        questions (List[str]): main question followed by the sub questions.
+        model_name (str): model used for the preprocessing steps.
+        cerebras_client (Cerebras): cerebras client for LLM calls.
+        linkup_client (LinkupClient): linkup client for searches.
+
+    Returns:
+        QueriesInsightAnalysis: analysis of every question.
+    """
+    logger.info(f"Running {len(questions)} question chains")
+    search_semaphore = threading.Semaphore(limit_concurrency("linkup", get_settings().search_max_concurrency))
+    analysis = parallel_map(function= question_chain,
+                            params= [(question, questions[0], model_name, cerebras_client, linkup_client, search_semaphore)
+                                     for question in questions])
+    return format_insights(analysis)
+
+async def run_question_chains_async(questions: List[str],
+                                    model_name: str,
+                                    cerebras_client: AsyncCerebras,
+                                    linkup_client: LinkupClient,
+                                    on_event: Callable[[str, Any], None]) -> QueriesInsightAnalysis:
+    """Run a chain per question on the event loop and join them for the report.
+
+    Args:
+        questions (List[str]): main question followed by the sub questions.
+        model_name (str): model used for the preprocessing steps.
+        cerebras_client (AsyncCerebras): asynchronous cerebras client for LLM calls.
+        linkup_client (LinkupClient): linkup client for searches.
+        on_event (Callable[[str, Any], None]): called with the intermediate artifacts of every chain.
+
+    Returns:
+        QueriesInsightAnalysis: analysis of every question.
+    """
+    logger.info(f"Running {len(questions)} question chains")
+    search_semaphore = asyncio.Semaphore(limit_concurrency("linkup", get_settings().search_max_concurrency))
+    analysis = await asyncio.gather(*[question_chain_async(question= question,
+                                                           main_question= questions[0],
+                                                           model_name= model_name,
+                                                           cerebras_client= cerebras_client,
+                                                           linkup_client= linkup_client,
+                                                           search_semaphore= search_semaphore,
+                                                           on_event= on_event)
+                                      for question in questions])
+    return format_insights(list(analysis))
@@ -1,7 +1,10 @@
 from utils.pydantic_models import QueriesInsightAnalysis, QueryReport
-from utils.llm_utils import call_cerebras_model
-from cerebras.cloud.sdk import Cerebras
+from utils.llm_utils import call_cerebras_model, call_cerebras_model_async, call_cerebras_model_stream_async
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
 from utils.prompts import REPORT_GENERATION_PROMPT
+from utils.token_budget import PromptBudget, compact_prompt
+from utils.metrics import track_step
+from typing import Callable, List, Optional
 
 def formulate_main_query_subprompt(main_question: str,
                                       search_result: str,
@@ -21,40 +24,93 @@ def formulate_sub_query_subprompt(sub_question: str,
     """
     return sub_prompt
 
-def formulate_prompt(queries_with_analysis: QueriesInsightAnalysis)-> str:
+def formulate_prompt(queries_with_analysis: QueriesInsightAnalysis,
+                     budget: Optional[PromptBudget] = None)-> str:
     main_query_with_analysis = queries_with_analysis.main_query
-    main_query = main_query_with_analysis.query
-    main_query_search_results = main_query_with_analysis.search_result
-    main_query_analysis = main_query_with_analysis.analysis
-    main_query_subprompt = formulate_main_query_subprompt(main_question= main_query,
-                                                          search_result= main_query_search_results,
-                                                          analysis = main_query_analysis)
-    sub_queries_subprompts = []
     sub_queries_with_analysis = queries_with_analysis.sub_queries
-    for sub_query_with_analysis in sub_queries_with_analysis:
-        sub_query = sub_query_with_analysis.query
-        sub_query_search_results = sub_query_with_analysis.search_result
-        sub_query_analysis = sub_query_with_analysis.analysis
+    queries = [main_query_with_analysis.query] + [sub_query.query for sub_query in sub_queries_with_analysis]
+    search_results = [main_query_with_analysis.search_result] + [sub_query.search_result for sub_query in sub_queries_with_analysis]
+    analyses = [main_query_with_analysis.analysis] + [sub_query.analysis for sub_query in sub_queries_with_analysis]
+    if budget is not None:
+        fixed_prompt = assemble_prompt(queries, [""] * len(queries), [""] * len(queries))
+        # analyses condense the search results and the main query frames the report
+        weights = [2.0] + [1.0] * len(sub_queries_with_analysis) + [4.0] + [2.0] * len(sub_queries_with_analysis)
+        fitted_parts = budget.fit(fixed_prompt, search_results + analyses, weights)
+        search_results, analyses = fitted_parts[:len(queries)], fitted_parts[len(queries):]
+    return assemble_prompt(queries, search_results, analyses)
+
+def assemble_prompt(queries: List[str], search_results: List[str], analyses: List[str]) -> str:
+    main_query_subprompt = formulate_main_query_subprompt(main_question= queries[0],
+                                                          search_result= search_results[0],
+                                                          analysis = analyses[0])
+    sub_queries_subprompts = []
+    for sub_query, sub_query_search_results, sub_query_analysis in zip(queries[1:], search_results[1:], analyses[1:]):
         sub_query_subprompt = formulate_sub_query_subprompt(sub_question= sub_query,
                                                             search_result= sub_query_search_results,
                                                             analysis= sub_query_analysis)
         sub_queries_subprompts.append(sub_query_subprompt)
     sub_queries_subprompt = "\n".join(sub_queries_subprompts)
     full_prompt = main_query_subprompt + "\n" + sub_queries_subprompt
-    return full_prompt
+    return compact_prompt(full_prompt)
 
+@track_step("report")
 def report_generation(queries_with_analysis: QueriesInsightAnalysis,
                       client: Cerebras,
                       model_name: str) -> QueryReport:
-    prompt = formulate_prompt(queries_with_analysis)
     system_prompt = REPORT_GENERATION_PROMPT
+    budget = PromptBudget(model_name= model_name, step_name= "report_generation", system_prompt= system_prompt)
+    prompt = formulate_prompt(queries_with_analysis, budget)
+    budget.log_usage(prompt)
     output = call_cerebras_model(client = client,
                                   model_name= model_name,
                                   system_prompt= system_prompt,
-                                  prompt= prompt
+                                  prompt= prompt,
+                                  step_name= "report_generation"
                                   )
     output_content = output.choices[0].message.content
     user_query = queries_with_analysis.main_query.query
     report_obj = QueryReport(main_query= user_query,
                 report= output_content)
-    return report_obj
\ No newline at end of file
+    return report_obj
+
+@track_step("report")
+async def report_generation_async(queries_with_analysis: QueriesInsightAnalysis,
+                                  client: AsyncCerebras,
+                                  model_name: str) -> QueryReport:
+    system_prompt = REPORT_GENERATION_PROMPT
+    budget = PromptBudget(model_name= model_name, step_name= "report_generation", system_prompt= system_prompt)
+    prompt = formulate_prompt(queries_with_analysis, budget)
+    budget.log_usage(prompt)
+    output = await call_cerebras_model_async(client = client,
+                                             model_name= model_name,
+                                             system_prompt= system_prompt,
+                                             prompt= prompt,
+                                             step_name= "report_generation"
+                                             )
+    output_content = output.choices[0].message.content
+    user_query = queries_with_analysis.main_query.query
+    report_obj = QueryReport(main_query= user_query,
+                report= output_content)
+    return report_obj
+
+@track_step("report")
+async def report_generation_stream_async(queries_with_analysis: QueriesInsightAnalysis,
+                                         client: AsyncCerebras,
+                                         model_name: str,
+                                         on_token: Callable[[str], None]) -> QueryReport:
+    system_prompt = REPORT_GENERATION_PROMPT
+    budget = PromptBudget(model_name= model_name, step_name= "report_generation", system_prompt= system_prompt)
+    prompt = formulate_prompt(queries_with_analysis, budget)
+    budget.log_usage(prompt)
+    output = await call_cerebras_model_stream_async(client = client,
+                                                    model_name= model_name,
+                                                    system_prompt= system_prompt,
+                                                    prompt= prompt,
+                                                    on_token= on_token,
+                                                    step_name= "report_generation"
+                                                    )
+    output_content = output.choices[0].message.content
+    user_query = queries_with_analysis.main_query.query
+    report_obj = QueryReport(main_query= user_query,
+                report= output_content)
+    return report_obj
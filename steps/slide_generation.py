@@ -1,10 +1,11 @@
 from utils.pydantic_models import QueryReport, SlideOutline, SlideContent, PresentationContents
-from utils.llm_utils import call_cerebras_model, format_output_schema
+from utils.llm_utils import call_cerebras_model, call_cerebras_model_async
+from utils.structured_output import call_structured_model, call_structured_model_async
 from utils.schemas import Presentation
-from cerebras.cloud.sdk import Cerebras
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
 from utils.prompts import PRESENTATION_OUTLINE_GENERATION_PROMPT, PRESENTATION_CONTENT_GENERATION_PROMPT
+from utils.metrics import track_step
 import logging
-import json
 
 logger = logging.getLogger(__name__)
 
@@ -20,16 +21,14 @@ def formulate_content_prompt(outline: SlideOutline)-> str:
     and here is the benchmark report from where to get the content"""
     return prompt
 
-def extract_output_dict(response, outline: SlideOutline) -> PresentationContents:
-    response_dict = json.loads(response.choices[0].message.content)
-    num_of_slides = response_dict["number_of_slides"]
-    list_of_slides = response_dict["slide_content"]
-    formatted_list_of_slides = [SlideContent(slide_content = slide["content"],
-                                             slide_number= slide["slide_number"],
-                                             slide_title = slide["title"]) for slide in list_of_slides]
-    return PresentationContents(query= outline.main_query, num_of_slides= num_of_slides, slides= formatted_list_of_slides)
+def format_presentation_contents(presentation: Presentation, outline: SlideOutline) -> PresentationContents:
+    formatted_list_of_slides = [SlideContent(slide_content = slide.content,
+                                             slide_number= slide.slide_number,
+                                             slide_title = slide.title) for slide in presentation.slide_content]
+    return PresentationContents(query= outline.main_query, num_of_slides= presentation.number_of_slides, slides= formatted_list_of_slides)
 
 
+@track_step("outline")
 def slide_outline_generation(report: QueryReport,
                       client: Cerebras,
                       num_of_slides: int,
@@ -41,7 +40,8 @@ def slide_outline_generation(report: QueryReport,
     output = call_cerebras_model(client = client,
                                   model_name= model_name,
                                   system_prompt= system_prompt,
-                                  prompt= prompt
+                                  prompt= prompt,
+                                  step_name= "slide_outline"
                                   )
     output_content = output.choices[0].message.content
     outline_obj = SlideOutline(main_query=report.main_query,
@@ -49,23 +49,49 @@ def slide_outline_generation(report: QueryReport,
                                outline=output_content)
     return outline_obj
 
+@track_step("slides")
 def slides_content_generation(client: Cerebras,
                               outline: SlideOutline,
                               model_name: str) -> PresentationContents:
     system_prompt = PRESENTATION_CONTENT_GENERATION_PROMPT
     prompt = formulate_content_prompt(outline)
 
-    output = call_cerebras_model(client= client,
-                                 model_name= model_name,
-                                 system_prompt= system_prompt,
-                                 prompt= prompt)
-    
-    pydantic_schema = Presentation.model_json_schema()
+    presentation = call_structured_model(client, system_prompt, model_name, prompt, Presentation, step_name= "slide_content")
 
-    output_schema = format_output_schema(pydantic_schema)
+    presentation_contents = format_presentation_contents(presentation, outline)
 
-    output = call_cerebras_model(client, system_prompt, model_name, prompt, output_schema)
+    return presentation_contents
+
+@track_step("outline")
+async def slide_outline_generation_async(report: QueryReport,
+                                         client: AsyncCerebras,
+                                         num_of_slides: int,
+                                         model_name: str) -> SlideOutline:
+    prompt_subfix = f"\nPlease generate {num_of_slides} slides."
+    system_prompt = PRESENTATION_OUTLINE_GENERATION_PROMPT + prompt_subfix
+    prompt = formulate_outline_prompt(report)
+
+    output = await call_cerebras_model_async(client = client,
+                                             model_name= model_name,
+                                             system_prompt= system_prompt,
+                                             prompt= prompt,
+                                             step_name= "slide_outline"
+                                             )
+    output_content = output.choices[0].message.content
+    outline_obj = SlideOutline(main_query=report.main_query,
+                               report= report.report,
+                               outline=output_content)
+    return outline_obj
+
+@track_step("slides")
+async def slides_content_generation_async(client: AsyncCerebras,
+                                          outline: SlideOutline,
+                                          model_name: str) -> PresentationContents:
+    system_prompt = PRESENTATION_CONTENT_GENERATION_PROMPT
+    prompt = formulate_content_prompt(outline)
+
+    presentation = await call_structured_model_async(client, system_prompt, model_name, prompt, Presentation, step_name= "slide_content")
 
-    presentation_contents = extract_output_dict(output, outline)
+    presentation_contents = format_presentation_contents(presentation, outline)
 
     return presentation_contents
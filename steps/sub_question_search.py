@@ -1,7 +1,9 @@
 from utils.pydantic_models import SubQueriesSearchMetadata, QuerySubQueryResults, EnhancedQueryList
-from utils.utils import sequential_run_search
-from utils.search_utils import search_linkup, format_outputs
-from typing import Literal
+from utils.utils import sequential_run_search, concurrent_run_search, concurrent_run_search_async
+from utils.search_utils import search_linkup, search_linkup_async, format_outputs
+from utils.config import get_settings
+from utils.rate_limit import limit_concurrency
+from typing import Literal, Callable
 from linkup import LinkupClient
 import logging
 
@@ -10,8 +12,15 @@ logger = logging.getLogger(__name__)
 def parallelize_question_search(all_questions: EnhancedQueryList,
                                 client: LinkupClient,
                                 search_mode: Literal["standard", "deep"] = "standard",
-                                output_type: Literal["searchResults", "sourcedAnswer", "structured"] = "sourcedAnswer"
+                                output_type: Literal["searchResults", "sourcedAnswer", "structured"] = "sourcedAnswer",
+                                search_strategy: Literal["concurrent", "sequential"] = None,
+                                max_concurrency: int = None,
+                                timeout: float = None
                                 ) -> QuerySubQueryResults:
+    settings = get_settings()
+    search_strategy = search_strategy or settings.search_strategy
+    max_concurrency = limit_concurrency("linkup", max_concurrency or settings.search_max_concurrency)
+    timeout = timeout or settings.search_timeout
     main_question = all_questions.main_query
     sub_questions = all_questions.sub_queries
     all_params = [(main_question.enhanced_query, 
@@ -19,13 +28,56 @@ def parallelize_question_search(all_questions: EnhancedQueryList,
                    main_question.to_date)] + [(sub_question.enhanced_query, 
                                                sub_question.from_date, 
                                                sub_question.to_date) for sub_question in sub_questions]
-    num_max_workers = len(all_params)
-    logger.info(f"Starting the question search for {num_max_workers} questions")
-    outputs = sequential_run_search(function=search_linkup, 
-                        params = all_params, 
-                        client= client, 
-                        search_mode= search_mode, 
-                        output_type= output_type)
+    num_max_workers = min(len(all_params), max_concurrency)
+    if search_strategy == "sequential":
+        logger.info(f"Starting the sequential question search for {len(all_params)} questions")
+        outputs = sequential_run_search(function=search_linkup, 
+                            params = all_params, 
+                            client= client, 
+                            search_mode= search_mode, 
+                            output_type= output_type)
+    else:
+        logger.info(f"Starting the question search for {len(all_params)} questions with {num_max_workers} workers")
+        outputs = concurrent_run_search(function=search_linkup, 
+                            params = all_params, 
+                            client= client, 
+                            search_mode= search_mode, 
+                            output_type= output_type,
+                            max_concurrency= num_max_workers,
+                            timeout= timeout)
     all_questions = [main_question.enhanced_query] + [sub_question.enhanced_query for sub_question in sub_questions]
     formatted_search_results = format_outputs(queries= all_questions, search_results= outputs)
-    return formatted_search_results
\ No newline at end of file
+    return formatted_search_results
+
+async def parallelize_question_search_async(all_questions: EnhancedQueryList,
+                                            client: LinkupClient,
+                                            search_mode: Literal["standard", "deep"] = "standard",
+                                            output_type: Literal["searchResults", "sourcedAnswer", "structured"] = "sourcedAnswer",
+                                            max_concurrency: int = None,
+                                            timeout: float = None,
+                                            on_search_done: Callable[[str, any], None] = None
+                                            ) -> QuerySubQueryResults:
+    settings = get_settings()
+    max_concurrency = limit_concurrency("linkup", max_concurrency or settings.search_max_concurrency)
+    timeout = timeout or settings.search_timeout
+    main_question = all_questions.main_query
+    sub_questions = all_questions.sub_queries
+    all_search_queries = [main_question] + sub_questions
+    all_params = [(search_query.enhanced_query, 
+                   search_query.from_date, 
+                   search_query.to_date) for search_query in all_search_queries]
+    on_result = None
+    if on_search_done is not None:
+        on_result = lambda index, search_result: on_search_done(all_params[index][0], search_result)
+    logger.info(f"Starting the question search for {len(all_params)} questions with at most {max_concurrency} in flight")
+    outputs = await concurrent_run_search_async(function=search_linkup_async, 
+                                                params = all_params, 
+                                                client= client, 
+                                                search_mode= search_mode, 
+                                                output_type= output_type,
+                                                max_concurrency= max_concurrency,
+                                                timeout= timeout,
+                                                on_result= on_result)
+    all_questions = [search_query.enhanced_query for search_query in all_search_queries]
+    formatted_search_results = format_outputs(queries= all_questions, search_results= outputs)
+    return formatted_search_results
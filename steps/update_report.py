@@ -1,21 +1,97 @@
-from utils.pydantic_models import QueryReport, QueryAnalysis, QuerySearchResults
-from utils.prompts import REPORT_UPDATE_PROMPT
-from utils.llm_utils import call_cerebras_model
-from cerebras.cloud.sdk import Cerebras
+from utils.pydantic_models import QueryReport, QueryAnalysis, QuerySearchResults, QueryExploration
+from utils.prompts import REPORT_UPDATE_PROMPT, REPORT_MERGED_UPDATE_PROMPT, REPORT_PATCH_PROMPT
+from utils.schemas import ReportPatchList, ReportPatch
+from utils.report_utils import (get_report_sections, 
+                                select_full_sections, 
+                                format_sections_for_prompt, 
+                                apply_report_patches, 
+                                render_report_sections)
+from utils.config import get_settings
+from utils.token_budget import PromptBudget, compact_prompt
+from typing import List, Optional
+from utils.llm_utils import call_cerebras_model, call_cerebras_model_async
+from utils.structured_output import call_structured_model, call_structured_model_async
+from utils.metrics import track_step
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
+import logging
+
+logger = logging.getLogger(__name__)
 
 def formulate_full_prompt(main_query:str,
                           next_query: str,
                           exisiting_report: str,
                           search_results: str,
-                          analysis: str) -> str:
+                          analysis: str,
+                          budget: Optional[PromptBudget] = None) -> str:
+    if budget is not None:
+        fixed_prompt = formulate_full_prompt(main_query, next_query, exisiting_report, "", "")
+        search_results, analysis = budget.fit(fixed_prompt, [search_results, analysis], [1.0, 2.0])
     full_prompt = f"""The main question in discussion is {main_query}.
     The existing report answering this query is {exisiting_report}.\n\n
     The query currently being explored to expand the report is {next_query}.
     The synthetised information from the search result is the following {search_results}.
     Here is the analysis that was done on the results: {analysis}.
     """
-    return full_prompt
+    return compact_prompt(full_prompt)
+
+def formulate_exploration_subprompt(question_number: int,
+                                    next_query: str,
+                                    search_results: str,
+                                    analysis: str) -> str:
+    sub_prompt = f"""Explored question {question_number} is {next_query}.
+    The synthetised information from the search result is the following {search_results}.
+    Here is the analysis that was done on the results: {analysis}.
+    """
+    return sub_prompt
+
+def formulate_exploration_subprompts(explorations: List[QueryExploration],
+                                     budget: Optional[PromptBudget] = None,
+                                     fixed_prompt: str = "") -> List[str]:
+    search_results = [exploration.search_results.answer for exploration in explorations]
+    analyses = [exploration.analysis.analysis for exploration in explorations]
+    if budget is not None:
+        empty_subprompts = [formulate_exploration_subprompt(i, exploration.query, "", "")
+                            for i, exploration in enumerate(explorations, start=1)]
+        fitted_parts = budget.fit(fixed_prompt + "\n".join(empty_subprompts),
+                                  search_results + analyses,
+                                  [1.0] * len(explorations) + [2.0] * len(explorations))
+        search_results, analyses = fitted_parts[:len(explorations)], fitted_parts[len(explorations):]
+    return [formulate_exploration_subprompt(question_number= i,
+                                            next_query= exploration.query,
+                                            search_results= search_result,
+                                            analysis= analysis)
+            for i, (exploration, search_result, analysis) in enumerate(zip(explorations, search_results, analyses), start=1)]
+
+def formulate_merged_prompt(main_query: str,
+                            exisiting_report: str,
+                            explorations: List[QueryExploration],
+                            budget: Optional[PromptBudget] = None) -> str:
+    full_prompt = f"""The main question in discussion is {main_query}.
+    The existing report answering this query is {exisiting_report}.\n\n
+    The {len(explorations)} following questions were explored to expand the report.
+    """
+    exploration_subprompts = formulate_exploration_subprompts(explorations, budget, full_prompt)
+    return compact_prompt(full_prompt + "\n".join(exploration_subprompts))
+
+def formulate_patch_prompt(main_query: str,
+                           formatted_sections: str,
+                           explorations: List[QueryExploration],
+                           budget: Optional[PromptBudget] = None) -> str:
+    full_prompt = f"""The main question in discussion is {main_query}.
+    The sections of the existing report answering this query are:\n{formatted_sections}\n\n
+    The {len(explorations)} following questions were explored to expand the report.
+    """
+    exploration_subprompts = formulate_exploration_subprompts(explorations, budget, full_prompt)
+    return compact_prompt(full_prompt + "\n".join(exploration_subprompts))
+
+def format_patched_report(report_obj: QueryReport, patches: List[ReportPatch], sections, full_sections) -> QueryReport:
+    logger.info(f"Applying {len(patches)} patches to a report of {len(sections)} sections")
+    patched_sections = apply_report_patches(sections, patches, full_sections)
+    return QueryReport(main_query= report_obj.main_query,
+                       report= render_report_sections(patched_sections),
+                       sections= patched_sections)
 
+@track_step("update")
 def report_update(report_obj: QueryReport,
                   analysis_obj: QueryAnalysis,
                   next_query: str,
@@ -27,18 +103,142 @@ def report_update(report_obj: QueryReport,
     report = report_obj.report
     analysis = analysis_obj.analysis
     search_result = search_results_obj.answer
+    system_prompt = REPORT_UPDATE_PROMPT
+    budget = PromptBudget(model_name= model_name, step_name= "report_update", system_prompt= system_prompt)
     prompt = formulate_full_prompt(main_query= main_query,
                                    next_query= next_query,
                                    exisiting_report= report,
                                    analysis= analysis,
-                                   search_results= search_result)
+                                   search_results= search_result,
+                                   budget= budget)
+    budget.log_usage(prompt)
+    output = call_cerebras_model(client = client,
+                                  model_name= model_name,
+                                  system_prompt= system_prompt,
+                                  prompt= prompt,
+                                  step_name= "report_update"
+                                  )
+    output_content = output.choices[0].message.content
+    updated_report_obj = QueryReport(main_query= main_query,
+                report= output_content)
+    return updated_report_obj
+
+@track_step("update")
+async def report_update_async(report_obj: QueryReport,
+                              analysis_obj: QueryAnalysis,
+                              next_query: str,
+                              search_results_obj: QuerySearchResults,
+                              client: AsyncCerebras,
+                              model_name: str
+                              ) -> QueryReport:
+    main_query = report_obj.main_query
+    report = report_obj.report
+    analysis = analysis_obj.analysis
+    search_result = search_results_obj.answer
     system_prompt = REPORT_UPDATE_PROMPT
+    budget = PromptBudget(model_name= model_name, step_name= "report_update", system_prompt= system_prompt)
+    prompt = formulate_full_prompt(main_query= main_query,
+                                   next_query= next_query,
+                                   exisiting_report= report,
+                                   analysis= analysis,
+                                   search_results= search_result,
+                                   budget= budget)
+    budget.log_usage(prompt)
+    output = await call_cerebras_model_async(client = client,
+                                             model_name= model_name,
+                                             system_prompt= system_prompt,
+                                             prompt= prompt,
+                                             step_name= "report_update"
+                                             )
+    output_content = output.choices[0].message.content
+    updated_report_obj = QueryReport(main_query= main_query,
+                report= output_content)
+    return updated_report_obj
+
+@track_step("update")
+def report_merged_update(report_obj: QueryReport,
+                         explorations: List[QueryExploration],
+                         client: Cerebras,
+                         model_name: str
+                         ) -> QueryReport:
+    main_query = report_obj.main_query
+    system_prompt = REPORT_MERGED_UPDATE_PROMPT
+    budget = PromptBudget(model_name= model_name, step_name= "report_update", system_prompt= system_prompt)
+    prompt = formulate_merged_prompt(main_query= main_query,
+                                     exisiting_report= report_obj.report,
+                                     explorations= explorations,
+                                     budget= budget)
+    budget.log_usage(prompt)
     output = call_cerebras_model(client = client,
                                   model_name= model_name,
                                   system_prompt= system_prompt,
-                                  prompt= prompt
+                                  prompt= prompt,
+                                  step_name= "report_update"
                                   )
     output_content = output.choices[0].message.content
     updated_report_obj = QueryReport(main_query= main_query,
                 report= output_content)
-    return updated_report_obj
\ No newline at end of file
+    return updated_report_obj
+
+@track_step("update")
+async def report_merged_update_async(report_obj: QueryReport,
+                                     explorations: List[QueryExploration],
+                                     client: AsyncCerebras,
+                                     model_name: str
+                                     ) -> QueryReport:
+    main_query = report_obj.main_query
+    system_prompt = REPORT_MERGED_UPDATE_PROMPT
+    budget = PromptBudget(model_name= model_name, step_name= "report_update", system_prompt= system_prompt)
+    prompt = formulate_merged_prompt(main_query= main_query,
+                                     exisiting_report= report_obj.report,
+                                     explorations= explorations,
+                                     budget= budget)
+    budget.log_usage(prompt)
+    output = await call_cerebras_model_async(client = client,
+                                             model_name= model_name,
+                                             system_prompt= system_prompt,
+                                             prompt= prompt,
+                                             step_name= "report_update"
+                                             )
+    output_content = output.choices[0].message.content
+    updated_report_obj = QueryReport(main_query= main_query,
+                report= output_content)
+    return updated_report_obj
+
+@track_step("update")
+def report_patch_update(report_obj: QueryReport,
+                        explorations: List[QueryExploration],
+                        client: Cerebras,
+                        model_name: str
+                        ) -> QueryReport:
+    settings = get_settings()
+    sections = get_report_sections(report_obj)
+    full_sections = select_full_sections(sections, settings.report_patch_context_chars)
+    formatted_sections = format_sections_for_prompt(sections, full_sections, settings.report_patch_excerpt_chars)
+    budget = PromptBudget(model_name= model_name, step_name= "report_update", system_prompt= REPORT_PATCH_PROMPT)
+    prompt = formulate_patch_prompt(main_query= report_obj.main_query,
+                                    formatted_sections= formatted_sections,
+                                    explorations= explorations,
+                                    budget= budget)
+    budget.log_usage(prompt)
+    patch_list = call_structured_model(client, REPORT_PATCH_PROMPT, model_name, prompt, ReportPatchList, step_name= "report_update")
+    return format_patched_report(report_obj, patch_list.patches, sections, full_sections)
+
+@track_step("update")
+async def report_patch_update_async(report_obj: QueryReport,
+                                    explorations: List[QueryExploration],
+                                    client: AsyncCerebras,
+                                    model_name: str
+                                    ) -> QueryReport:
+    settings = get_settings()
+    sections = get_report_sections(report_obj)
+    full_sections = select_full_sections(sections, settings.report_patch_context_chars)
+    formatted_sections = format_sections_for_prompt(sections, full_sections, settings.report_patch_excerpt_chars)
+    budget = PromptBudget(model_name= model_name, step_name= "report_update", system_prompt= REPORT_PATCH_PROMPT)
+    prompt = formulate_patch_prompt(main_query= report_obj.main_query,
+                                    formatted_sections= formatted_sections,
+                                    explorations= explorations,
+                                    budget= budget)
+    budget.log_usage(prompt)
+    patch_list = await call_structured_model_async(client, REPORT_PATCH_PROMPT, model_name, prompt, ReportPatchList, step_name= "report_update")
+    return format_patched_report(report_obj, patch_list.patches, sections, full_sections)
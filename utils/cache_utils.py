@@ -0,0 +1,255 @@
+"""
+Content-addressed caches shared by the LLM and the search calls of the pipeline.
+
+A cache is made of tiers (backends) that are looked up in order: a small in-memory
+LRU in front of a persistent SQLite store. Values are plain strings (serialized JSON)
+so every backend can store any pydantic object through `model_dump_json`.
+
+Every value is stored with its expiry, a value stored without ttl never expires. A hit in a
+slow tier is promoted to the faster tiers with the time it has left, not a new ttl.
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# writes between two purges of the expired entries of a SQLite tier
+EXPIRED_PURGE_INTERVAL = 256
+# share of max_size_bytes a full SQLite tier is evicted down to, so it is not evicted on every write
+EVICTION_TARGET_RATIO = 0.9
+
+def make_cache_key(*parts: Any) -> str:
+    """Hash the given parts into a stable cache key.
+
+    Args:
+        *parts (Any): JSON serializable parts identifying the cached value.
+
+    Returns:
+        str: sha256 hex digest of the parts.
+    """
+    serialized_parts = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(serialized_parts.encode("utf-8")).hexdigest()
+
+class CacheStats:
+    """Thread safe hit/miss counters of a cache."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, int] = {"hits": 0, "misses": 0, "writes": 0, "bypassed": 0}
+
+    def increment(self, counter: str, value: int = 1):
+        with self._lock:
+            self._counters[counter] = self._counters.get(counter, 0) + value
+
+    def as_dict(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._counters)
+
+class CacheBackend(ABC):
+    """A storage tier of a cache."""
+
+    name: str = "backend"
+
+    @abstractmethod
+    def get_entry(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        """Get the value stored under the key and its expiry timestamp (None if it never expires),
+        or None if it is missing or expired."""
+
+    def get(self, key: str) -> Optional[str]:
+        """Get the value stored under the key or None if it is missing or expired."""
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    @abstractmethod
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        """Store the value under the key, forever when ttl is None."""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove the value stored under the key, if any."""
+
+class LRUCacheBackend(CacheBackend):
+    """In-memory tier keeping the most recently used entries.
+
+    Args:
+        max_entries (int): Maximum number of entries kept in memory.
+    """
+    name = "memory"
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple[str, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_entry(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        expires_at = time.time() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+class SQLiteCacheBackend(CacheBackend):
+    """Persistent tier stored in a SQLite file with TTL and size based eviction.
+
+    The size of the stored values is tracked on every write. When it exceeds max_size_bytes
+    the expired entries are purged and the least recently accessed entries are evicted until
+    the values fit in EVICTION_TARGET_RATIO of it. Expired entries are also purged every
+    EXPIRED_PURGE_INTERVAL writes.
+
+    Args:
+        path (str): Path of the SQLite file.
+        max_size_bytes (int): Maximum total size of the stored values.
+        table (str): Name of the table, to share one file between several caches.
+    """
+    name = "disk"
+
+    def __init__(self,
+                 path: str,
+                 max_size_bytes: int = 256 * 1024 * 1024,
+                 table: str = "cache"):
+        self.path = path
+        self.max_size_bytes = max_size_bytes
+        self.table = table
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            f"CREATE TABLE IF NOT EXISTS {table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL, last_access REAL NOT NULL)"
+        )
+        self._connection.execute(f"CREATE INDEX IF NOT EXISTS {table}_last_access ON {table} (last_access)")
+        self._total_size = self._get_total_size()
+        self._writes = 0
+
+    def get_entry(self, key: str) -> Optional[Tuple[str, Optional[float]]]:
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                f"SELECT value, expires_at, size FROM {self.table} WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at, size = row
+            if expires_at is not None and expires_at <= now:
+                self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._total_size -= size
+                return None
+            self._connection.execute(f"UPDATE {self.table} SET last_access = ? WHERE key = ?", (now, key))
+            return value, expires_at
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        now = time.time()
+        expires_at = now + ttl if ttl is not None else None
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            previous_size = self._get_size(key)
+            self._connection.execute(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, expires_at, now)
+            )
+            self._total_size += size - previous_size
+            self._writes += 1
+            if self._total_size > self.max_size_bytes:
+                self._evict(now)
+            elif self._writes % EXPIRED_PURGE_INTERVAL == 0:
+                self._purge_expired(now)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._total_size -= self._get_size(key)
+            self._connection.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+
+    def _get_size(self, key: str) -> int:
+        row = self._connection.execute(f"SELECT size FROM {self.table} WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else 0
+
+    def _get_total_size(self) -> int:
+        return self._connection.execute(f"SELECT COALESCE(SUM(size), 0) FROM {self.table}").fetchone()[0]
+
+    def _purge_expired(self, now: float):
+        self._connection.execute(
+            f"DELETE FROM {self.table} WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,)
+        )
+        self._total_size = self._get_total_size()
+
+    def _evict(self, now: float):
+        # the total is recomputed here, other processes may share the file
+        self._purge_expired(now)
+        target_size = self.max_size_bytes * EVICTION_TARGET_RATIO
+        if self._total_size <= self.max_size_bytes:
+            return
+        rows = self._connection.execute(f"SELECT key, size FROM {self.table} ORDER BY last_access ASC").fetchall()
+        evicted_keys = []
+        for key, size in rows:
+            if self._total_size <= target_size:
+                break
+            evicted_keys.append((key,))
+            self._total_size -= size
+        self._connection.executemany(f"DELETE FROM {self.table} WHERE key = ?", evicted_keys)
+        logger.info(f"Evicted {len(evicted_keys)} entries from the {self.table} cache")
+
+class TieredCache:
+    """Cache looking up its backends in order and promoting hits to the faster tiers.
+
+    Args:
+        backends (List[CacheBackend]): Tiers from the fastest to the slowest.
+    """
+
+    def __init__(self, backends: List[CacheBackend]):
+        self.backends = backends
+        self.stats = CacheStats()
+
+    def get(self, key: str) -> Optional[str]:
+        for i, backend in enumerate(self.backends):
+            entry = backend.get_entry(key)
+            if entry is not None:
+                value, expires_at = entry
+                self.stats.increment("hits")
+                self.stats.increment(f"{backend.name}_hits")
+                ttl = expires_at - time.time() if expires_at is not None else None
+                if ttl is None or ttl > 0:
+                    for faster_backend in self.backends[:i]:
+                        faster_backend.set(key, value, ttl)
+                return value
+        self.stats.increment("misses")
+        return None
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None):
+        """Store the value in every tier, forever when ttl is None."""
+        for backend in self.backends:
+            backend.set(key, value, ttl)
+        self.stats.increment("writes")
+
+    def delete(self, key: str):
+        """Remove the value from every tier."""
+        for backend in self.backends:
+            backend.delete(key)
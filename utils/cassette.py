@@ -0,0 +1,200 @@
+"""
+Record and replay of the provider calls, for deterministic benchmarks on real workloads.
+
+With CASSETTE_MODE=record, every LLM, search and slide call that reaches its provider (the
+cache hits do not) is appended to CASSETTE_PATH with its request, its response and its
+latency. With CASSETTE_MODE=replay, the calls are served from the cassette instead, after
+sleeping their recorded latency scaled by CASSETTE_LATENCY_SCALE, so caching, truncation
+and scheduling changes can be compared offline on the same traffic.
+
+A replayed call is matched on its exact request first. Changes to the prompts (truncation,
+new templates) alter the requests, so a call without an exact match is served the recorded
+calls of the same kind and step in their recorded order. Recordings are reused round-robin
+once all of them were served, so a single recorded run can feed many concurrent requests.
+"""
+from functools import lru_cache
+from utils.cache_utils import make_cache_key
+from utils.config import get_settings
+from utils.tracing import set_span_attributes
+from typing import Any, Awaitable, Callable, Dict, List, Tuple, TypeVar
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+CASSETTE_LOCK = threading.Lock()
+
+class CassetteMissError(LookupError):
+    """No recorded call matches a replayed call."""
+
+class Cassette:
+    """Recorded calls of a cassette file.
+
+    Args:
+        path (str): JSON lines file of the recorded calls.
+        mode (str): off, record or replay.
+        latency_scale (float): Factor applied to the recorded latencies on replay.
+    """
+
+    def __init__(self, path: str, mode: str = "off", latency_scale: float = 1.0):
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._by_request: Dict[str, List[Dict[str, Any]]] = {}
+        self._by_step: Dict[str, List[Dict[str, Any]]] = {}
+        self._served: Dict[str, int] = {}
+        self._counters: Dict[str, int] = {}
+        if mode == "replay":
+            self.load()
+
+    @staticmethod
+    def request_key(kind: str, request: Dict[str, Any]) -> str:
+        return make_cache_key(kind, request)
+
+    @staticmethod
+    def step_key(kind: str, request: Dict[str, Any]) -> str:
+        return f"{kind}:{request.get('step') or ''}"
+
+    def load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"Cassette {self.path} not found, record it with CASSETTE_MODE=record")
+        with open(self.path) as cassette_file:
+            for line in cassette_file:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                self._by_request.setdefault(entry["key"], []).append(entry)
+                self._by_step.setdefault(self.step_key(entry["kind"], entry["request"]), []).append(entry)
+        logger.info(f"Loaded {sum(len(entries) for entries in self._by_request.values())} calls from the cassette {self.path}")
+
+    def record(self, kind: str, request: Dict[str, Any], response: Any, latency: float):
+        """Append a call to the cassette file.
+
+        Args:
+            kind (str): llm, search or slides
+            request (Dict[str, Any]): JSON serializable inputs of the call
+            response (Any): JSON serializable response of the call
+            latency (float): seconds the call took
+        """
+        entry = {"kind": kind,
+                 "key": self.request_key(kind, request),
+                 "request": request,
+                 "response": response,
+                 "latency": latency,
+                 "recorded_at": time.time()}
+        line = json.dumps(entry, default= str, ensure_ascii= False)
+        with self._lock:
+            self.increment(f"{kind}_recorded")
+            with open(self.path, "a") as cassette_file:
+                cassette_file.write(line + "\n")
+
+    def find(self, kind: str, request: Dict[str, Any]) -> Tuple[Any, float]:
+        """Get the recorded response of a call.
+
+        Args:
+            kind (str): llm, search or slides
+            request (Dict[str, Any]): inputs of the call
+
+        Raises:
+            CassetteMissError: no call of the same request, or of the same kind and step, was recorded
+
+        Returns:
+            Tuple[Any, float]: recorded response and the latency to replay, scaled
+        """
+        for key, index in ((self.request_key(kind, request), self._by_request),
+                           (self.step_key(kind, request), self._by_step)):
+            entries = index.get(key)
+            if entries:
+                with self._lock:
+                    served = self._served.get(key, 0)
+                    self._served[key] = served + 1
+                    self.increment(f"{kind}_replayed")
+                    if index is self._by_step:
+                        self.increment(f"{kind}_unmatched")
+                entry = entries[served % len(entries)]
+                if index is self._by_step:
+                    logger.debug(f"No recorded {kind} call with the same request, replaying the next {key} call")
+                return entry["response"], entry["latency"] * self.latency_scale
+        raise CassetteMissError(f"No recorded {kind} call for step {request.get('step')!r} in {self.path}")
+
+    def increment(self, counter: str):
+        self._counters[counter] = self._counters.get(counter, 0) + 1
+
+    def stats(self) -> Dict[str, int]:
+        """Calls recorded and replayed by kind, the replays without an exact match counted as unmatched."""
+        with self._lock:
+            return dict(self._counters)
+
+    def reset_stats(self):
+        with self._lock:
+            self._counters.clear()
+
+def get_cassette() -> Cassette:
+    """Get the process wide cassette.
+
+    Returns:
+        Cassette: cassette configured by CASSETTE_MODE, CASSETTE_PATH and CASSETTE_LATENCY_SCALE.
+    """
+    with CASSETTE_LOCK:
+        return build_cassette()
+
+@lru_cache
+def build_cassette() -> Cassette:
+    settings = get_settings()
+    return Cassette(path= settings.cassette_path,
+                    mode= settings.cassette_mode,
+                    latency_scale= settings.cassette_latency_scale)
+
+def cassette_call(kind: str,
+                  request: Dict[str, Any],
+                  function: Callable[[], T],
+                  dump: Callable[[T], Any],
+                  load: Callable[[Any], T]) -> T:
+    """Make a provider call through the cassette.
+
+    Args:
+        kind (str): llm, search or slides
+        request (Dict[str, Any]): JSON serializable inputs identifying the call, with its step if any
+        function (Callable[[], T]): makes the call
+        dump (Callable[[T], Any]): converts the response to JSON serializable data
+        load (Callable[[Any], T]): converts the recorded data back to a response
+
+    Returns:
+        T: the response of the provider, or the recorded response when replaying
+    """
+    cassette = get_cassette()
+    if cassette.mode == "replay":
+        response, latency = cassette.find(kind, request)
+        set_span_attributes(cassette= "replay")
+        time.sleep(latency)
+        return load(response)
+    start = time.perf_counter()
+    result = function()
+    if cassette.mode == "record":
+        cassette.record(kind, request, dump(result), time.perf_counter() - start)
+    return result
+
+async def cassette_call_async(kind: str,
+                              request: Dict[str, Any],
+                              function: Callable[[], Awaitable[T]],
+                              dump: Callable[[T], Any],
+                              load: Callable[[Any], T]) -> T:
+    """Make a provider call through the cassette without blocking the event loop, see `cassette_call`."""
+    cassette = get_cassette()
+    if cassette.mode == "replay":
+        response, latency = cassette.find(kind, request)
+        set_span_attributes(cassette= "replay")
+        await asyncio.sleep(latency)
+        return load(response)
+    start = time.perf_counter()
+    result = await function()
+    if cassette.mode == "record":
+        await asyncio.to_thread(cassette.record, kind, request, dump(result), time.perf_counter() - start)
+    return result
@@ -0,0 +1,405 @@
+"""
+Centralized runtime settings of the benchmarking pipeline.
+
+Every setting can be overridden through an environment variable of the same name
+in upper case (e.g. SEARCH_MAX_CONCURRENCY=8). The environment is read on first
+access so values loaded from a `.env` file by the routers are taken into account.
+"""
+from functools import lru_cache
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Literal, Optional
+import json
+import os
+
+class PipelineSettings(BaseModel):
+    """Tunable knobs of the pipeline.
+
+    Attributes:
+        executor_max_workers (int): Maximum number of threads running the fan-out of all the requests.
+        pipeline_mode (str): Run the preprocessing, the search and the analysis as stages waiting for
+            every question, or as independent chains per question joined only for the report.
+        http_max_connections (int, optional): Connections of every pooled HTTP client, sized to the
+            concurrency calling each destination when not set.
+        http_async_max_connections (int): Connections of the pooled asynchronous HTTP clients of the
+            LLM providers and Linkup when HTTP_MAX_CONNECTIONS is not set.
+        http_keepalive_expiry (float): Seconds an idle connection is kept open.
+        http2_enabled (bool): Negotiate HTTP/2 when the h2 package is installed.
+        http_connect_timeout (float): Seconds to open a connection to any destination.
+        llm_read_timeout (float): Seconds to wait for a response of Cerebras or SambaNova.
+        search_read_timeout (float): Seconds to wait for a response of Linkup.
+        slides_read_timeout (float): Seconds to wait for a response of the slide generation service.
+        linkup_base_url (str): Base URL of the Linkup API.
+        slides_url (str): Presentation generation endpoint of the slide generation service.
+        retry_max_attempts (int): Attempts of an LLM or search call failing with a transient error.
+        retry_base_delay (float): Seconds of the backoff before the first retry, doubled on every retry.
+        retry_max_delay (float): Cap of the backoff in seconds.
+        retry_budget_ratio (float): Retries allowed per call to a destination, so an outage does not
+            multiply the load.
+        llm_timeout (float): Seconds an LLM call may take when its step has no timeout of its own.
+        llm_step_timeouts (Dict[str, float]): Seconds an LLM call of each step may take.
+        llm_providers (List[str]): LLM providers calls are routed to, among cerebras and sambanova.
+        llm_provider_base_urls (Dict[str, str]): Base URL of the providers, e.g. local OpenAI compatible stubs.
+        llm_model_equivalents (Dict[str, Dict[str, str]]): Model served by each provider for a requested
+            model, added to the built-in equivalents, JSON in the environment.
+        llm_router_failure_threshold (int): Consecutive failures after which a provider is skipped.
+        llm_router_cooldown (float): Seconds a failing provider is skipped.
+        llm_router_latency_alpha (float): Weight of the last call in the rolling latency and error rate.
+        rate_limit_enabled (bool): Wait for the rate limits of the providers before calling them.
+        rate_limit_rpm (Dict[str, float]): Requests per minute admitted by provider or provider/model.
+        rate_limit_tpm (Dict[str, float]): Tokens per minute admitted by provider or provider/model.
+        rate_limit_burst_seconds (float): Seconds of the rate limits admitted at once after an idle period.
+        search_strategy (str): Run the Linkup searches concurrently or one after another.
+        search_max_concurrency (int): Maximum number of Linkup searches in flight per request.
+        search_timeout (float): Seconds a single Linkup search may run before it is abandoned.
+        preprocessing_mode (str): Extract the search dates and the enhanced query with separate calls,
+            a fused call per question or a single batched call for all the questions of a request.
+        exploration_mode (str): Explore the next questions of an iteration one after another, each
+            followed by a report update, or all at once followed by a single merged report update.
+        report_update_mode (str): Rewrite the whole report on every update or ask the model for
+            section level patches applied locally.
+        report_patch_context_chars (int): Characters of full section contents given to the model for patching.
+        report_patch_excerpt_chars (int): Characters of the excerpt of the other sections.
+        prompt_budget_ratio (float): Share of the model context window a prompt may use, the rest
+            is left for the completion.
+        prompt_max_tokens (int, optional): Cap on the prompt budget of every model.
+        llm_cache_enabled (bool): Reuse the responses of identical LLM calls.
+        llm_cache_memory_entries (int): Number of LLM responses kept in the in-memory tier.
+        llm_cache_path (str): SQLite file of the persistent LLM cache tier.
+        llm_cache_max_bytes (int): Maximum size of the persistent LLM cache tier.
+        llm_cache_ttl (float): Seconds a cached LLM response stays valid.
+        llm_cache_bypass_steps (List[str]): Steps that must always call the model.
+        search_cache_enabled (bool): Reuse the Linkup answers of identical searches.
+        search_cache_memory_entries (int): Number of search results kept in the in-memory tier.
+        search_cache_path (str): SQLite file of the persistent search cache tier.
+        search_cache_max_bytes (int): Maximum size of the persistent search cache tier.
+        search_cache_ttl (float): Seconds a cached search result stays valid when its date window
+            is still open, results of closed historical windows are kept until evicted.
+        stream_heartbeat_interval (float): Seconds without pipeline event after which the streaming
+            endpoint sends a keep-alive comment.
+        job_store_path (str): SQLite file persisting the background jobs.
+        tracing_enabled (bool): Trace the requests, their steps and their outbound calls.
+        tracing_export_path (str, optional): JSON lines file the traces are appended to, not rotated,
+            no file when not set.
+        tracing_otlp_endpoint (str, optional): Base URL of the OTLP/HTTP collector the traces are sent to.
+        job_max_concurrency (int): Maximum number of background jobs running at the same time.
+        warmup_enabled (bool): Build the clients and open the pooled connections on startup.
+        warmup_timeout (float): Seconds the startup waits for the warm-up.
+        warmup_connections (int): Connections opened per pooled client by the warm-up.
+        cassette_mode (str): Record the LLM, search and slide calls to the cassette, replay them from it
+            instead of calling the providers, or neither.
+        cassette_path (str): JSON lines file of the recorded calls.
+        cassette_latency_scale (float): Factor applied to the recorded latencies on replay, 0 to replay instantly.
+        structured_output_json_backend (str): JSON parser of the structured outputs, orjson when installed
+            or the parser of pydantic.
+        structured_output_repair_enabled (bool): Repair the truncated or malformed structured outputs locally
+            before calling the model again.
+        structured_output_max_recalls (int): Calls made again when a structured output can not be parsed
+            nor repaired, before the step falls back.
+        rule_based_dates_enabled (bool): Extract the search dates of the unambiguous queries with local rules,
+            only the ambiguous ones are sent to the LLM.
+    """
+    executor_max_workers: int = Field(
+        default=32, ge=1,
+        description="Maximum number of threads running the fan-out of all the requests"
+    )
+    pipeline_mode: Literal["staged", "chained"] = Field(
+        default="staged",
+        description="Run the question steps as stages or as independent chains per question"
+    )
+    http_max_connections: Optional[int] = Field(
+        default=None, ge=1,
+        description="Connections of every pooled HTTP client, sized to the concurrency when not set"
+    )
+    http_async_max_connections: int = Field(
+        default=100, ge=1,
+        description="Connections of the pooled asynchronous HTTP clients of the LLM providers and Linkup"
+    )
+    http_keepalive_expiry: float = Field(
+        default=60.0, ge=0,
+        description="Seconds an idle connection is kept open"
+    )
+    http2_enabled: bool = Field(
+        default=True,
+        description="Negotiate HTTP/2 when the h2 package is installed"
+    )
+    http_connect_timeout: float = Field(
+        default=10.0, gt=0,
+        description="Seconds to open a connection to any destination"
+    )
+    llm_read_timeout: float = Field(
+        default=180.0, gt=0,
+        description="Seconds to wait for a response of Cerebras or SambaNova"
+    )
+    search_read_timeout: float = Field(
+        default=180.0, gt=0,
+        description="Seconds to wait for a response of Linkup"
+    )
+    slides_read_timeout: float = Field(
+        default=600.0, gt=0,
+        description="Seconds to wait for a response of the slide generation service"
+    )
+    linkup_base_url: str = Field(
+        default="https://api.linkup.so/v1",
+        description="Base URL of the Linkup API"
+    )
+    slides_url: str = Field(
+        default="http://localhost:4000/api/v1/ppt/presentation/generate",
+        description="Presentation generation endpoint of the slide generation service"
+    )
+    retry_max_attempts: int = Field(
+        default=3, ge=1,
+        description="Attempts of an LLM or search call failing with a transient error"
+    )
+    retry_base_delay: float = Field(
+        default=0.5, ge=0,
+        description="Seconds of the backoff before the first retry"
+    )
+    retry_max_delay: float = Field(
+        default=8.0, ge=0,
+        description="Cap of the backoff in seconds"
+    )
+    retry_budget_ratio: float = Field(
+        default=0.2, ge=0,
+        description="Retries allowed per call to a destination"
+    )
+    llm_timeout: float = Field(
+        default=120.0, gt=0,
+        description="Seconds an LLM call may take when its step has no timeout of its own"
+    )
+    llm_step_timeouts: Dict[str, float] = Field(
+        default_factory=lambda: {"query_decomposition": 60.0,
+                                 "metadata_extraction": 30.0,
+                                 "query_processing": 30.0,
+                                 "query_preprocessing": 45.0,
+                                 "insight_analysis": 180.0,
+                                 "report_generation": 300.0,
+                                 "report_update": 300.0,
+                                 "next_questions": 60.0,
+                                 "slide_outline": 120.0,
+                                 "slide_content": 180.0},
+        description="Seconds an LLM call of each step may take, step=seconds comma separated in the environment"
+    )
+    llm_providers: List[Literal["cerebras", "sambanova"]] = Field(
+        default_factory=lambda: ["cerebras"],
+        min_length=1,
+        description="LLM providers calls are routed to, comma separated in the environment"
+    )
+    llm_provider_base_urls: Dict[str, str] = Field(
+        default_factory=dict,
+        description="Base URL of the providers, provider=url comma separated in the environment"
+    )
+    llm_model_equivalents: Dict[str, Dict[str, str]] = Field(
+        default_factory=dict,
+        description="Model served by each provider for a requested model, JSON in the environment"
+    )
+    llm_router_failure_threshold: int = Field(
+        default=3, ge=1,
+        description="Consecutive failures after which a provider is skipped"
+    )
+    llm_router_cooldown: float = Field(
+        default=30.0, ge=0,
+        description="Seconds a failing provider is skipped"
+    )
+    llm_router_latency_alpha: float = Field(
+        default=0.2, gt=0, le=1,
+        description="Weight of the last call in the rolling latency and error rate"
+    )
+    rate_limit_enabled: bool = Field(
+        default=True,
+        description="Wait for the rate limits of the providers before calling them"
+    )
+    rate_limit_rpm: Dict[str, float] = Field(
+        default_factory=lambda: {"cerebras": 900.0, "sambanova": 480.0, "linkup": 600.0},
+        description="Requests per minute admitted by provider or provider/model, key=rpm comma separated in the environment"
+    )
+    rate_limit_tpm: Dict[str, float] = Field(
+        default_factory=lambda: {"cerebras": 1000000.0},
+        description="Tokens per minute admitted by provider or provider/model, key=tpm comma separated in the environment"
+    )
+    rate_limit_burst_seconds: float = Field(
+        default=10.0, gt=0,
+        description="Seconds of the rate limits admitted at once after an idle period"
+    )
+    search_strategy: Literal["concurrent", "sequential"] = Field(
+        default="concurrent",
+        description="Run the Linkup searches concurrently or one after another"
+    )
+    search_max_concurrency: int = Field(
+        default=5, ge=1,
+        description="Maximum number of Linkup searches in flight per request"
+    )
+    search_timeout: float = Field(
+        default=120.0, gt=0,
+        description="Seconds a single Linkup search may run before it is abandoned"
+    )
+    preprocessing_mode: Literal["separate", "fused", "batched"] = Field(
+        default="separate",
+        description="Number of LLM calls used to prepare the questions for search"
+    )
+    exploration_mode: Literal["sequential", "parallel"] = Field(
+        default="sequential",
+        description="Explore the next questions one after another or all at once with a single report update"
+    )
+    report_update_mode: Literal["rewrite", "patch"] = Field(
+        default="rewrite",
+        description="Rewrite the whole report on every update or patch its sections"
+    )
+    report_patch_context_chars: int = Field(
+        default=12000, ge=0,
+        description="Characters of full section contents given to the model for patching"
+    )
+    report_patch_excerpt_chars: int = Field(
+        default=300, ge=0,
+        description="Characters of the excerpt of the sections not given in full"
+    )
+    prompt_budget_ratio: float = Field(
+        default=0.6, gt=0, le=1,
+        description="Share of the model context window a prompt may use"
+    )
+    prompt_max_tokens: Optional[int] = Field(
+        default=None, gt=0,
+        description="Cap on the prompt budget of every model"
+    )
+    llm_cache_enabled: bool = Field(
+        default=True,
+        description="Reuse the responses of identical LLM calls"
+    )
+    llm_cache_memory_entries: int = Field(
+        default=512, ge=0,
+        description="Number of LLM responses kept in the in-memory tier"
+    )
+    llm_cache_path: str = Field(
+        default=".cache/llm_cache.sqlite",
+        description="SQLite file of the persistent LLM cache tier"
+    )
+    llm_cache_max_bytes: int = Field(
+        default=256 * 1024 * 1024, ge=0,
+        description="Maximum size of the persistent LLM cache tier"
+    )
+    llm_cache_ttl: float = Field(
+        default=7 * 24 * 3600, gt=0,
+        description="Seconds a cached LLM response stays valid"
+    )
+    llm_cache_bypass_steps: List[str] = Field(
+        default_factory=list,
+        description="Steps that must always call the model, comma separated in the environment"
+    )
+
+    search_cache_enabled: bool = Field(
+        default=True,
+        description="Reuse the Linkup answers of identical searches"
+    )
+    search_cache_memory_entries: int = Field(
+        default=256, ge=0,
+        description="Number of search results kept in the in-memory tier"
+    )
+    search_cache_path: str = Field(
+        default=".cache/search_cache.sqlite",
+        description="SQLite file of the persistent search cache tier"
+    )
+    search_cache_max_bytes: int = Field(
+        default=128 * 1024 * 1024, ge=0,
+        description="Maximum size of the persistent search cache tier"
+    )
+    search_cache_ttl: float = Field(
+        default=24 * 3600, gt=0,
+        description="Seconds a cached search result of an open date window stays valid"
+    )
+    stream_heartbeat_interval: float = Field(
+        default=10.0, gt=0,
+        description="Seconds without pipeline event before a keep-alive comment is streamed"
+    )
+    job_store_path: str = Field(
+        default=".cache/jobs.sqlite",
+        description="SQLite file persisting the background jobs"
+    )
+    tracing_enabled: bool = Field(
+        default=True,
+        description="Trace the requests, their steps and their outbound calls"
+    )
+    tracing_export_path: Optional[str] = Field(
+        default=None,
+        description="JSON lines file the traces are appended to, not rotated, no file if not set"
+    )
+    tracing_otlp_endpoint: Optional[str] = Field(
+        default=None,
+        description="Base URL of the OTLP/HTTP collector the traces are sent to"
+    )
+    job_max_concurrency: int = Field(
+        default=4, ge=1,
+        description="Maximum number of background jobs running at the same time"
+    )
+    warmup_enabled: bool = Field(
+        default=True,
+        description="Build the clients and open the pooled connections on startup"
+    )
+    warmup_timeout: float = Field(
+        default=5.0, gt=0,
+        description="Seconds the startup waits for the warm-up"
+    )
+    warmup_connections: int = Field(
+        default=1, ge=1,
+        description="Connections opened per pooled client by the warm-up"
+    )
+    cassette_mode: Literal["off", "record", "replay"] = Field(
+        default="off",
+        description="Record the provider calls to the cassette or replay them from it"
+    )
+    cassette_path: str = Field(
+        default="cassette.jsonl",
+        description="JSON lines file of the recorded calls"
+    )
+    cassette_latency_scale: float = Field(
+        default=1.0, ge=0,
+        description="Factor applied to the recorded latencies on replay"
+    )
+    structured_output_json_backend: Literal["pydantic", "orjson"] = Field(
+        default="pydantic",
+        description="JSON parser of the structured outputs"
+    )
+    structured_output_repair_enabled: bool = Field(
+        default=True,
+        description="Repair the truncated or malformed structured outputs before calling the model again"
+    )
+    structured_output_max_recalls: int = Field(
+        default=1, ge=0,
+        description="Calls made again when a structured output can not be parsed nor repaired"
+    )
+    rule_based_dates_enabled: bool = Field(
+        default=True,
+        description="Extract the search dates of the unambiguous queries with local rules"
+    )
+
+    @field_validator("llm_cache_bypass_steps", "llm_providers", mode="before")
+    @classmethod
+    def split_comma_separated(cls, value):
+        if isinstance(value, str):
+            return [item.strip() for item in value.split(",") if item.strip()]
+        return value
+
+    @field_validator("llm_step_timeouts", "llm_provider_base_urls", "rate_limit_rpm", "rate_limit_tpm", mode="before")
+    @classmethod
+    def split_key_values(cls, value):
+        if isinstance(value, str):
+            key_values = dict(item.split("=", 1) for item in value.split(",") if item.strip())
+            return {key.strip(): key_value.strip() for key, key_value in key_values.items()}
+        return value
+
+    @field_validator("llm_model_equivalents", mode="before")
+    @classmethod
+    def parse_json(cls, value):
+        if isinstance(value, str):
+            return json.loads(value)
+        return value
+
+@lru_cache
+def get_settings() -> PipelineSettings:
+    """Get the pipeline settings, overridden by the matching environment variables.
+
+    Returns:
+        PipelineSettings: The pipeline settings.
+    """
+    env_values = {field: os.environ[field.upper()] 
+                  for field in PipelineSettings.model_fields 
+                  if field.upper() in os.environ}
+    return PipelineSettings(**env_values)
@@ -0,0 +1,194 @@
+"""
+Rule based extraction of the search dates of a query, ahead of the LLM metadata extraction.
+
+Most questions carry no temporal expression, and the common ones ("in 2024", "March 2023",
+"Q1 2024", "last quarter", "since March 2023", "past 6 months", "between 2021 and 2023") are
+resolved deterministically relative to the date of the request. A query with a temporal
+expression the rules do not understand (e.g. "2024 models", "3 years ago", "next month") is
+ambiguous: `parse_search_dates` returns None and the step asks the LLM as before.
+
+Vague recency words (latest, recent, current, today's) do not specify a period, the
+extraction prompt only asks for the periods given by the user, so they are not temporal
+expressions here either.
+"""
+from calendar import monthrange
+from datetime import date, timedelta
+from typing import Callable, List, Optional, Tuple
+import re
+
+Period = Tuple[Optional[date], Optional[date]]
+
+MONTHS = {"january": 1, "february": 2, "march": 3, "april": 4, "may": 5, "june": 6, "july": 7,
+          "august": 8, "september": 9, "october": 10, "november": 11, "december": 12,
+          "jan": 1, "feb": 2, "mar": 3, "apr": 4, "jun": 6, "jul": 7, "aug": 8, "sep": 9, "sept": 9,
+          "oct": 10, "nov": 11, "dec": 12}
+NUMBER_WORDS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+                "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12}
+ORDINALS = {"first": 1, "1st": 1, "second": 2, "2nd": 2, "third": 3, "3rd": 3, "fourth": 4, "4th": 4}
+UNIT_MONTHS = {"month": 1, "quarter": 3, "year": 12, "decade": 120}
+
+YEAR = r"(?:19|20)\d{2}"
+BEFORE_NUMBER = r"(?<![\w.$/-])"
+AFTER_NUMBER = r"(?![\w%]|\.\d)"
+MONTH = r"(?:" + "|".join(sorted(MONTHS, key= len, reverse= True)) + r")\.?"
+ISO_DATE = rf"{YEAR}-\d{{2}}-\d{{2}}"
+MONTH_YEAR = rf"{MONTH}\s+(?:of\s+)?{YEAR}"
+PART_YEAR = rf"(?:q[1-4]|h[12]|(?:{'|'.join(ORDINALS)}|last)\s+(?:quarter|half))\s+(?:of\s+)?{YEAR}"
+TIME_POINT = rf"(?:{ISO_DATE}|{MONTH_YEAR}|{PART_YEAR}|{YEAR}){AFTER_NUMBER}"
+# a year after a preposition is a period when nothing follows it, "of 2000 tokens" is not
+YEAR_END = r"(?=\s*$|\s*[,.;:!?)]|\s+(?:and|or|to|vs|versus|compared|in|on|for|with|by|from|the|a|an)\b)"
+MAX_YEARS_AHEAD = 5
+COUNT = rf"(?:\d{{1,3}}|{'|'.join(NUMBER_WORDS)})"
+UNIT = r"(?:day|week|month|quarter|year|decade)"
+LEAD = r"(?:(?:in|over|during|within|for|throughout)\s+)?"
+
+RANGE_PATTERN = re.compile(rf"(?:(?:between|from)\s+)?{BEFORE_NUMBER}(?P<start>{TIME_POINT})\s*(?:and|to|through|until|till|-|–)\s*(?P<end>{TIME_POINT})")
+SINCE_PATTERN = re.compile(rf"\b(?P<keyword>since|starting(?:\s+in|\s+from)?|after)\s+(?:the\s+(?:start|beginning)\s+of\s+)?{BEFORE_NUMBER}(?P<point>{TIME_POINT})"
+                           r"(?:\s+(?:on|onwards?|forward))?")
+# "from 2024" alone is the year 2024, "from 2024 onwards" an open window
+FROM_ON_PATTERN = re.compile(rf"\b(?P<keyword>from)\s+{BEFORE_NUMBER}(?P<point>{TIME_POINT})\s+(?:on|onwards?|forward|to\s+(?:now|today|date|the\s+present))\b")
+UNTIL_PATTERN = re.compile(rf"\b(?P<keyword>until|till|through|up\s+to|by|before|prior\s+to)\s+(?:the\s+end\s+of\s+)?{BEFORE_NUMBER}(?P<point>{TIME_POINT})")
+EXPLICIT_PERIOD_PATTERN = re.compile(rf"{BEFORE_NUMBER}(?:(?:in|of|from|during|for|throughout|on)\s+(?:the\s+)?)?(?P<point>(?:{ISO_DATE}|{MONTH_YEAR}|{PART_YEAR}){AFTER_NUMBER})")
+YEAR_PATTERN = re.compile(rf"\b(?:in|of|from|during|for|throughout|within)\s+(?:the\s+year\s+)?(?P<point>{BEFORE_NUMBER}{YEAR}{AFTER_NUMBER}){YEAR_END}")
+ROLLING_PATTERN = re.compile(rf"\b{LEAD}(?:the\s+)?(?:last|past|previous|recent)\s+(?P<count>{COUNT})\s+(?P<unit>{UNIT})s?\b")
+RELATIVE_PATTERN = re.compile(rf"\b{LEAD}(?P<the>the\s+)?(?P<which>last|past|previous|this|current)\s+(?P<unit>{UNIT})\b")
+YEAR_TO_DATE_PATTERN = re.compile(r"\b(?:year[\s-]to[\s-]date|ytd)\b")
+
+# temporal expressions left once the known ones are removed make the query ambiguous
+TEMPORAL_SIGNAL_PATTERN = re.compile(rf"{BEFORE_NUMBER}{YEAR}{AFTER_NUMBER}"
+                                     rf"|\b(?:{'|'.join(month for month in MONTHS if month != 'may')})\b"
+                                     rf"|\bmay\s+\d"
+                                     rf"|\b{UNIT}s?\b"
+                                     r"|\b(?:today|yesterday|tomorrow|tonight|ago|q[1-4]|h[12]|fy\d{2,4}|spring|summer|autumn|winter|weekend)\b")
+
+def shift_months(day: date, months: int) -> date:
+    """Move a date by a number of months, clamped to the last day of the target month."""
+    year, month = divmod(day.year * 12 + day.month - 1 + months, 12)
+    return date(year, month + 1, min(day.day, monthrange(year, month + 1)[1]))
+
+def month_period(year: int, month: int, months: int = 1) -> Tuple[date, date]:
+    start = date(year, month, 1)
+    return start, shift_months(start, months) - timedelta(days= 1)
+
+def parse_time_point(text: str) -> Tuple[date, date]:
+    """First and last day of a time point: an ISO date, a month, a quarter, a half or a year."""
+    text = " ".join(text.replace(".", " ").split())
+    if re.fullmatch(ISO_DATE, text):
+        day = date.fromisoformat(text)
+        return day, day
+    year = int(text[-4:])
+    words = text[:-4].replace(" of", "").split()
+    if not words:
+        return date(year, 1, 1), date(year, 12, 31)
+    if words[0] in MONTHS:
+        return month_period(year, MONTHS[words[0]])
+    if words[0][0] in "qh" and words[0][1:].isdigit():
+        part, number = words[0][0], int(words[0][1:])
+    else:
+        part = "q" if words[1] == "quarter" else "h"
+        number = ORDINALS.get(words[0]) or (4 if part == "q" else 2)
+    months = 3 if part == "q" else 6
+    return month_period(year, (number - 1) * months + 1, months)
+
+def period_start(current_date: date, unit: str) -> date:
+    """First day of the calendar day, week, month, quarter, year or decade of a date."""
+    if unit == "day":
+        return current_date
+    if unit == "week":
+        return current_date - timedelta(days= current_date.weekday())
+    if unit == "month":
+        return current_date.replace(day= 1)
+    if unit == "quarter":
+        return date(current_date.year, (current_date.month - 1) // 3 * 3 + 1, 1)
+    if unit == "year":
+        return date(current_date.year, 1, 1)
+    return date(current_date.year // 10 * 10, 1, 1)
+
+def rolling_period(current_date: date, count: int, unit: str) -> Period:
+    if unit in ("day", "week"):
+        return current_date - timedelta(days= count * (7 if unit == "week" else 1)), current_date
+    return shift_months(current_date, -count * UNIT_MONTHS[unit]), current_date
+
+def parse_range(match: re.Match, current_date: date) -> Period:
+    return parse_time_point(match["start"])[0], parse_time_point(match["end"])[1]
+
+def parse_since(match: re.Match, current_date: date) -> Period:
+    start, end = parse_time_point(match["point"])
+    return (end + timedelta(days= 1) if match["keyword"] == "after" else start), None
+
+def parse_until(match: re.Match, current_date: date) -> Period:
+    start, end = parse_time_point(match["point"])
+    return None, (start - timedelta(days= 1) if match["keyword"] == "before" or match["keyword"].startswith("prior") else end)
+
+def parse_explicit_period(match: re.Match, current_date: date) -> Period:
+    return parse_time_point(match["point"])
+
+def parse_rolling(match: re.Match, current_date: date) -> Period:
+    count = match["count"]
+    return rolling_period(current_date, int(count) if count.isdigit() else NUMBER_WORDS[count], match["unit"])
+
+def parse_relative(match: re.Match, current_date: date) -> Period:
+    which, unit = match["which"], match["unit"]
+    if which in ("this", "current"):
+        return period_start(current_date, unit), current_date
+    if which == "past" or unit == "decade" or match["the"]:
+        return rolling_period(current_date, 1, unit)
+    # last and previous name the calendar period before the current one, "the last year" the 12 last months
+    start = period_start(current_date, unit)
+    if unit in ("day", "week"):
+        previous_start = start - timedelta(days= 7 if unit == "week" else 1)
+    else:
+        previous_start = shift_months(start, -UNIT_MONTHS[unit])
+    return previous_start, start - timedelta(days= 1)
+
+def parse_year_to_date(match: re.Match, current_date: date) -> Period:
+    return date(current_date.year, 1, 1), current_date
+
+RULES: List[Tuple[re.Pattern, Callable[[re.Match, date], Period]]] = [
+    (RANGE_PATTERN, parse_range),
+    (SINCE_PATTERN, parse_since),
+    (FROM_ON_PATTERN, parse_since),
+    (UNTIL_PATTERN, parse_until),
+    (EXPLICIT_PERIOD_PATTERN, parse_explicit_period),
+    (YEAR_PATTERN, parse_explicit_period),
+    (ROLLING_PATTERN, parse_rolling),
+    (RELATIVE_PATTERN, parse_relative),
+    (YEAR_TO_DATE_PATTERN, parse_year_to_date),
+]
+
+def parse_search_dates(query: str, current_date: date) -> Optional[Period]:
+    """Extract the search window of a query without calling the LLM.
+
+    Args:
+        query (str): question to be searched
+        current_date (date): date of the request, the relative expressions are resolved against it
+
+    Returns:
+        Optional[Period]: from and to dates, each None when open, or None when the query is
+            ambiguous and the LLM should extract its dates
+    """
+    text = query.lower()
+    periods = []
+    for pattern, parse in RULES:
+        match = pattern.search(text)
+        while match:
+            try:
+                periods.append(parse(match, current_date))
+            except ValueError:
+                # e.g. a 2024-02-30 date
+                return None
+            text = text[:match.start()] + " ; " + text[match.end():]
+            match = pattern.search(text)
+    if TEMPORAL_SIGNAL_PATTERN.search(text):
+        return None
+    if not periods:
+        return None, None
+    if any(day is not None and day.year > current_date.year + MAX_YEARS_AHEAD for period in periods for day in period):
+        # e.g. "from 2048 to 2096 tokens"
+        return None
+    if len(periods) > 1 and any(start is None or end is None for start, end in periods):
+        return None
+    if len(periods) == 1:
+        return periods[0]
+    # several closed periods (e.g. "2023 and 2024" compared) are searched as one window
+    return min(start for start, _ in periods), max(end for _, end in periods)
@@ -0,0 +1,268 @@
+"""
+Process wide bounded executor running the fan-out of every request.
+
+All the parallel LLM and search calls of the synchronous pipeline go through a single
+pool of worker threads capped by EXECUTOR_MAX_WORKERS instead of a new thread pool per
+call. Queued tasks are grouped by request and the workers pick the groups in turn, so a
+request fanning out to many questions cannot starve the others.
+
+A worker waiting on tasks it submitted itself (nested fan-out, e.g. an exploration
+running its searches) runs the queued ones in place instead of blocking, so the
+nested calls cannot deadlock the pool.
+"""
+from concurrent.futures import Future, wait, ALL_COMPLETED, FIRST_COMPLETED
+from contextvars import copy_context
+from collections import OrderedDict, deque
+from functools import lru_cache
+from utils.config import get_settings
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+import itertools
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+EXECUTOR_LOCK = threading.Lock()
+
+class _Batch:
+    """Tasks submitted together, sharing a concurrency limit."""
+
+    def __init__(self, max_concurrency: Optional[int] = None):
+        self.max_concurrency = max_concurrency
+        self.running = 0
+
+    def can_start(self) -> bool:
+        return self.max_concurrency is None or self.running < self.max_concurrency
+
+class _Task:
+    """A function call waiting for a worker."""
+
+    def __init__(self, function: Callable, args: Tuple, group: str, batch: _Batch):
+        self.function = function
+        self.args = args
+        self.group = group
+        self.batch = batch
+        self.future = Future()
+        self.queued_at = time.monotonic()
+        # the task runs in the context of its caller, e.g. under its tracing span
+        self.context = copy_context()
+
+class FairExecutor:
+    """Bounded thread pool scheduling the queued tasks of each group in turn.
+
+    Args:
+        max_workers (int): Maximum number of worker threads.
+        name (str): Prefix of the worker thread names.
+    """
+
+    def __init__(self, max_workers: int, name: str = "pipeline-executor"):
+        self.max_workers = max_workers
+        self.name = name
+        self._condition = threading.Condition()
+        self._groups: "OrderedDict[str, Deque[_Task]]" = OrderedDict()
+        self._workers: List[threading.Thread] = []
+        self._idle_workers = 0
+        self._running = 0
+        self._shutdown = False
+        self._local = threading.local()
+        self._counters: Dict[str, float] = {"submitted": 0, "completed": 0, "failed": 0,
+                                            "max_queue_depth": 0, "queue_wait_seconds": 0.0}
+        self._thread_counter = itertools.count()
+
+    def current_group(self) -> str:
+        """Get the group of the calling thread: the group of the task it runs or its own."""
+        return getattr(self._local, "group", None) or f"thread-{threading.get_ident()}"
+
+    def submit(self, function: Callable, *args, group: Optional[str] = None) -> Future:
+        """Queue a function call.
+
+        Args:
+            function (Callable): function to run
+            *args: arguments of the function
+            group (str, optional): request the call belongs to, the group of the caller by default
+
+        Returns:
+            Future: future of the result
+        """
+        return self.submit_batch(function, [args], group= group)[0]
+
+    def submit_batch(self,
+                     function: Callable,
+                     params: Iterable[Tuple],
+                     max_concurrency: Optional[int] = None,
+                     group: Optional[str] = None) -> List[Future]:
+        """Queue a function call per argument tuple.
+
+        Args:
+            function (Callable): function to run
+            params (Iterable[Tuple]): arguments of each call
+            max_concurrency (int, optional): maximum number of these calls running at the same time
+            group (str, optional): request the calls belong to, the group of the caller by default
+
+        Returns:
+            List[Future]: futures of the results in the order of the params
+        """
+        group = group or self.current_group()
+        batch = _Batch(max_concurrency)
+        tasks = [_Task(function, args, group, batch) for args in params]
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit tasks to an executor that was shut down")
+            self._groups.setdefault(group, deque()).extend(tasks)
+            self._counters["submitted"] += len(tasks)
+            queued = sum(len(group_tasks) for group_tasks in self._groups.values())
+            self._counters["max_queue_depth"] = max(self._counters["max_queue_depth"], queued)
+            self._spawn_workers(queued)
+            self._condition.notify_all()
+        return [task.future for task in tasks]
+
+    def map(self,
+            function: Callable,
+            params: Iterable[Tuple],
+            max_concurrency: Optional[int] = None,
+            group: Optional[str] = None) -> List[Any]:
+        """Run the function on every argument tuple and wait for the results.
+
+        Args:
+            function (Callable): function to run
+            params (Iterable[Tuple]): arguments of each call
+            max_concurrency (int, optional): maximum number of these calls running at the same time
+            group (str, optional): request the calls belong to, the group of the caller by default
+
+        Returns:
+            List[Any]: results in the order of the params, the first exception is raised
+        """
+        futures = self.submit_batch(function, params, max_concurrency= max_concurrency, group= group)
+        self.wait(futures)
+        return [future.result() for future in futures]
+
+    def wait(self,
+             futures: Iterable[Future],
+             timeout: Optional[float] = None,
+             return_when: str = ALL_COMPLETED) -> Tuple[Set[Future], Set[Future]]:
+        """Wait for futures of this executor like `concurrent.futures.wait`.
+
+        On a worker thread, the queued tasks of the awaited futures are run in place.
+        """
+        futures = set(futures)
+        if not getattr(self._local, "is_worker", False):
+            return wait(futures, timeout= timeout, return_when= return_when)
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        while True:
+            done = {future for future in futures if future.done()}
+            not_done = futures - done
+            if not not_done or (done and return_when == FIRST_COMPLETED):
+                return done, not_done
+            remaining = deadline - time.monotonic() if deadline is not None else None
+            if remaining is not None and remaining <= 0:
+                return done, not_done
+            with self._condition:
+                task = self._take_task(lambda task: task.future in not_done)
+            if task is not None:
+                self._run_task(task)
+            else:
+                wait(not_done, timeout= remaining, return_when= FIRST_COMPLETED)
+
+    def queue_depth(self) -> int:
+        with self._condition:
+            return sum(len(tasks) for tasks in self._groups.values())
+
+    def stats(self) -> Dict[str, Any]:
+        """Get the queue depth and the counters of the executor."""
+        with self._condition:
+            queued = sum(len(tasks) for tasks in self._groups.values())
+            started = self._counters["completed"] + self._counters["failed"] + self._running
+            return {"workers": len(self._workers),
+                    "max_workers": self.max_workers,
+                    "running": self._running,
+                    "queued": queued,
+                    "queued_groups": len(self._groups),
+                    "queue_depth_by_group": {group: len(tasks) for group, tasks in self._groups.items()},
+                    "submitted": int(self._counters["submitted"]),
+                    "completed": int(self._counters["completed"]),
+                    "failed": int(self._counters["failed"]),
+                    "max_queue_depth": int(self._counters["max_queue_depth"]),
+                    "avg_queue_wait_seconds": self._counters["queue_wait_seconds"] / started if started else 0.0}
+
+    def shutdown(self, wait: bool = True):
+        """Stop the workers once the queued tasks are done."""
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+            workers = list(self._workers)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def _spawn_workers(self, queued: int):
+        missing_workers = min(queued - self._idle_workers, self.max_workers - len(self._workers))
+        for _ in range(max(missing_workers, 0)):
+            worker = threading.Thread(target= self._worker,
+                                      name= f"{self.name}-{next(self._thread_counter)}",
+                                      daemon= True)
+            self._workers.append(worker)
+            worker.start()
+
+    def _take_task(self, accept: Callable[[_Task], bool] = lambda task: True) -> Optional[_Task]:
+        for group in list(self._groups):
+            tasks = self._groups[group]
+            for task in tasks:
+                if task.batch.can_start() and accept(task):
+                    tasks.remove(task)
+                    if tasks:
+                        self._groups.move_to_end(group)
+                    else:
+                        del self._groups[group]
+                    task.batch.running += 1
+                    self._running += 1
+                    self._counters["queue_wait_seconds"] += time.monotonic() - task.queued_at
+                    return task
+        return None
+
+    def _worker(self):
+        self._local.is_worker = True
+        while True:
+            with self._condition:
+                task = self._take_task()
+                while task is None:
+                    if self._shutdown and not self._groups:
+                        self._workers.remove(threading.current_thread())
+                        return
+                    self._idle_workers += 1
+                    self._condition.wait()
+                    self._idle_workers -= 1
+                    task = self._take_task()
+            self._run_task(task)
+
+    def _run_task(self, task: _Task):
+        previous_group = getattr(self._local, "group", None)
+        self._local.group = task.group
+        failed = False
+        try:
+            if task.future.set_running_or_notify_cancel():
+                try:
+                    task.future.set_result(task.context.run(task.function, *task.args))
+                except BaseException as e:
+                    failed = True
+                    task.future.set_exception(e)
+        finally:
+            self._local.group = previous_group
+            with self._condition:
+                task.batch.running -= 1
+                self._running -= 1
+                self._counters["failed" if failed else "completed"] += 1
+                self._condition.notify_all()
+
+def get_executor() -> FairExecutor:
+    """Get the process wide executor of the pipeline fan-out.
+
+    Returns:
+        FairExecutor: executor capped by the EXECUTOR_MAX_WORKERS setting.
+    """
+    with EXECUTOR_LOCK:
+        return build_executor()
+
+@lru_cache
+def build_executor() -> FairExecutor:
+    return FairExecutor(max_workers= get_settings().executor_max_workers)
@@ -0,0 +1,137 @@
+"""
+Shared HTTP transports of the clients calling Cerebras, SambaNova, Linkup and the slide service.
+
+Every destination gets one process wide connection pool, sized to the configured concurrency
+and kept alive between calls, with its own connect and read timeouts. The synchronous pools are
+sized to the threads calling the providers: the executor workers, and the request threads of
+the synchronous routes, which call some steps directly and run queued executor tasks in place.
+The asynchronous pools are sized to HTTP_ASYNC_MAX_CONNECTIONS since the coroutines are not
+bounded by any thread pool. A call waits for a free connection as long as for a response, the
+connections it waits for may be held by calls as long. HTTP/2 is used when the `h2` package is
+installed and HTTP2_ENABLED is set.
+
+The asynchronous clients are bound to the event loop of the application once they opened
+their first connection.
+"""
+from utils.config import get_settings
+from typing import Dict, Literal, Optional
+import httpx
+import importlib.util
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# threads of the default thread pool of Starlette, running the synchronous routes
+REQUEST_THREADS = 40
+
+HTTP_CLIENTS_LOCK = threading.Lock()
+HTTP_CLIENTS: Dict[str, httpx.Client] = {}
+ASYNC_HTTP_CLIENTS: Dict[str, httpx.AsyncClient] = {}
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+Destination = Literal["cerebras", "sambanova", "linkup", "slides"]
+
+def is_http2_enabled() -> bool:
+    """Check whether the transports negotiate HTTP/2.
+
+    Returns:
+        bool: HTTP2_ENABLED is set and the `h2` package is installed.
+    """
+    settings = get_settings()
+    if settings.http2_enabled and not HTTP2_AVAILABLE:
+        logger.debug("HTTP/2 requested but the h2 package is not installed, using HTTP/1.1")
+    return settings.http2_enabled and HTTP2_AVAILABLE
+
+def get_http_timeout(destination: Destination, read_timeout: Optional[float] = None) -> httpx.Timeout:
+    """Get the timeouts of the calls to a destination.
+
+    Args:
+        destination (Destination): service called
+        read_timeout (float, optional): read timeout of a call, the one of the destination if None
+
+    Returns:
+        httpx.Timeout: connect timeout shared by all destinations, read and pool timeouts of the call
+    """
+    settings = get_settings()
+    read_timeouts = {
+        "cerebras": settings.llm_read_timeout,
+        "sambanova": settings.llm_read_timeout,
+        "linkup": settings.search_read_timeout,
+        "slides": settings.slides_read_timeout,
+    }
+    read_timeout = read_timeout or read_timeouts[destination]
+    return httpx.Timeout(read_timeout, connect= settings.http_connect_timeout, pool= read_timeout)
+
+def get_http_limits(destination: Destination, asynchronous: bool = False) -> httpx.Limits:
+    """Get the connection pool limits of a destination, sized to the concurrency calling it.
+
+    Args:
+        destination (Destination): service called
+        asynchronous (bool): limits of the asynchronous client
+
+    Returns:
+        httpx.Limits: maximum and keep-alive connections of the pool
+    """
+    settings = get_settings()
+    if asynchronous:
+        calls_concurrency = settings.http_async_max_connections
+    else:
+        calls_concurrency = settings.executor_max_workers + REQUEST_THREADS
+    concurrency = {
+        "cerebras": calls_concurrency,
+        "sambanova": calls_concurrency,
+        "linkup": calls_concurrency,
+        "slides": settings.job_max_concurrency,
+    }
+    max_connections = settings.http_max_connections or concurrency[destination]
+    return httpx.Limits(max_connections= max_connections,
+                        max_keepalive_connections= max_connections,
+                        keepalive_expiry= settings.http_keepalive_expiry)
+
+def get_http_client(destination: Destination) -> httpx.Client:
+    """Get the process wide synchronous client of a destination.
+
+    Args:
+        destination (Destination): service called
+
+    Returns:
+        httpx.Client: pooled client
+    """
+    with HTTP_CLIENTS_LOCK:
+        if destination not in HTTP_CLIENTS:
+            HTTP_CLIENTS[destination] = httpx.Client(timeout= get_http_timeout(destination),
+                                                     limits= get_http_limits(destination),
+                                                     http2= is_http2_enabled(),
+                                                     follow_redirects= True)
+        return HTTP_CLIENTS[destination]
+
+def get_async_http_client(destination: Destination) -> httpx.AsyncClient:
+    """Get the process wide asynchronous client of a destination.
+
+    Args:
+        destination (Destination): service called
+
+    Returns:
+        httpx.AsyncClient: pooled client
+    """
+    with HTTP_CLIENTS_LOCK:
+        if destination not in ASYNC_HTTP_CLIENTS:
+            ASYNC_HTTP_CLIENTS[destination] = httpx.AsyncClient(timeout= get_http_timeout(destination),
+                                                                limits= get_http_limits(destination, asynchronous= True),
+                                                                http2= is_http2_enabled(),
+                                                                follow_redirects= True)
+        return ASYNC_HTTP_CLIENTS[destination]
+
+async def close_http_clients():
+    """Close the pooled clients opened so far, on application shutdown."""
+    with HTTP_CLIENTS_LOCK:
+        sync_clients = list(HTTP_CLIENTS.values())
+        async_clients = list(ASYNC_HTTP_CLIENTS.values())
+        HTTP_CLIENTS.clear()
+        ASYNC_HTTP_CLIENTS.clear()
+    for client in sync_clients:
+        client.close()
+    for client in async_clients:
+        await client.aclose()
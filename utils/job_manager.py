@@ -0,0 +1,125 @@
+"""
+In-process worker pool running the benchmark jobs in the background
+"""
+from utils.job_store import JobStore
+from utils.pydantic_models import SearchRequest, JobRecord
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+JobRunner = Callable[[SearchRequest, str, Callable[[str, Any], None]], Awaitable[Dict[str, Any]]]
+
+class JobManager:
+    """Run the submitted jobs with a bounded number of pipelines in flight.
+
+    Jobs are persisted in the store before being queued, so on start the jobs left queued
+    or interrupted by a previous worker are queued again. The workers are started once, a
+    second `start` does nothing until `stop` is called. The store is only called from threads,
+    so its SQLite calls do not block the event loop, and the artifacts are written to it in
+    their order by a writer task.
+
+    Args:
+        store (JobStore): Persistent store of the jobs.
+        runner (JobRunner): Coroutine running the pipeline for a request, a model name and an event handler.
+        max_concurrency (int): Maximum number of jobs running at the same time.
+        skipped_events (Tuple[str]): Pipeline events that are not stored as artifacts.
+    """
+
+    def __init__(self,
+                 store: JobStore,
+                 runner: JobRunner,
+                 max_concurrency: int,
+                 skipped_events: Tuple[str, ...] = ("report_token",)):
+        self.store = store
+        self.runner = runner
+        self.max_concurrency = max_concurrency
+        self.skipped_events = skipped_events
+        self.queue: asyncio.Queue = None
+        self.workers: List[asyncio.Task] = []
+        self.running_jobs = 0
+
+    async def start(self):
+        if self.workers:
+            logger.debug("Job workers already started")
+            return
+        self.queue = asyncio.Queue()
+        for job_id in await asyncio.to_thread(self.store.list_job_ids, ["running"]):
+            logger.warning(f"Job {job_id} was interrupted by a restart, queueing it again")
+            await asyncio.to_thread(self.store.clear_artifacts, job_id)
+            await asyncio.to_thread(self.store.update_status, job_id, "queued")
+        for job_id in await asyncio.to_thread(self.store.list_job_ids, ["queued"]):
+            self.queue.put_nowait(job_id)
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+        logger.info(f"Started {self.max_concurrency} job workers with {self.queue.qsize()} queued jobs")
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+        self.workers = []
+
+    async def submit(self, request: SearchRequest, model_name: str) -> JobRecord:
+        job = await asyncio.to_thread(self.store.create_job, request, model_name)
+        self.queue.put_nowait(job.job_id)
+        logger.info(f"Queued job {job.job_id} for {request.query}")
+        return job
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize() if self.queue is not None else 0
+
+    async def _worker(self):
+        while True:
+            job_id = await self.queue.get()
+            try:
+                await self._run_job(job_id)
+            finally:
+                self.queue.task_done()
+
+    async def _run_job(self, job_id: str):
+        job = await asyncio.to_thread(self.store.get_job, job_id)
+        if job is None or job.status != "queued":
+            return
+        await asyncio.to_thread(self.store.update_status, job_id, "running")
+        self.running_jobs += 1
+        loop = asyncio.get_running_loop()
+        artifacts: asyncio.Queue = asyncio.Queue()
+        writer = asyncio.create_task(self._write_artifacts(job_id, artifacts))
+
+        def on_event(event: str, data: Any):
+            # the events may come from the threads of the pipeline
+            if event not in self.skipped_events:
+                loop.call_soon_threadsafe(artifacts.put_nowait, (event, data))
+
+        try:
+            result = await self.runner(job.request, job.model_name, on_event)
+        except asyncio.CancelledError:
+            writer.cancel()
+            raise
+        except Exception as e:
+            logger.exception(f"Job {job_id} failed")
+            await self._close_artifacts(artifacts, writer)
+            await asyncio.to_thread(self.store.update_status, job_id, "failed", error= str(e))
+            return
+        finally:
+            self.running_jobs -= 1
+        await self._close_artifacts(artifacts, writer)
+        await asyncio.to_thread(self.store.update_status, job_id, "succeeded", result= result)
+        logger.info(f"Job {job_id} succeeded")
+
+    async def _write_artifacts(self, job_id: str, artifacts: asyncio.Queue):
+        while True:
+            artifact = await artifacts.get()
+            if artifact is None:
+                return
+            event, data = artifact
+            try:
+                await asyncio.to_thread(self.store.add_artifact, job_id, event, data)
+            except Exception:
+                logger.exception(f"Could not store the {event} artifact of job {job_id}")
+
+    async def _close_artifacts(self, artifacts: asyncio.Queue, writer: asyncio.Task):
+        # queued behind the events still being scheduled, so every artifact is written before the status
+        asyncio.get_running_loop().call_soon_threadsafe(artifacts.put_nowait, None)
+        await writer
@@ -0,0 +1,108 @@
+"""
+Persistent store of the benchmark jobs so that their state survives a worker restart
+"""
+from utils.pydantic_models import SearchRequest, JobRecord, JobArtifact
+from pydantic_core import to_jsonable_python
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+class JobStore:
+    """SQLite backed store of the jobs and of their intermediate artifacts.
+
+    Args:
+        path (str): Path of the SQLite file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "job_id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL, model_name TEXT NOT NULL, "
+            "result TEXT, error TEXT, created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS job_artifacts ("
+            "job_id TEXT NOT NULL, sequence INTEGER NOT NULL, event TEXT NOT NULL, data TEXT NOT NULL, "
+            "created_at TEXT NOT NULL, PRIMARY KEY (job_id, sequence))"
+        )
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def create_job(self, request: SearchRequest, model_name: str) -> JobRecord:
+        job_id = uuid.uuid4().hex
+        now = self._now()
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO jobs (job_id, status, request, model_name, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, "queued", request.model_dump_json(), model_name, now, now)
+            )
+        return self.get_job(job_id)
+
+    def get_job(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT job_id, status, request, model_name, result, error, created_at, updated_at FROM jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job_id, status, request, model_name, result, error, created_at, updated_at = row
+        return JobRecord(job_id= job_id,
+                         status= status,
+                         request= SearchRequest.model_validate_json(request),
+                         model_name= model_name,
+                         result= json.loads(result) if result is not None else None,
+                         error= error,
+                         created_at= created_at,
+                         updated_at= updated_at)
+
+    def list_job_ids(self, statuses: List[str]) -> List[str]:
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT job_id FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at ASC", tuple(statuses)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def update_status(self, job_id: str, status: str, result: Dict[str, Any] = None, error: str = None):
+        serialized_result = json.dumps(to_jsonable_python(result)) if result is not None else None
+        with self._lock:
+            self._connection.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, updated_at = ? WHERE job_id = ?",
+                (status, serialized_result, error, self._now(), job_id)
+            )
+
+    def add_artifact(self, job_id: str, event: str, data: Any):
+        with self._lock:
+            self._connection.execute(
+                "INSERT INTO job_artifacts (job_id, sequence, event, data, created_at) "
+                "SELECT ?, COALESCE(MAX(sequence), 0) + 1, ?, ?, ? FROM job_artifacts WHERE job_id = ?",
+                (job_id, event, json.dumps(to_jsonable_python(data), ensure_ascii=False), self._now(), job_id)
+            )
+
+    def list_artifacts(self, job_id: str, after_sequence: int = 0) -> List[JobArtifact]:
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT sequence, event, data, created_at FROM job_artifacts WHERE job_id = ? AND sequence > ? ORDER BY sequence ASC",
+                (job_id, after_sequence)
+            ).fetchall()
+        return [JobArtifact(sequence= sequence, event= event, data= json.loads(data), created_at= created_at)
+                for sequence, event, data, created_at in rows]
+
+    def clear_artifacts(self, job_id: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM job_artifacts WHERE job_id = ?", (job_id,))
@@ -0,0 +1,95 @@
+"""
+Local repair of the malformed JSON answers of the structured LLM calls.
+
+The answers cut by the token limit, wrapped in a markdown fence or followed by text, and
+the objects with trailing commas are turned back into JSON candidates without calling the
+model again. A truncated answer is cut after one of its complete values and its open arrays
+and objects are closed. The candidates are yielded from the most to the least complete, the
+caller keeps the first one its schema validates, e.g. a list of sub questions without the
+last one, cut mid-sentence. Arrays and objects are never emptied by a cut, so a repair keeps
+at least one of the values the model completed.
+"""
+from typing import Iterator, List, Tuple
+import re
+
+JSON_FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)(?:```|$)", re.DOTALL)
+
+MATCHING_BRACKETS = {"{": "}", "[": "]"}
+
+def strip_json_wrapping(content: str) -> str:
+    """Remove the markdown fence and the text before the JSON value of an answer.
+
+    Args:
+        content (str): answer of the model
+
+    Returns:
+        str: the answer from its first bracket on
+    """
+    match = JSON_FENCE_PATTERN.search(content)
+    if match:
+        content = match.group(1)
+    starts = [index for index in (content.find("{"), content.find("[")) if index >= 0]
+    return content[min(starts):] if starts else content
+
+def close_json(text: str, stack: List[str]) -> str:
+    return text.rstrip().rstrip(",") + "".join(MATCHING_BRACKETS[bracket] for bracket in reversed(stack))
+
+def iter_json_repairs(content: str, max_candidates: int = 16) -> Iterator[str]:
+    """Yield repaired versions of a malformed JSON answer.
+
+    Args:
+        content (str): answer of the model
+        max_candidates (int): truncated versions yielded at most
+
+    Yields:
+        str: JSON candidates, the complete value without its fence, trailing text and trailing
+            commas first, then the truncations of an unterminated value from the longest
+    """
+    text = strip_json_wrapping(content)
+    output = []
+    stack = []
+    # positions in the output after which the value can be cut and closed, with the brackets open there
+    cut_points: List[Tuple[int, List[str]]] = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            output.append(char)
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in MATCHING_BRACKETS:
+            stack.append(char)
+            output.append(char)
+            continue
+        elif char in "]}":
+            while output and output[-1].isspace():
+                output.pop()
+            if output and output[-1] == ",":
+                output.pop()
+            if not stack or MATCHING_BRACKETS[stack[-1]] != char:
+                break
+            stack.pop()
+            output.append(char)
+            if not stack:
+                yield "".join(output)
+                return
+            cut_points.append((len(output), list(stack)))
+            continue
+        elif char == ",":
+            cut_points.append((len(output), list(stack)))
+        output.append(char)
+    if not stack:
+        return
+    partial = "".join(output)
+    if not in_string:
+        yield close_json(partial, stack)
+    candidates = [close_json(partial[:position], open_brackets) for position, open_brackets in cut_points[-max_candidates:]]
+    # a value closing its container and the comma after it are the same cut
+    yield from dict.fromkeys(reversed(candidates))
@@ -0,0 +1,381 @@
+"""
+Routing of the chat completions between the LLM providers serving equivalent models.
+
+The routers expose the `chat.completions.create` interface of the provider SDKs so they
+can be passed to the steps in place of a Cerebras client. Every call goes to the fastest
+healthy backend serving the requested model, according to the rolling latency and error
+rate of each provider/model pair, and fails over to the next backend on any error that is
+not caused by the request itself. A backend failing LLM_ROUTER_FAILURE_THRESHOLD times in a
+row is skipped for LLM_ROUTER_COOLDOWN seconds.
+
+Every call goes through the rate limiter of the backend serving it, and is retried on that
+backend with the `retry_policy` of the caller and the retry budget of the provider before
+failing over, so the calls served by a provider are only charged to that provider.
+
+Providers that do not support `json_schema` response formats get a `json_object` request
+with the schema in the system prompt, and the answer is unwrapped from any markdown fence.
+"""
+from cerebras.cloud.sdk.types.chat.chat_completion import ChatCompletion
+from utils.cache_utils import make_cache_key
+from utils.config import get_settings
+from utils.metrics import track_provider_call
+from utils.rate_limit import get_rate_limiter
+from utils.retry_utils import RetryPolicy, call_with_retry, call_with_retry_async, get_retry_budget
+from utils.token_budget import estimate_tokens
+from utils.llm_utils import (CHAT_COMPLETION_ADAPTER,
+                             get_cerebras_client,
+                             get_async_cerebras_client,
+                             get_sambanova_client,
+                             get_async_sambanova_client)
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+import types
+
+logger = logging.getLogger(__name__)
+
+LLM_ROUTERS_LOCK = threading.Lock()
+PROVIDER_STATS_LOCK = threading.Lock()
+PROVIDER_STATS: Dict[Tuple[str, str], "ProviderStats"] = {}
+
+# errors caused by the request itself, that no other provider would accept
+REQUEST_ERROR_STATUS_CODES = {400, 422}
+
+# model served by each provider for a model name requested by the steps, the steps request
+# Cerebras model names and a provider missing from a mapping serves no equivalent model
+MODEL_EQUIVALENTS: Dict[str, Dict[str, str]] = {
+    "llama-4-scout-17b-16e-instruct": {"cerebras": "llama-4-scout-17b-16e-instruct"},
+    "llama-3.3-70b": {"cerebras": "llama-3.3-70b",
+                      "sambanova": "Meta-Llama-3.3-70B-Instruct"},
+    "qwen-3-32b": {"cerebras": "qwen-3-32b",
+                   "sambanova": "Qwen3-32B"},
+    "gpt-oss-120b": {"cerebras": "gpt-oss-120b",
+                     "sambanova": "gpt-oss-120b"},
+    "qwen-3-235b-a22b-instruct-2507": {"cerebras": "qwen-3-235b-a22b-instruct-2507"},
+    "qwen-3-235b-a22b-thinking-2507": {"cerebras": "qwen-3-235b-a22b-thinking-2507"},
+}
+
+JSON_FENCE_PATTERN = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.DOTALL)
+
+class ProviderStats:
+    """Rolling latency and error rate of a provider/model pair.
+
+    Args:
+        alpha (float): Weight of the last call in the moving averages.
+    """
+
+    def __init__(self, alpha: float):
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.unavailable_until = 0.0
+        self._lock = threading.Lock()
+
+    def record_success(self, latency: float):
+        with self._lock:
+            self.calls += 1
+            self.consecutive_failures = 0
+            self.latency = latency if self.latency is None else self.alpha * latency + (1 - self.alpha) * self.latency
+            self.error_rate = (1 - self.alpha) * self.error_rate
+
+    def record_failure(self, failure_threshold: int, cooldown: float):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+            if self.consecutive_failures >= failure_threshold:
+                self.unavailable_until = time.monotonic() + cooldown
+
+    def is_healthy(self) -> bool:
+        return self.unavailable_until <= time.monotonic()
+
+    def score(self) -> float:
+        """Expected cost of a call, backends never called score 0 so they get measured."""
+        if self.latency is None:
+            return 0.0
+        return self.latency * (1 + 4 * self.error_rate)
+
+    def as_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"latency": self.latency,
+                    "error_rate": self.error_rate,
+                    "calls": self.calls,
+                    "failures": self.failures,
+                    "healthy": self.is_healthy()}
+
+class ProviderBackend:
+    """An LLM provider client with its structured output support.
+
+    A `json_schema` response format rejected by the provider is only downgraded to `json_object`
+    for the model and the schema it was rejected for.
+
+    Args:
+        name (str): Name of the provider.
+        client (Any): Client with the `chat.completions.create` interface.
+        supports_json_schema (bool): Whether the provider accepts `json_schema` response formats.
+    """
+
+    def __init__(self, name: str, client: Any, supports_json_schema: bool = True):
+        self.name = name
+        self.client = client
+        self.supports_json_schema = supports_json_schema
+        self.rejected_schemas: Set[Tuple[str, str]] = set()
+        self._lock = threading.Lock()
+
+    def accepts_json_schema(self, model_name: str, schema: Dict[str, Any]) -> bool:
+        if not self.supports_json_schema:
+            return False
+        with self._lock:
+            return (model_name, make_cache_key(schema)) not in self.rejected_schemas
+
+    def reject_json_schema(self, model_name: str, schema: Dict[str, Any]):
+        with self._lock:
+            self.rejected_schemas.add((model_name, make_cache_key(schema)))
+
+def get_provider_model(model_name: str, provider: str) -> Optional[str]:
+    """Get the model a provider serves for a requested model.
+
+    Args:
+        model_name (str): model requested by the step
+        provider (str): name of the provider
+
+    Returns:
+        Optional[str]: model of the provider, None if it serves no equivalent model
+    """
+    equivalents = {**MODEL_EQUIVALENTS, **get_settings().llm_model_equivalents}
+    if model_name in equivalents:
+        return equivalents[model_name].get(provider)
+    # unknown models are Cerebras model names, no other provider is known to serve them
+    return model_name if provider == "cerebras" else None
+
+def adapt_request(backend: ProviderBackend, model_name: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    """Adapt the request of a step to a provider: model name and structured output format."""
+    request = dict(kwargs, model= get_provider_model(model_name, backend.name))
+    response_format = request.get("response_format")
+    if response_format is None:
+        request.pop("response_format", None)
+    elif (response_format.get("type") == "json_schema"
+          and not backend.accepts_json_schema(request["model"], response_format["json_schema"]["schema"])):
+        schema = response_format["json_schema"]["schema"]
+        messages = [dict(message) for message in request["messages"]]
+        schema_instruction = ("Answer only with a JSON object following this JSON schema, without any other text:\n"
+                              f"{json.dumps(schema)}")
+        if messages and messages[0]["role"] == "system":
+            messages[0]["content"] = f"{messages[0]['content']}\n\n{schema_instruction}"
+        else:
+            messages.insert(0, {"role": "system", "content": schema_instruction})
+        request["messages"] = messages
+        request["response_format"] = {"type": "json_object"}
+    return request
+
+def unwrap_json_content(completion: Any) -> Any:
+    """Remove the markdown fence some providers put around JSON answers."""
+    for choice in getattr(completion, "choices", None) or []:
+        content = choice.message.content
+        if content:
+            match = JSON_FENCE_PATTERN.match(content)
+            if match:
+                choice.message.content = match.group(1)
+    return completion
+
+def estimate_request_tokens(request: Dict[str, Any]) -> int:
+    return estimate_tokens("".join(message["content"] or "" for message in request["messages"]), request["model"])
+
+def is_json_schema_rejection(error: Exception, request: Dict[str, Any]) -> bool:
+    response_format = request.get("response_format") or {}
+    return (response_format.get("type") == "json_schema"
+            and getattr(error, "status_code", None) in {400, 422}
+            and "schema" in str(error).lower())
+
+class BaseLLMRouter:
+    """Backend selection and bookkeeping shared by the synchronous and asynchronous routers.
+
+    Args:
+        backends (List[ProviderBackend]): Providers in order of preference when no latency is known.
+    """
+
+    # rate limiting and retries are applied per backend by the router, see `limit_call`
+    limits_calls = True
+
+    def __init__(self, backends: List[ProviderBackend]):
+        settings = get_settings()
+        self.backends = backends
+        self.failure_threshold = settings.llm_router_failure_threshold
+        self.cooldown = settings.llm_router_cooldown
+        self.alpha = settings.llm_router_latency_alpha
+        self.chat = types.SimpleNamespace(completions= types.SimpleNamespace(create= self.create))
+
+    def get_stats(self, provider: str, model_name: str) -> ProviderStats:
+        with PROVIDER_STATS_LOCK:
+            key = (provider, model_name)
+            if key not in PROVIDER_STATS:
+                PROVIDER_STATS[key] = ProviderStats(self.alpha)
+            return PROVIDER_STATS[key]
+
+    def rank_backends(self, model_name: str) -> List[ProviderBackend]:
+        """Order the backends serving the model, healthy ones first and fastest first."""
+        candidates = [backend for backend in self.backends if get_provider_model(model_name, backend.name)]
+        if not candidates:
+            raise ValueError(f"No LLM provider serves the model {model_name}")
+        return sorted(candidates, key=lambda backend: (not self.get_stats(backend.name, model_name).is_healthy(),
+                                                       self.get_stats(backend.name, model_name).score()))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with PROVIDER_STATS_LOCK:
+            items = list(PROVIDER_STATS.items())
+        return {f"{provider}/{model_name}": provider_stats.as_dict() for (provider, model_name), provider_stats in items}
+
+    def handle_failure(self, backend: ProviderBackend, model_name: str, error: Exception, is_last: bool):
+        if getattr(error, "status_code", None) in REQUEST_ERROR_STATUS_CODES:
+            raise error
+        self.get_stats(backend.name, model_name).record_failure(self.failure_threshold, self.cooldown)
+        if is_last:
+            raise error
+        logger.warning(f"{backend.name} failed for {model_name} with {error!r}, failing over")
+
+    def prepare_structured_retry(self, backend: ProviderBackend, model_name: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        provider_model = get_provider_model(model_name, backend.name)
+        schema = request["response_format"]["json_schema"]["schema"]
+        logger.warning(f"{backend.name} rejected the {schema.get('title', 'json_schema')} response format of {provider_model}, "
+                       "using json_object for this schema from now on")
+        backend.reject_json_schema(provider_model, schema)
+        return adapt_request(backend, model_name, request)
+
+class LLMRouter(BaseLLMRouter):
+    """Synchronous router with the `chat.completions.create` interface of the SDK clients."""
+
+    def limit_call(self, backend: ProviderBackend, request: Dict[str, Any], retry_policy: Optional[RetryPolicy]) -> Callable[..., Any]:
+        """Rate limit the calls of a backend, and retry them within its budget when a policy is given."""
+        create = track_provider_call(backend.client.chat.completions.create, backend.name, request["model"])
+        create = get_rate_limiter(backend.name, request["model"]).wrap(create, estimate_request_tokens(request))
+        if retry_policy is None:
+            return create
+        return functools.partial(call_with_retry, create,
+                                 policy= retry_policy,
+                                 budget= get_retry_budget(backend.name),
+                                 description= f"{backend.name} {request['model']} LLM call")
+
+    def create(self, model: str, retry_policy: RetryPolicy = None, **kwargs) -> Any:
+        backends = self.rank_backends(model)
+        for i, backend in enumerate(backends):
+            request = adapt_request(backend, model, kwargs)
+            create = self.limit_call(backend, request, retry_policy)
+            start = time.monotonic()
+            try:
+                try:
+                    completion = create(**request)
+                except Exception as e:
+                    if not is_json_schema_rejection(e, request):
+                        raise
+                    request = self.prepare_structured_retry(backend, model, kwargs)
+                    completion = create(**request)
+            except Exception as e:
+                self.handle_failure(backend, model, e, i == len(backends) - 1)
+                continue
+            self.get_stats(backend.name, model).record_success(time.monotonic() - start)
+            if request.get("stream"):
+                return completion
+            if request.get("response_format"):
+                completion = unwrap_json_content(completion)
+            return normalize_completion(completion, model)
+
+class AsyncLLMRouter(BaseLLMRouter):
+    """Asynchronous router with the `chat.completions.create` interface of the SDK clients."""
+
+    def limit_call(self, backend: ProviderBackend, request: Dict[str, Any], retry_policy: Optional[RetryPolicy]) -> Callable[..., Awaitable[Any]]:
+        """Rate limit the calls of a backend, and retry them within its budget when a policy is given."""
+        create = track_provider_call(backend.client.chat.completions.create, backend.name, request["model"])
+        create = get_rate_limiter(backend.name, request["model"]).wrap_async(create, estimate_request_tokens(request))
+        if retry_policy is None:
+            return create
+        return functools.partial(call_with_retry_async, create,
+                                 policy= retry_policy,
+                                 budget= get_retry_budget(backend.name),
+                                 description= f"{backend.name} {request['model']} LLM call")
+
+    async def create(self, model: str, retry_policy: RetryPolicy = None, **kwargs) -> Any:
+        backends = self.rank_backends(model)
+        for i, backend in enumerate(backends):
+            request = adapt_request(backend, model, kwargs)
+            create = self.limit_call(backend, request, retry_policy)
+            start = time.monotonic()
+            try:
+                try:
+                    completion = await create(**request)
+                except Exception as e:
+                    if not is_json_schema_rejection(e, request):
+                        raise
+                    request = self.prepare_structured_retry(backend, model, kwargs)
+                    completion = await create(**request)
+            except Exception as e:
+                self.handle_failure(backend, model, e, i == len(backends) - 1)
+                continue
+            self.get_stats(backend.name, model).record_success(time.monotonic() - start)
+            if request.get("stream"):
+                return completion
+            if request.get("response_format"):
+                completion = unwrap_json_content(completion)
+            return normalize_completion(completion, model)
+
+def normalize_completion(completion: Any, model_name: str) -> ChatCompletion:
+    """Convert the completion of any provider to a Cerebras completion, as cached and read by the steps."""
+    if isinstance(completion, ChatCompletion.__args__):
+        return completion
+    completion_dict = completion.model_dump()
+    completion_dict["model"] = model_name
+    completion_dict.setdefault("system_fingerprint", "")
+    completion_dict["system_fingerprint"] = completion_dict["system_fingerprint"] or ""
+    completion_dict["time_info"] = completion_dict.get("time_info") or {}
+    completion_dict["usage"] = completion_dict.get("usage") or {}
+    return CHAT_COMPLETION_ADAPTER.validate_python(completion_dict)
+
+def build_backends(asynchronous: bool) -> List[ProviderBackend]:
+    settings = get_settings()
+    base_urls = settings.llm_provider_base_urls
+    backends = []
+    for provider in settings.llm_providers:
+        if provider == "cerebras":
+            factory = get_async_cerebras_client if asynchronous else get_cerebras_client
+            client = factory(os.environ.get("CEREBRAS_API_KEY"), base_url= base_urls.get("cerebras"))
+            backends.append(ProviderBackend(provider, client, supports_json_schema= True))
+        elif provider == "sambanova":
+            factory = get_async_sambanova_client if asynchronous else get_sambanova_client
+            client = factory(os.environ.get("SAMBANOVA_API_KEY"),
+                             api_endpoint= base_urls.get("sambanova", "https://api.sambanova.ai/v1"))
+            backends.append(ProviderBackend(provider, client, supports_json_schema= False))
+        else:
+            raise ValueError(f"Unknown LLM provider {provider}")
+    return backends
+
+LLM_ROUTERS: Dict[bool, BaseLLMRouter] = {}
+
+def get_llm_router() -> LLMRouter:
+    """Get the process wide synchronous router of the LLM_PROVIDERS.
+
+    Returns:
+        LLMRouter: router usable in place of a Cerebras client.
+    """
+    with LLM_ROUTERS_LOCK:
+        if False not in LLM_ROUTERS:
+            LLM_ROUTERS[False] = LLMRouter(build_backends(asynchronous= False))
+        return LLM_ROUTERS[False]
+
+def get_async_llm_router() -> AsyncLLMRouter:
+    """Get the process wide asynchronous router of the LLM_PROVIDERS.
+
+    Returns:
+        AsyncLLMRouter: router usable in place of an AsyncCerebras client.
+    """
+    with LLM_ROUTERS_LOCK:
+        if True not in LLM_ROUTERS:
+            LLM_ROUTERS[True] = AsyncLLMRouter(build_backends(asynchronous= True))
+        return LLM_ROUTERS[True]
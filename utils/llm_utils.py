@@ -1,51 +1,255 @@
 """
 Collection of functions for calling LLMs and tools throughout the pipeline
 """
-from cerebras.cloud.sdk import Cerebras
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
 import os
-from pydantic import SecretStr
-from typing import Dict
-from sambanova import SambaNova
+from pydantic import TypeAdapter
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
 from cerebras.cloud.sdk.types.chat.chat_completion import ChatCompletion
+from utils.cache_utils import TieredCache, LRUCacheBackend, SQLiteCacheBackend, make_cache_key
+from utils.config import get_settings
+from utils.http_utils import get_http_client, get_async_http_client, get_http_timeout
+from utils.retry_utils import RetryPolicy, call_with_retry, call_with_retry_async, get_retry_policy, get_retry_budget
+from utils.rate_limit import get_rate_limiter
+from utils.token_budget import estimate_tokens
+from utils.metrics import record_token_usage, track_provider_call
+from utils.tracing import set_span_attributes
+from utils.cassette import cassette_call, cassette_call_async
+from functools import lru_cache, partial
+import asyncio
+import logging
+import threading
 
+if TYPE_CHECKING:
+    from sambanova import SambaNova, AsyncSambaNova
 
-def get_cerebras_client(api_key: SecretStr = SecretStr(os.environ.get("CEREBRAS_API_KEY"))):
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_LOCK = threading.Lock()
+
+CHAT_COMPLETION_ADAPTER = TypeAdapter(ChatCompletion)
+
+
+def get_cerebras_client(api_key: Optional[str] = None,
+                        base_url: str = None):
     """Get the Cerebras client.
 
+    The SDK warms a TCP connection of its own when the client is built, blocking for up to a
+    second; the pooled connections are opened by the warm-up of the application instead.
+
     Args:
-        api_key (SecretStr): The API key for the Cerebras client.
+        api_key (str, optional): The API key for the Cerebras client, CEREBRAS_API_KEY by default.
+        base_url (str, optional): Base URL of the API, the Cerebras cloud by default.
 
     Returns:
         Cerebras: The Cerebras client.
     """
     client = Cerebras(
-        api_key= api_key
+        api_key= api_key or os.environ.get("CEREBRAS_API_KEY"),
+        base_url= base_url,
+        http_client= get_http_client("cerebras"),
+        timeout= get_http_timeout("cerebras"),
+        max_retries= 0,
+        warm_tcp_connection= False
     )
     return client
 
-def get_sambanova_client(api_key: SecretStr = SecretStr(os.environ.get("SAMBANOVA_API_KEY")),
-                         api_endpoint: str = "https://api.sambanova.ai/v1") -> SambaNova:
+def get_async_cerebras_client(api_key: Optional[str] = None,
+                              base_url: str = None) -> AsyncCerebras:
+    """Get the asynchronous Cerebras client.
+
+    The SDK would warm the connection with a throwaway synchronous client, retried with
+    sleeps when the API is unreachable, so the warming is left to the application warm-up.
+
+    Args:
+        api_key (str, optional): The API key for the Cerebras client, CEREBRAS_API_KEY by default.
+        base_url (str, optional): Base URL of the API, the Cerebras cloud by default.
+
+    Returns:
+        AsyncCerebras: The asynchronous Cerebras client.
+    """
+    client = AsyncCerebras(
+        api_key= api_key or os.environ.get("CEREBRAS_API_KEY"),
+        base_url= base_url,
+        http_client= get_async_http_client("cerebras"),
+        timeout= get_http_timeout("cerebras"),
+        max_retries= 0,
+        warm_tcp_connection= False
+    )
+    return client
+
+def get_sambanova_client(api_key: Optional[str] = None,
+                         api_endpoint: str = "https://api.sambanova.ai/v1") -> "SambaNova":
     """Get the Sambanova client.
 
     Args:
-        api_key (SecretStr, optional): Sambanova API key.
+        api_key (str, optional): Sambanova API key, SAMBANOVA_API_KEY by default.
         api_endpoint (str, optional): Sambanova's base URL.
 
     Returns:
         SambaNova: SambaNova Client
     """
+    # imported on first use, only deployments routing to SambaNova pay for the SDK
+    from sambanova import SambaNova
+
     client = SambaNova(
-        api_key= api_key,
+        api_key= api_key or os.environ.get("SAMBANOVA_API_KEY"),
         base_url= api_endpoint,
+        http_client= get_http_client("sambanova"),
+        timeout= get_http_timeout("sambanova"),
+        max_retries= 0,
     )
     return client
 
+def get_async_sambanova_client(api_key: Optional[str] = None,
+                               api_endpoint: str = "https://api.sambanova.ai/v1") -> "AsyncSambaNova":
+    """Get the asynchronous Sambanova client.
+
+    Args:
+        api_key (str, optional): Sambanova API key, SAMBANOVA_API_KEY by default.
+        api_endpoint (str, optional): Sambanova's base URL.
+
+    Returns:
+        AsyncSambaNova: asynchronous SambaNova Client
+    """
+    from sambanova import AsyncSambaNova
+
+    client = AsyncSambaNova(
+        api_key= api_key or os.environ.get("SAMBANOVA_API_KEY"),
+        base_url= api_endpoint,
+        http_client= get_async_http_client("sambanova"),
+        timeout= get_http_timeout("sambanova"),
+        max_retries= 0,
+    )
+    return client
+
+def get_llm_cache() -> TieredCache:
+    """Get the process wide cache of the LLM responses.
+
+    Returns:
+        TieredCache: in-memory LRU tier in front of the SQLite tier.
+    """
+    with LLM_CACHE_LOCK:
+        return build_llm_cache()
+
+@lru_cache
+def build_llm_cache() -> TieredCache:
+    settings = get_settings()
+    backends = []
+    if settings.llm_cache_memory_entries > 0:
+        backends.append(LRUCacheBackend(max_entries= settings.llm_cache_memory_entries))
+    if settings.llm_cache_max_bytes > 0:
+        backends.append(SQLiteCacheBackend(path= settings.llm_cache_path,
+                                           max_size_bytes= settings.llm_cache_max_bytes,
+                                           table= "llm_responses"))
+    return TieredCache(backends)
+
+def is_llm_cache_enabled(step_name: Optional[str]) -> bool:
+    """Check whether the responses of a step can be served from the cache.
+
+    Args:
+        step_name (Optional[str]): name of the calling step.
+
+    Returns:
+        bool: True if the step is allowed to use the cache.
+    """
+    settings = get_settings()
+    return settings.llm_cache_enabled and step_name not in settings.llm_cache_bypass_steps
+
+def get_cached_completion(cache_key: str) -> Optional[ChatCompletion]:
+    """Get a cached completion, cache failures are treated as misses.
+
+    Args:
+        cache_key (str): hash of the call inputs.
+
+    Returns:
+        Optional[ChatCompletion]: the cached completion if any.
+    """
+    try:
+        cached_value = get_llm_cache().get(cache_key)
+        if cached_value is not None:
+            return CHAT_COMPLETION_ADAPTER.validate_json(cached_value)
+    except Exception as e:
+        logger.warning(f"Could not read the LLM cache: {e}")
+    return None
+
+def cache_completion(cache_key: str, completion: ChatCompletion):
+    """Store a completion in the cache, cache failures are only logged.
+
+    Args:
+        cache_key (str): hash of the call inputs.
+        completion (ChatCompletion): completion to store.
+    """
+    try:
+        get_llm_cache().set(cache_key, completion.model_dump_json(), get_settings().llm_cache_ttl)
+    except Exception as e:
+        logger.warning(f"Could not write to the LLM cache: {e}")
+
+def evict_completion(cache_key: str):
+    """Remove a completion from the cache, e.g. an answer its caller could not validate.
+
+    Args:
+        cache_key (str): hash of the call inputs.
+    """
+    try:
+        get_llm_cache().delete(cache_key)
+    except Exception as e:
+        logger.warning(f"Could not evict from the LLM cache: {e}")
+
+def make_cassette_request(model_name: str,
+                          system_prompt: str,
+                          prompt: str,
+                          response_schema: Optional[Dict[str, Any]],
+                          step_name: Optional[str]) -> Dict[str, Any]:
+    return {"model": model_name,
+            "system_prompt": system_prompt,
+            "prompt": prompt,
+            "response_format": response_schema,
+            "step": step_name}
+
+def dump_completion(completion: ChatCompletion) -> Dict[str, Any]:
+    return completion.model_dump(mode= "json")
+
+def limit_completion_call(client: Any, model_name: str, prompt_tokens: int, policy: RetryPolicy, description: str, asynchronous: bool = False) -> Callable[..., Any]:
+    """Get the `chat.completions.create` of a client, rate limited and retried.
+
+    The LLM routers rate limit and retry every call on the provider serving it, the calls of
+    a Cerebras client are charged to Cerebras.
+
+    Args:
+        client (Any): Cerebras client or LLM router.
+        model_name (str): The name of the model to be used.
+        prompt_tokens (int): The estimated prompt tokens of the call.
+        policy (RetryPolicy): The retry policy of the call.
+        description (str): The name of the call in the logs.
+        asynchronous (bool): Whether the client is asynchronous.
+
+    Returns:
+        Callable[..., Any]: function making the call with the keyword arguments of `create`.
+    """
+    if getattr(client, "limits_calls", False):
+        return partial(client.chat.completions.create, retry_policy= policy)
+    rate_limiter = get_rate_limiter("cerebras", model_name)
+    if asynchronous:
+        return partial(call_with_retry_async,
+                       rate_limiter.wrap_async(client.chat.completions.create, prompt_tokens),
+                       policy= policy,
+                       budget= get_retry_budget("cerebras"),
+                       description= description)
+    return partial(call_with_retry,
+                   rate_limiter.wrap(client.chat.completions.create, prompt_tokens),
+                   policy= policy,
+                   budget= get_retry_budget("cerebras"),
+                   description= description)
+
 def call_cerebras_model(client: Cerebras, 
                         system_prompt: str, 
                         model_name: str, 
                         prompt: str, 
-                        response_schema: Dict[str, any] = None) -> ChatCompletion:
-    """Call the Cerebras model.
+                        response_schema: Dict[str, any] = None,
+                        step_name: str = None,
+                        refresh_cache: bool = False) -> ChatCompletion:
+    """Call the Cerebras model, identical calls are served from the LLM cache.
 
     Args:
         client (Cerebras): The Cerebras client.
@@ -53,21 +257,192 @@ def call_cerebras_model(client: Cerebras,
         model_name (str): The name of the model to be used.
         prompt (str): The prompt.
         response_schema (Dict[str, any]): The response schema.
+        step_name (str): The name of the calling step, used for the per-step cache opt-out.
+        refresh_cache (bool): Call the model even when the call is cached, replacing the cached completion.
 
     Returns:
         Completion: The completion of the model.
     """
-    completion = client.chat.completions.create(
-        model=model_name,
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": prompt}
-        ],
-        response_format= response_schema
-    )
+    use_cache = is_llm_cache_enabled(step_name)
+    if use_cache:
+        cache_key = make_cache_key(model_name, system_prompt, prompt, response_schema)
+        cached_completion = None if refresh_cache else get_cached_completion(cache_key)
+        if cached_completion is not None:
+            logger.info(f"LLM cache hit for {step_name or model_name}")
+            set_span_attributes(cache_hit= True)
+            return cached_completion
+    else:
+        get_llm_cache().stats.increment("bypassed")
+    policy = get_retry_policy(step_name)
+    prompt_tokens = estimate_tokens(system_prompt + prompt, model_name)
+    create = limit_completion_call(client, model_name, prompt_tokens, policy, f"{step_name or model_name} LLM call")
+    completion = cassette_call("llm",
+                               make_cassette_request(model_name, system_prompt, prompt, response_schema, step_name),
+                               partial(create,
+                                       model=model_name,
+                                       messages=[
+                                           {"role": "system", "content": system_prompt},
+                                           {"role": "user", "content": prompt}
+                                       ],
+                                       response_format= response_schema,
+                                       timeout= get_http_timeout("cerebras", policy.timeout)),
+                               dump= dump_completion,
+                               load= CHAT_COMPLETION_ADAPTER.validate_python)
+    record_token_usage(completion, step_name, model_name)
+    if use_cache:
+        cache_completion(cache_key, completion)
     return completion
 
-def call_sambanova_model(client: SambaNova, 
+async def call_cerebras_model_async(client: AsyncCerebras, 
+                                    system_prompt: str, 
+                                    model_name: str, 
+                                    prompt: str, 
+                                    response_schema: Dict[str, any] = None,
+                                    step_name: str = None,
+                                    refresh_cache: bool = False) -> ChatCompletion:
+    """Call the Cerebras model without blocking the event loop, identical calls are served from the LLM cache.
+
+    Args:
+        client (AsyncCerebras): The asynchronous Cerebras client.
+        system_prompt (str): The system prompt.
+        model_name (str): The name of the model to be used.
+        prompt (str): The prompt.
+        response_schema (Dict[str, any]): The response schema.
+        step_name (str): The name of the calling step, used for the per-step cache opt-out.
+        refresh_cache (bool): Call the model even when the call is cached, replacing the cached completion.
+
+    Returns:
+        Completion: The completion of the model.
+    """
+    use_cache = is_llm_cache_enabled(step_name)
+    if use_cache:
+        cache_key = make_cache_key(model_name, system_prompt, prompt, response_schema)
+        cached_completion = None if refresh_cache else await asyncio.to_thread(get_cached_completion, cache_key)
+        if cached_completion is not None:
+            logger.info(f"LLM cache hit for {step_name or model_name}")
+            set_span_attributes(cache_hit= True)
+            return cached_completion
+    else:
+        get_llm_cache().stats.increment("bypassed")
+    policy = get_retry_policy(step_name)
+    prompt_tokens = estimate_tokens(system_prompt + prompt, model_name)
+    create = limit_completion_call(client, model_name, prompt_tokens, policy, f"{step_name or model_name} LLM call",
+                                   asynchronous= True)
+    completion = await cassette_call_async("llm",
+                                           make_cassette_request(model_name, system_prompt, prompt, response_schema, step_name),
+                                           partial(create,
+                                                   model=model_name,
+                                                   messages=[
+                                                       {"role": "system", "content": system_prompt},
+                                                       {"role": "user", "content": prompt}
+                                                   ],
+                                                   response_format= response_schema,
+                                                   timeout= get_http_timeout("cerebras", policy.timeout)),
+                                           dump= dump_completion,
+                                           load= CHAT_COMPLETION_ADAPTER.validate_python)
+    record_token_usage(completion, step_name, model_name)
+    if use_cache:
+        await asyncio.to_thread(cache_completion, cache_key, completion)
+    return completion
+
+def build_completion_from_stream(content: str, last_chunk) -> ChatCompletion:
+    """Assemble the streamed content into a regular completion.
+
+    Args:
+        content (str): concatenation of the streamed tokens.
+        last_chunk (ChatChunkResponse): last chunk of the stream, carrying the usage.
+
+    Returns:
+        ChatCompletion: completion equivalent to a non streamed call.
+    """
+    finish_reason = "stop"
+    if last_chunk.choices and last_chunk.choices[0].finish_reason:
+        finish_reason = last_chunk.choices[0].finish_reason
+    return CHAT_COMPLETION_ADAPTER.validate_python({
+        "id": last_chunk.id,
+        "created": last_chunk.created,
+        "model": last_chunk.model,
+        "object": "chat.completion",
+        "system_fingerprint": getattr(last_chunk, "system_fingerprint", None) or "",
+        "choices": [{"index": 0,
+                     "finish_reason": finish_reason,
+                     "message": {"role": "assistant", "content": content}}],
+        "usage": last_chunk.usage.model_dump() if last_chunk.usage else {},
+        "time_info": last_chunk.time_info.model_dump() if getattr(last_chunk, "time_info", None) else {}
+    })
+
+async def call_cerebras_model_stream_async(client: AsyncCerebras, 
+                                           system_prompt: str, 
+                                           model_name: str, 
+                                           prompt: str, 
+                                           on_token: Callable[[str], None],
+                                           step_name: str = None) -> ChatCompletion:
+    """Call the Cerebras model in streaming mode, forwarding every generated token as it arrives.
+
+    A cached response is forwarded as a single token.
+
+    Args:
+        client (AsyncCerebras): The asynchronous Cerebras client.
+        system_prompt (str): The system prompt.
+        model_name (str): The name of the model to be used.
+        prompt (str): The prompt.
+        on_token (Callable[[str], None]): Called with every generated token.
+        step_name (str): The name of the calling step, used for the per-step cache opt-out.
+
+    Returns:
+        Completion: The completion of the model once the stream is over.
+    """
+    use_cache = is_llm_cache_enabled(step_name)
+    if use_cache:
+        cache_key = make_cache_key(model_name, system_prompt, prompt, None)
+        cached_completion = await asyncio.to_thread(get_cached_completion, cache_key)
+        if cached_completion is not None:
+            logger.info(f"LLM cache hit for {step_name or model_name}")
+            set_span_attributes(cache_hit= True)
+            on_token(cached_completion.choices[0].message.content)
+            return cached_completion
+    else:
+        get_llm_cache().stats.increment("bypassed")
+    policy = get_retry_policy(step_name)
+    prompt_tokens = estimate_tokens(system_prompt + prompt, model_name)
+    create = limit_completion_call(client, model_name, prompt_tokens, policy, f"{step_name or model_name} LLM stream",
+                                   asynchronous= True)
+
+    async def stream_completion() -> ChatCompletion:
+        stream = await create(model=model_name,
+                              messages=[
+                                  {"role": "system", "content": system_prompt},
+                                  {"role": "user", "content": prompt}
+                              ],
+                              stream= True,
+                              timeout= get_http_timeout("cerebras", policy.timeout))
+        tokens = []
+        last_chunk = None
+        async for chunk in stream:
+            last_chunk = chunk
+            if chunk.choices and chunk.choices[0].delta.content:
+                token = chunk.choices[0].delta.content
+                tokens.append(token)
+                on_token(token)
+        return build_completion_from_stream("".join(tokens), last_chunk)
+
+    def replay_completion(response: Dict[str, Any]) -> ChatCompletion:
+        # a replayed stream is forwarded as a single token, like a cached response
+        completion = CHAT_COMPLETION_ADAPTER.validate_python(response)
+        on_token(completion.choices[0].message.content)
+        return completion
+
+    completion = await cassette_call_async("llm",
+                                           make_cassette_request(model_name, system_prompt, prompt, None, step_name),
+                                           stream_completion,
+                                           dump= dump_completion,
+                                           load= replay_completion)
+    record_token_usage(completion, step_name, model_name)
+    if use_cache:
+        await asyncio.to_thread(cache_completion, cache_key, completion)
+    return completion
+
+def call_sambanova_model(client: "SambaNova", 
                          model_name: str, 
                          system_prompt: str, 
                          prompt: str,
@@ -86,15 +461,23 @@ def call_sambanova_model(client: SambaNova,
     Returns:
         str: Model output
     """    
-    response = client.chat.completions.create(
-        model=model_name,
-        messages=[
-            {"role":"system","content":system_prompt},
-            {"role":"user","content":prompt}
-            ],
-        temperature= temperature,
-        top_p= top_p
-    )
+    policy = get_retry_policy()
+    rate_limiter = get_rate_limiter("sambanova", model_name)
+    prompt_tokens = estimate_tokens(system_prompt + prompt, model_name)
+    create = track_provider_call(client.chat.completions.create, "sambanova", model_name)
+    response = call_with_retry(rate_limiter.wrap(create, prompt_tokens),
+                               model=model_name,
+                               messages=[
+                                   {"role":"system","content":system_prompt},
+                                   {"role":"user","content":prompt}
+                                   ],
+                               temperature= temperature,
+                               top_p= top_p,
+                               timeout= get_http_timeout("sambanova", policy.timeout),
+                               policy= policy,
+                               budget= get_retry_budget("sambanova"),
+                               description= f"{model_name} LLM call")
+    record_token_usage(response, None, model_name)
     return response.choices[0].message.content
 
 def process_reasoning_output(response: str) -> str:
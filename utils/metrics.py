@@ -0,0 +1,333 @@
+"""
+Prometheus metrics of the pipeline, exported by the `/metrics` endpoint.
+
+The steps are timed by the `track_step` decorator (or context manager), the calls to the
+providers by `track_provider_call`, and the token usage of the LLM calls is recorded from
+the `usage` of their completions. The cache, executor and rate limiter counters are already
+kept by their own objects and are only read when the metrics are scraped.
+"""
+from prometheus_client import Counter, Gauge, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from utils.tracing import start_span
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, TypeVar, Union
+import functools
+import inspect
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 40.0, 80.0, 160.0, 320.0)
+
+STEP_SECONDS = Histogram("pipeline_step_seconds",
+                         "Duration of the pipeline steps",
+                         ["step"],
+                         buckets= LATENCY_BUCKETS)
+STEP_ERRORS = Counter("pipeline_step_errors_total",
+                      "Pipeline steps that raised an error",
+                      ["step", "error"])
+STEPS_IN_PROGRESS = Gauge("pipeline_steps_in_progress",
+                          "Pipeline steps running",
+                          ["step"])
+
+PROVIDER_CALL_SECONDS = Histogram("provider_call_seconds",
+                                  "Duration of the calls to the LLM and search providers",
+                                  ["provider", "model"],
+                                  buckets= LATENCY_BUCKETS)
+PROVIDER_CALL_ERRORS = Counter("provider_call_errors_total",
+                               "Calls to the LLM and search providers that failed",
+                               ["provider", "model", "error"])
+PROVIDER_CALLS_IN_PROGRESS = Gauge("provider_calls_in_progress",
+                                   "Calls to the LLM and search providers in flight",
+                                   ["provider"])
+
+LLM_TOKENS = Counter("llm_tokens_total",
+                     "Tokens of the LLM calls by step, served from the cache excluded",
+                     ["step", "model", "type"])
+
+STRUCTURED_OUTPUTS = Counter("structured_outputs_total",
+                             "Answers of the structured LLM calls by how they were parsed: parsed, repaired, recalled or failed",
+                             ["step", "outcome"])
+
+DATE_EXTRACTIONS = Counter("date_extractions_total",
+                           "Search date extractions of the metadata step by method: rules or llm",
+                           ["method"])
+
+REQUESTS_IN_PROGRESS = Gauge("http_requests_in_progress",
+                             "Requests being served by the API",
+                             ["method"])
+REQUEST_SECONDS = Histogram("http_request_seconds",
+                            "Duration of the requests served by the API",
+                            ["path", "method", "status"],
+                            buckets= LATENCY_BUCKETS)
+
+COLLECTOR_LOCK = threading.Lock()
+COLLECTOR_REGISTERED = False
+
+class track_step:
+    """Time a pipeline step and trace it in a span, as a decorator of a function or coroutine
+    function, or as a context manager.
+
+    Args:
+        step_name (str): Name of the step in the metrics and the traces.
+        **attributes: Attributes of the span.
+    """
+
+    def __init__(self, step_name: str, **attributes):
+        self.step_name = step_name
+        self.attributes = attributes
+        self.seconds = STEP_SECONDS.labels(step_name)
+        self.in_progress = STEPS_IN_PROGRESS.labels(step_name)
+        self._local = threading.local()
+
+    def __enter__(self):
+        span = start_span(self.step_name, **self.attributes)
+        span.__enter__()
+        self._local.__dict__.setdefault("stack", []).append((time.perf_counter(), span))
+        self.in_progress.inc()
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        start, span = self._local.stack.pop()
+        self.finish(start, error)
+        span.__exit__(error_type, error, traceback)
+
+    def finish(self, start: float, error: Optional[BaseException] = None):
+        self.in_progress.dec()
+        self.seconds.observe(time.perf_counter() - start)
+        if error is not None:
+            STEP_ERRORS.labels(self.step_name, type(error).__name__).inc()
+
+    def __call__(self, function: Callable[..., Union[T, Awaitable[T]]]) -> Callable[..., Union[T, Awaitable[T]]]:
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def timed_coroutine(*args, **kwargs) -> T:
+                start = time.perf_counter()
+                self.in_progress.inc()
+                try:
+                    with start_span(self.step_name, model= kwargs.get("model_name"), **self.attributes):
+                        result = await function(*args, **kwargs)
+                except BaseException as e:
+                    self.finish(start, e)
+                    raise
+                self.finish(start)
+                return result
+            return timed_coroutine
+
+        @functools.wraps(function)
+        def timed_function(*args, **kwargs) -> T:
+            start = time.perf_counter()
+            self.in_progress.inc()
+            try:
+                with start_span(self.step_name, model= kwargs.get("model_name"), **self.attributes):
+                    result = function(*args, **kwargs)
+            except BaseException as e:
+                self.finish(start, e)
+                raise
+            self.finish(start)
+            return result
+        return timed_function
+
+def track_provider_call(function: Callable[..., Union[T, Awaitable[T]]],
+                        provider: str,
+                        model_name: str = "") -> Callable[..., Union[T, Awaitable[T]]]:
+    """Time and trace every call of a provider SDK function, and count its errors.
+
+    The span of an LLM call carries the size of its prompt and the tokens of its completion.
+
+    Args:
+        function (Callable): SDK function making the call, or coroutine function
+        provider (str): name of the provider
+        model_name (str, optional): model called
+
+    Returns:
+        Callable: function recording the metrics of each call
+    """
+    seconds = PROVIDER_CALL_SECONDS.labels(provider, model_name)
+    in_progress = PROVIDER_CALLS_IN_PROGRESS.labels(provider)
+
+    def finish(start: float, error: Optional[BaseException] = None):
+        in_progress.dec()
+        seconds.observe(time.perf_counter() - start)
+        if error is not None:
+            PROVIDER_CALL_ERRORS.labels(provider, model_name, type(error).__name__).inc()
+
+    if inspect.iscoroutinefunction(function):
+        @functools.wraps(function)
+        async def timed_coroutine(*args, **kwargs) -> T:
+            start = time.perf_counter()
+            in_progress.inc()
+            try:
+                with start_span(provider, "client", model= model_name or None, prompt_chars= get_prompt_chars(kwargs)) as span:
+                    result = await function(*args, **kwargs)
+                    record_span_usage(span, result)
+            except BaseException as e:
+                finish(start, e)
+                raise
+            finish(start)
+            return result
+        return timed_coroutine
+
+    @functools.wraps(function)
+    def timed_function(*args, **kwargs) -> T:
+        start = time.perf_counter()
+        in_progress.inc()
+        try:
+            with start_span(provider, "client", model= model_name or None, prompt_chars= get_prompt_chars(kwargs)) as span:
+                result = function(*args, **kwargs)
+                record_span_usage(span, result)
+        except BaseException as e:
+            finish(start, e)
+            raise
+        finish(start)
+        return result
+    return timed_function
+
+def get_prompt_chars(kwargs: Dict[str, Any]) -> Optional[int]:
+    messages = kwargs.get("messages")
+    if not messages:
+        return None
+    return sum(len(message.get("content") or "") for message in messages)
+
+def record_span_usage(span: Any, result: Any):
+    usage = getattr(result, "usage", None)
+    if span is not None and usage is not None:
+        span.set_attributes(prompt_tokens= getattr(usage, "prompt_tokens", None),
+                            completion_tokens= getattr(usage, "completion_tokens", None))
+
+class RequestMetricsMiddleware:
+    """ASGI middleware counting the requests in flight and timing them by route.
+
+    A request is timed until the last chunk of its response body is sent, so the streamed
+    responses are counted in flight and timed until the end of their stream.
+
+    Args:
+        app (ASGIApp): application wrapped by the middleware.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        method = scope["method"]
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        start = time.perf_counter()
+        status = 500
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            in_progress.dec()
+            # the route is only known once the request was routed, raw paths would explode the label values
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUEST_SECONDS.labels(path, method, str(status)).observe(time.perf_counter() - start)
+
+        async def send_message(message: Message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            await self.app(scope, receive, send_message)
+        finally:
+            # e.g. the application raised or the client disconnected mid-stream
+            finish()
+
+def record_token_usage(completion: Any, step_name: Optional[str], model_name: str):
+    """Count the prompt and completion tokens of an LLM completion.
+
+    Args:
+        completion (Any): completion returned by the provider
+        step_name (str, optional): step making the call
+        model_name (str): model called
+    """
+    usage = getattr(completion, "usage", None)
+    if usage is None:
+        return
+    step_name = step_name or "unknown"
+    if usage.prompt_tokens:
+        LLM_TOKENS.labels(step_name, model_name, "prompt").inc(usage.prompt_tokens)
+    if usage.completion_tokens:
+        LLM_TOKENS.labels(step_name, model_name, "completion").inc(usage.completion_tokens)
+
+class PipelineCollector:
+    """Read the counters kept by the caches, the executor and the rate limiters at scrape time."""
+
+    def describe(self) -> list:
+        # no description, so that registering the collector does not build the caches
+        return []
+
+    def collect(self) -> Iterator[Union[CounterMetricFamily, GaugeMetricFamily]]:
+        # imported here, the modules are loaded by the application before the first scrape
+        from utils.llm_utils import get_llm_cache
+        from utils.search_utils import get_search_cache
+        from utils.executor import get_executor
+        from utils.rate_limit import get_rate_limit_stats
+
+        cache_operations = CounterMetricFamily("cache_operations",
+                                               "Operations of the LLM and search caches",
+                                               labels= ["cache", "operation"])
+        for cache_name, get_cache in (("llm", get_llm_cache), ("search", get_search_cache)):
+            try:
+                cache_stats = get_cache().stats.as_dict()
+            except Exception as e:
+                logger.warning(f"Could not read the {cache_name} cache stats: {e}")
+                continue
+            for operation, count in cache_stats.items():
+                cache_operations.add_metric([cache_name, operation], count)
+        yield cache_operations
+
+        executor_stats = get_executor().stats()
+        executor_tasks = GaugeMetricFamily("executor_tasks",
+                                           "Tasks of the pipeline executor",
+                                           labels= ["state"])
+        executor_tasks.add_metric(["running"], executor_stats["running"])
+        executor_tasks.add_metric(["queued"], executor_stats["queued"])
+        yield executor_tasks
+        yield GaugeMetricFamily("executor_workers",
+                                "Worker threads of the pipeline executor",
+                                value= executor_stats["workers"])
+        yield GaugeMetricFamily("executor_max_workers",
+                                "Worker threads the pipeline executor may start",
+                                value= executor_stats["max_workers"])
+
+        rate_limit_stats = get_rate_limit_stats()
+        rate_limit_scale = GaugeMetricFamily("rate_limit_scale",
+                                             "Share of the configured rate admitted by the rate limiters",
+                                             labels= ["limiter"])
+        rate_limit_wait = CounterMetricFamily("rate_limit_wait_seconds",
+                                              "Seconds the calls waited for the rate limiters",
+                                              labels= ["limiter"])
+        rate_limit_throttled = CounterMetricFamily("rate_limit_throttled",
+                                                   "Calls rejected by the providers for exceeding their rate limit",
+                                                   labels= ["limiter"])
+        for limiter_name, limiter_stats in rate_limit_stats.items():
+            rate_limit_scale.add_metric([limiter_name], limiter_stats["scale"])
+            rate_limit_wait.add_metric([limiter_name], limiter_stats["wait_seconds"])
+            rate_limit_throttled.add_metric([limiter_name], limiter_stats["throttled"])
+        yield rate_limit_scale
+        yield rate_limit_wait
+        yield rate_limit_throttled
+
+def register_pipeline_collector():
+    """Register the PipelineCollector once in the default registry."""
+    global COLLECTOR_REGISTERED
+    with COLLECTOR_LOCK:
+        if not COLLECTOR_REGISTERED:
+            REGISTRY.register(PipelineCollector())
+            COLLECTOR_REGISTERED = True
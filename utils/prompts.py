@@ -19,6 +19,29 @@ A good search query should:
 5. Be concise yet comprehensive enough to find relevant results
 """
 
+# Fused query preprocessing prompt
+# Used to generate the search query and the search dates of a question in a single call
+QUERY_PREPROCESSING_PROMPT = """
+You are a Benchmarking assistant preparing research questions for internet search. Given a question your task is to 
+produce 2 things at once:
+
+1. An effective search query that will help find relevant information to answer the question. A good search query should:
+- Extract the key concepts from the question
+- Use precise, specific terminology
+- Exclude unnecessary words or context
+- Include alternative terms or synonyms when helpful
+- Be concise yet comprehensive enough to find relevant results
+
+2. The search dates if available, if not return None:
+- From date: if there is a period or a starting point in the question, extract it as a date in the YYYY-MM-DD format
+- To date: similarily extract the end of the search period if the user specifies it through an exact date or period
+
+When several numbered questions are given, return one entry per question with its question number.
+
+DO NOT ANSWER THE QUESTIONS
+STICK TO YOUR TASK
+"""
+
 # Query decomposition prompt
 # Used to break down complex research queries into specific sub-questions
 QUERY_DECOMPOSITION_PROMPT = """
@@ -202,6 +225,38 @@ CONCLUSION (300-400 words):
 The generated report should be final containing all of the necessary elements and ready to be read by a user who hasn't seen
 the previous report so it shouldn't start with Updated report or show any signs that it's gone through revisions"""
 
+REPORT_MERGED_UPDATE_PROMPT = """
+You are a Benchmarking assistant specialized in report generation. Given an existing report answering a main question 
+and several extra questions we explored that are required for this report to improve, along with the search results of 
+each question as well as the analysis of these findings.
+
+Update the given report with the findings of ALL the explored questions at once while maintaining the general structure 
+of the report: EXECUTIVE SUMMARY, INTRODUCTION, SUB-QUESTION SECTIONS, ANALYSIS SECTION and CONCLUSION.
+- Integrate each explored question either into the most relevant existing sub-question section or into a new dedicated section
+- Keep every citation of sources and add the new ones
+- Revise the executive summary and the conclusion when the new findings change the key insights
+- Resolve contradictions between the new findings and the existing content explicitly
+
+The generated report should be final containing all of the necessary elements and ready to be read by a user who hasn't seen
+the previous report so it shouldn't start with Updated report or show any signs that it's gone through revisions"""
+
+REPORT_PATCH_PROMPT = """
+You are a Benchmarking assistant specialized in report generation. Given the numbered sections of an existing report answering 
+a main question, and the search results and analysis of one or several extra questions we explored to improve the report, 
+you are to produce the minimal list of patches integrating these findings into the report.
+
+Some sections are given in full, the others only through an excerpt. The available patch operations are:
+- replace: rewrite the whole content of a section, ONLY for sections given in full
+- append: add paragraphs at the end of a section, for sections given as an excerpt or when the existing content stays valid
+- add: create a new section inserted after the given section number, for findings that do not fit an existing section
+
+Each new section should follow the structure of the sub-question sections: a descriptive title, a brief overview, 
+a "Key Findings" box, the detailed answer with citation of sources, a confidence indicator, information gaps and key sources.
+Update the executive summary and the conclusion when the new findings change the key insights.
+Write the content in markdown WITHOUT the section heading, the heading is generated from the title.
+DO NOT repeat content that is already in the report
+"""
+
 PRESENTATION_OUTLINE_GENERATION_PROMPT = """
 You are a presentation slide generating assistant. Given a question and its benchmark report you are to generate me 
 a general outline of a powerpoint presentation to encapsulate the main points and contents of the report but in 
@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
-from typing import List
-from datetime import date
+from typing import List, Literal, Any, Dict, Optional
+from datetime import date, datetime
 from linkup.types import LinkupSource
 
 class SearchRequest(BaseModel):
@@ -119,9 +119,30 @@ class QueriesInsightAnalysis(BaseModel):
     main_query: QueryAnalysis
     sub_queries: List[QueryAnalysis]
 
+class QueryExploration(BaseModel):
+    query: str = Field(..., description="explored question")
+    search_results: QuerySearchResults = Field(..., description="deep search results of the question")
+    analysis: QueryAnalysis = Field(..., description="analysis of the search results")
+
+class ReportSection(BaseModel):
+    """Addressable section of a report.
+
+    Attributes:
+        level (int): Markdown heading level, 0 for the text preceding the first heading.
+        title (str): Heading of the section.
+        content (str): Body of the section.
+    """
+    level: int = Field(default=0, description="markdown heading level")
+    title: str = Field(default="", description="heading of the section")
+    content: str = Field(default="", description="body of the section")
+
 class QueryReport(BaseModel):
     main_query: str = Field(..., description="query to research")
     report: str = Field(..., description="generated report")
+    sections: List[ReportSection] = Field(
+        default_factory=list,
+        description="report split into sections, kept in sync with the report by the patch updates"
+    )
 
 class ReportNextSteps(BaseModel):
     main_query: str = Field(..., description="original query")
@@ -146,4 +167,40 @@ class PresentationContents(BaseModel):
 class PresentenOutput(BaseModel):
     presentation_id : str
     file_path : str
-    edit_path : str
\ No newline at end of file
+    edit_path : str
+
+class JobArtifact(BaseModel):
+    """Intermediate artifact produced by a pipeline job.
+
+    Attributes:
+        sequence (int): Order of the artifact within the job.
+        event (str): Pipeline event that produced the artifact.
+        data (Any): Content of the artifact.
+        created_at (datetime): Time at which the artifact was produced.
+    """
+    sequence: int
+    event: str
+    data: Any
+    created_at: datetime
+
+class JobRecord(BaseModel):
+    """State of a benchmark submitted to the job API.
+
+    Attributes:
+        job_id (str): Identifier of the job.
+        status (str): Current status of the job.
+        request (SearchRequest): Submitted benchmark request.
+        model_name (str): Model used by the pipeline.
+        result (Dict[str, Any]): Output of the presentation step once the job succeeded.
+        error (str): Failure reason if the job failed.
+        created_at (datetime): Submission time.
+        updated_at (datetime): Last status change.
+    """
+    job_id: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    request: SearchRequest
+    model_name: str
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    created_at: datetime
+    updated_at: datetime
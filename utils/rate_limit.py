@@ -0,0 +1,320 @@
+"""
+Client side rate limiting of the LLM and search calls.
+
+Every provider (and optionally every provider/model pair) gets a limiter made of a request
+bucket (RATE_LIMIT_RPM) and a token bucket (RATE_LIMIT_TPM). A call reserves one request
+and its estimated prompt tokens before it is sent; the completion tokens are charged once
+the usage is known. Reservations are served in arrival order: a caller waits until the
+buckets have refilled the debt of the callers ahead of it, so calls queue fairly instead of
+being sent and rejected.
+
+The admitted rate adapts to the provider (AIMD): a rate limit error halves it and pauses the
+limiter for the Retry-After of the answer, every successful call raises it back by a small
+step. `concurrency_limit` turns the admitted rate and the observed latency into the number
+of calls worth running at the same time, used to size the fan-out of the searches.
+"""
+from utils.config import get_settings
+from utils.retry_utils import get_retry_after
+from utils.tracing import start_span
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, TypeVar
+import asyncio
+import functools
+import linkup
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RATE_LIMITERS_LOCK = threading.Lock()
+RATE_LIMITERS: Dict[Tuple[str, Optional[str]], "RateLimiter"] = {}
+
+RATE_LIMIT_DECREASE = 0.5
+RATE_LIMIT_INCREASE = 0.02
+RATE_LIMIT_MIN_SCALE = 0.1
+
+class TokenBucket:
+    """Bucket refilled at a constant rate, that callers can run into debt to reserve capacity.
+
+    Args:
+        per_minute (float): Units refilled per minute.
+        burst_seconds (float): Seconds of refill the bucket holds, the burst allowed after an idle period.
+    """
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.per_minute = per_minute
+        self.burst_seconds = burst_seconds
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst_seconds, 1.0)
+        self.level = self.capacity
+        self.updated_at = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """Take units from the bucket and get the seconds to wait until they are refilled."""
+        self.refill()
+        self.level -= amount
+        return max(0.0, -self.level / self.rate)
+
+    def set_scale(self, scale: float):
+        self.refill()
+        self.rate = self.per_minute * scale / 60
+        self.capacity = max(self.rate * self.burst_seconds, 1.0)
+        self.level = min(self.level, self.capacity)
+
+    def pause(self, seconds: float):
+        """Empty the bucket so that the next reservations wait at least the given seconds."""
+        self.refill()
+        self.level = min(self.level, -seconds * self.rate)
+
+class RateLimiter:
+    """Requests and tokens per minute limits of a destination.
+
+    Args:
+        name (str): Name of the destination in the logs.
+        requests_per_minute (float, optional): Requests admitted per minute, unlimited if None.
+        tokens_per_minute (float, optional): Tokens admitted per minute, unlimited if None.
+        burst_seconds (float): Seconds of the rates admitted at once after an idle period.
+    """
+
+    def __init__(self,
+                 name: str,
+                 requests_per_minute: Optional[float] = None,
+                 tokens_per_minute: Optional[float] = None,
+                 burst_seconds: float = 10.0):
+        self.name = name
+        self.requests = TokenBucket(requests_per_minute, burst_seconds) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds) if tokens_per_minute else None
+        self.scale = 1.0
+        self.latency: Optional[float] = None
+        self.tokens_per_call: Optional[float] = None
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = {"calls": 0, "delayed": 0, "wait_seconds": 0.0, "throttled": 0}
+        self.in_flight = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.requests is not None or self.tokens is not None
+
+    def reserve(self, tokens: int = 0) -> float:
+        """Reserve a request and its prompt tokens.
+
+        Args:
+            tokens (int): estimated prompt tokens of the call
+
+        Returns:
+            float: seconds to wait before sending the call
+        """
+        with self._lock:
+            delay = 0.0
+            if self.requests is not None:
+                delay = max(delay, self.requests.reserve(1))
+            if self.tokens is not None and tokens:
+                delay = max(delay, self.tokens.reserve(tokens))
+            self._counters["calls"] += 1
+            if delay > 0:
+                self._counters["delayed"] += 1
+                self._counters["wait_seconds"] += delay
+            self.in_flight += 1
+            return delay
+
+    def cancel(self, tokens: int = 0):
+        """Give back the reservation of a call cancelled before it was sent."""
+        with self._lock:
+            self.in_flight -= 1
+            if self.requests is not None:
+                self.requests.level += 1
+            if self.tokens is not None and tokens:
+                self.tokens.level += tokens
+
+    def record_success(self, latency: float, reserved_tokens: int = 0, used_tokens: Optional[int] = None):
+        """Settle the tokens of a call with its usage and raise the admitted rate."""
+        with self._lock:
+            self.in_flight -= 1
+            self.latency = latency if self.latency is None else 0.2 * latency + 0.8 * self.latency
+            if used_tokens is not None:
+                self.tokens_per_call = (used_tokens if self.tokens_per_call is None
+                                        else 0.2 * used_tokens + 0.8 * self.tokens_per_call)
+                if self.tokens is not None:
+                    self.tokens.refill()
+                    self.tokens.level -= used_tokens - reserved_tokens
+            if self.scale < 1.0:
+                self.set_scale(min(1.0, self.scale + RATE_LIMIT_INCREASE))
+
+    def record_failure(self, error: Exception):
+        """Lower the admitted rate and pause the limiter when the call was rate limited."""
+        with self._lock:
+            self.in_flight -= 1
+            if not is_rate_limit_error(error):
+                return
+            self._counters["throttled"] += 1
+            self.set_scale(max(RATE_LIMIT_MIN_SCALE, self.scale * RATE_LIMIT_DECREASE))
+            retry_after = get_retry_after(error)
+            if retry_after:
+                for bucket in (self.requests, self.tokens):
+                    if bucket is not None:
+                        bucket.pause(retry_after)
+            logger.warning(f"{self.name} rate limited the calls, admitting {self.scale:.0%} of the configured rate")
+
+    def set_scale(self, scale: float):
+        self.scale = scale
+        for bucket in (self.requests, self.tokens):
+            if bucket is not None:
+                bucket.set_scale(scale)
+
+    def concurrency_limit(self) -> Optional[int]:
+        """Get the number of calls worth running at the same time (admitted rate x latency).
+
+        Returns:
+            Optional[int]: concurrency matching the admitted rate, None while it is unknown or unlimited.
+        """
+        with self._lock:
+            if self.latency is None:
+                return None
+            calls_per_second = []
+            if self.requests is not None:
+                calls_per_second.append(self.requests.rate)
+            if self.tokens is not None and self.tokens_per_call:
+                calls_per_second.append(self.tokens.rate / self.tokens_per_call)
+            if not calls_per_second:
+                return None
+            return max(1, math.ceil(min(calls_per_second) * self.latency))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"calls": int(self._counters["calls"]),
+                    "delayed": int(self._counters["delayed"]),
+                    "wait_seconds": self._counters["wait_seconds"],
+                    "throttled": int(self._counters["throttled"]),
+                    "in_flight": self.in_flight,
+                    "scale": self.scale,
+                    "latency": self.latency}
+
+    def wrap(self, function: Callable[..., T], tokens: int = 0) -> Callable[..., T]:
+        """Rate limit every call of a function, e.g. every attempt of a retried call.
+
+        Args:
+            function (Callable[..., T]): function making the call
+            tokens (int): estimated prompt tokens of the call
+
+        Returns:
+            Callable[..., T]: function waiting for its turn before calling
+        """
+        if not self.enabled:
+            return function
+
+        @functools.wraps(function)
+        def limited(*args, **kwargs) -> T:
+            delay = self.reserve(tokens)
+            if delay > 0:
+                logger.debug(f"Waiting {delay:.2f}s for the {self.name} rate limit")
+                try:
+                    with start_span("rate_limit_wait", limiter= self.name):
+                        time.sleep(delay)
+                except BaseException:
+                    # e.g. the task was cancelled while waiting for its turn
+                    self.cancel(tokens)
+                    raise
+            start = time.monotonic()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException as e:
+                self.record_failure(e)
+                raise
+            self.record_success(time.monotonic() - start, tokens, get_used_tokens(result))
+            return result
+        return limited
+
+    def wrap_async(self, function: Callable[..., Awaitable[T]], tokens: int = 0) -> Callable[..., Awaitable[T]]:
+        """Rate limit every call of a coroutine function, see `wrap`."""
+        if not self.enabled:
+            return function
+
+        @functools.wraps(function)
+        async def limited(*args, **kwargs) -> T:
+            delay = self.reserve(tokens)
+            if delay > 0:
+                logger.debug(f"Waiting {delay:.2f}s for the {self.name} rate limit")
+                try:
+                    with start_span("rate_limit_wait", limiter= self.name):
+                        await asyncio.sleep(delay)
+                except BaseException:
+                    # e.g. the task was cancelled while waiting for its turn
+                    self.cancel(tokens)
+                    raise
+            start = time.monotonic()
+            try:
+                result = await function(*args, **kwargs)
+            except BaseException as e:
+                self.record_failure(e)
+                raise
+            self.record_success(time.monotonic() - start, tokens, get_used_tokens(result))
+            return result
+        return limited
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    return (isinstance(error, linkup.LinkupTooManyRequestsError)
+            or getattr(error, "status_code", None) == 429)
+
+def get_used_tokens(result: Any) -> Optional[int]:
+    usage = getattr(result, "usage", None)
+    return getattr(usage, "total_tokens", None)
+
+def get_rate_limiter(destination: str, model_name: str = None) -> RateLimiter:
+    """Get the process wide rate limiter of a destination.
+
+    The limits of `destination/model_name` in RATE_LIMIT_RPM and RATE_LIMIT_TPM take
+    precedence over the limits of the destination, the pairs without limits of their own
+    share the limiter of the destination.
+
+    Args:
+        destination (str): service called
+        model_name (str, optional): model called
+
+    Returns:
+        RateLimiter: limiter shared by all the calls to the destination (and model)
+    """
+    settings = get_settings()
+    model_key = f"{destination}/{model_name}"
+    if model_key not in settings.rate_limit_rpm and model_key not in settings.rate_limit_tpm:
+        model_name = None
+    with RATE_LIMITERS_LOCK:
+        key = (destination, model_name)
+        if key not in RATE_LIMITERS:
+            name = f"{destination}/{model_name}" if model_name else destination
+            if settings.rate_limit_enabled:
+                RATE_LIMITERS[key] = RateLimiter(name,
+                                                 requests_per_minute= settings.rate_limit_rpm.get(name),
+                                                 tokens_per_minute= settings.rate_limit_tpm.get(name),
+                                                 burst_seconds= settings.rate_limit_burst_seconds)
+            else:
+                RATE_LIMITERS[key] = RateLimiter(name)
+        return RATE_LIMITERS[key]
+
+def limit_concurrency(destination: str, max_concurrency: int) -> int:
+    """Cap a fan-out to the concurrency the rate limiter of the destination admits.
+
+    Args:
+        destination (str): service called by the fan-out
+        max_concurrency (int): configured concurrency
+
+    Returns:
+        int: concurrency to use
+    """
+    concurrency_limit = get_rate_limiter(destination).concurrency_limit()
+    if concurrency_limit is not None and concurrency_limit < max_concurrency:
+        logger.info(f"Limiting the {destination} concurrency to {concurrency_limit} to match its rate limit")
+        return concurrency_limit
+    return max_concurrency
+
+def get_rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    with RATE_LIMITERS_LOCK:
+        limiters = list(RATE_LIMITERS.values())
+    return {limiter.name: limiter.stats() for limiter in limiters}
@@ -0,0 +1,164 @@
+"""
+Collection of functions handling the report as a list of addressable sections
+"""
+from utils.pydantic_models import QueryReport, ReportSection
+from utils.schemas import ReportPatch
+from typing import List, Set
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+
+def split_report_sections(report: str) -> List[ReportSection]:
+    """Split a markdown report on its top level headings.
+
+    The top level is the highest heading level used more than once, so that a single
+    document title does not swallow the whole report. The text preceding the first
+    split heading is kept as a level 0 section so that rendering the sections keeps
+    the whole report.
+
+    Args:
+        report (str): markdown report
+
+    Returns:
+        List[ReportSection]: sections of the report
+    """
+    lines = report.splitlines()
+    heading_levels = [len(match.group(1)) for match in map(HEADING_PATTERN.match, lines) if match]
+    if not heading_levels:
+        return [ReportSection(content= report.strip())]
+    repeated_levels = [level for level in set(heading_levels) if heading_levels.count(level) > 1]
+    top_level = min(repeated_levels or heading_levels)
+    sections = []
+    current_section = ReportSection()
+    current_lines = []
+    for line in lines:
+        match = HEADING_PATTERN.match(line)
+        if match and len(match.group(1)) == top_level:
+            current_section.content = "\n".join(current_lines).strip()
+            if current_section.level or current_section.content:
+                sections.append(current_section)
+            current_section = ReportSection(level= top_level, title= match.group(2))
+            current_lines = []
+        else:
+            current_lines.append(line)
+    current_section.content = "\n".join(current_lines).strip()
+    sections.append(current_section)
+    return sections
+
+def render_report_sections(sections: List[ReportSection]) -> str:
+    """Render the sections back into a markdown report.
+
+    Args:
+        sections (List[ReportSection]): sections of the report
+
+    Returns:
+        str: markdown report
+    """
+    rendered_sections = []
+    for section in sections:
+        if section.level:
+            rendered_sections.append(f"{'#' * section.level} {section.title}\n\n{section.content}".strip())
+        else:
+            rendered_sections.append(section.content)
+    return "\n\n".join(rendered_sections)
+
+def get_report_sections(report_obj: QueryReport) -> List[ReportSection]:
+    """Get the sections of a report, splitting the text if they were not stored yet.
+
+    Args:
+        report_obj (QueryReport): report
+
+    Returns:
+        List[ReportSection]: sections of the report
+    """
+    if report_obj.sections:
+        return [section.model_copy() for section in report_obj.sections]
+    return split_report_sections(report_obj.report)
+
+def select_full_sections(sections: List[ReportSection], context_chars: int) -> Set[int]:
+    """Select the sections given in full to the model within a character budget.
+
+    The first and last sections (executive summary and conclusion) come first,
+    then the others in order while the budget allows.
+
+    Args:
+        sections (List[ReportSection]): sections of the report
+        context_chars (int): budget of characters of full section contents
+
+    Returns:
+        Set[int]: indexes of the sections given in full
+    """
+    priority_order = [0, len(sections) - 1] + list(range(1, len(sections) - 1))
+    full_sections = set()
+    used_chars = 0
+    for index in dict.fromkeys(priority_order):
+        section_chars = len(sections[index].content)
+        if used_chars + section_chars <= context_chars:
+            full_sections.add(index)
+            used_chars += section_chars
+    return full_sections
+
+def format_sections_for_prompt(sections: List[ReportSection], full_sections: Set[int], excerpt_chars: int) -> str:
+    """Format the numbered sections of the report, in full or as an excerpt.
+
+    Args:
+        sections (List[ReportSection]): sections of the report
+        full_sections (Set[int]): indexes of the sections given in full
+        excerpt_chars (int): number of characters of the excerpts
+
+    Returns:
+        str: numbered sections
+    """
+    formatted_sections = []
+    for i, section in enumerate(sections):
+        title = section.title or "(untitled introduction)"
+        if i in full_sections:
+            formatted_sections.append(f"Section {i + 1} [full]: {title}\n{section.content}")
+        else:
+            excerpt = section.content[:excerpt_chars].rstrip()
+            formatted_sections.append(f"Section {i + 1} [excerpt]: {title}\n{excerpt} ...")
+    return "\n\n".join(formatted_sections)
+
+def apply_report_patches(sections: List[ReportSection],
+                         patches: List[ReportPatch],
+                         full_sections: Set[int]) -> List[ReportSection]:
+    """Apply the patches to the sections of a report.
+
+    Section numbers refer to the report before patching. Replacing a section that the
+    model only saw as an excerpt is downgraded to an append so no content is lost, and
+    patches targeting an unknown section are added at the end of the report.
+
+    Args:
+        sections (List[ReportSection]): sections of the report
+        patches (List[ReportPatch]): patches generated by the model
+        full_sections (Set[int]): indexes of the sections given in full to the model
+
+    Returns:
+        List[ReportSection]: patched sections
+    """
+    patched_sections = [section.model_copy() for section in sections]
+    new_section_level = max([section.level for section in sections if section.level], default=2)
+    insertions = {}
+    for patch in patches:
+        index = patch.section_number - 1
+        if patch.operation == "add" or not 0 <= index < len(patched_sections):
+            if patch.operation != "add":
+                logger.warning(f"Patch targets unknown section {patch.section_number}, adding it at the end")
+                index = len(patched_sections) - 1
+            first_position = 0 if not patched_sections[0].level else -1
+            position = min(max(index, first_position), len(patched_sections) - 1)
+            insertions.setdefault(position, []).append(ReportSection(level= new_section_level,
+                                                                     title= patch.title or "Additional Findings",
+                                                                     content= patch.content.strip()))
+        elif patch.operation == "replace" and index in full_sections:
+            patched_sections[index].content = patch.content.strip()
+            if patch.title and patched_sections[index].level:
+                patched_sections[index].title = patch.title
+        else:
+            patched_sections[index].content = f"{patched_sections[index].content}\n\n{patch.content.strip()}".strip()
+    for position in sorted(insertions, reverse=True):
+        patched_sections[position + 1:position + 1] = insertions[position]
+    return patched_sections
@@ -0,0 +1,246 @@
+"""
+Retry policies of the LLM and search calls.
+
+A call failing with a transient error (timeout, connection error, rate limit, 5xx) is
+retried with exponential backoff and full jitter, up to the attempts of its policy and
+as long as the retry budget of its destination allows it. Fatal errors (bad request,
+authentication, invalid output) are raised right away.
+
+The retry budget caps the retries to a share of the calls (RETRY_BUDGET_RATIO) so that a
+provider outage does not multiply the load by the number of attempts.
+"""
+from pydantic import BaseModel, Field
+from utils.config import get_settings
+from utils.tracing import set_span_attributes
+from typing import Awaitable, Callable, Dict, Optional, TypeVar
+import cerebras.cloud.sdk as cerebras_sdk
+import linkup
+import asyncio
+import httpx
+import logging
+import random
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRY_BUDGETS_LOCK = threading.Lock()
+RETRY_BUDGETS: Dict[str, "RetryBudget"] = {}
+
+RETRYABLE_STATUS_CODES = {408, 409, 425, 429, 500, 502, 503, 504}
+
+RETRYABLE_ERRORS = (
+    TimeoutError,
+    asyncio.TimeoutError,
+    ConnectionError,
+    httpx.TimeoutException,
+    httpx.TransportError,
+    cerebras_sdk.APIConnectionError,
+    linkup.LinkupTooManyRequestsError,
+    linkup.LinkupUnknownError,
+)
+
+class RetryPolicy(BaseModel):
+    """Attempts, backoff and timeout of the calls of a step.
+
+    Attributes:
+        max_attempts (int): Number of attempts including the first call.
+        base_delay (float): Seconds of the backoff before the first retry, doubled on every retry.
+        max_delay (float): Cap of the backoff in seconds.
+        timeout (float, optional): Seconds a single attempt may take.
+    """
+    max_attempts: int = Field(default=3, ge=1)
+    base_delay: float = Field(default=0.5, ge=0)
+    max_delay: float = Field(default=8.0, ge=0)
+    timeout: Optional[float] = Field(default=None, gt=0)
+
+    def get_delay(self, attempt: int, error: Exception = None) -> float:
+        """Get the backoff before the retry following the given attempt (full jitter).
+
+        A Retry-After header sent with the error is honored when it is longer.
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_delay))
+        return delay
+
+class RetryBudget:
+    """Token bucket allowing the retries of a destination.
+
+    Every call deposits `ratio` tokens and every retry withdraws one, so retries stay
+    below `ratio` of the calls once the initial `min_tokens` are spent.
+
+    Args:
+        ratio (float): Retries allowed per call.
+        min_tokens (float): Tokens available at start, also the floor the bucket refills to.
+        max_tokens (float): Cap of the bucket.
+    """
+
+    def __init__(self, ratio: float, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max(max_tokens, min_tokens)
+        self._tokens = min_tokens
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.exhausted = 0
+
+    def record_call(self):
+        with self._lock:
+            self._tokens = min(self.max_tokens, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1:
+                self._tokens -= 1
+                self.retries += 1
+                return True
+            self.exhausted += 1
+            return False
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers or "retry-after" not in headers:
+        return None
+    try:
+        return float(headers["retry-after"])
+    except ValueError:
+        return None
+
+def is_retryable_error(error: Exception) -> bool:
+    """Classify an error as transient (worth retrying) or fatal.
+
+    Args:
+        error (Exception): error raised by a call
+
+    Returns:
+        bool: whether the call may succeed if retried
+    """
+    if isinstance(error, RETRYABLE_ERRORS):
+        return True
+    # the SambaNova SDK is only imported once a SambaNova client was built
+    sambanova_sdk = sys.modules.get("sambanova")
+    if sambanova_sdk is not None and isinstance(error, sambanova_sdk.APIConnectionError):
+        return True
+    status_code = getattr(error, "status_code", None)
+    if status_code is None and isinstance(error, httpx.HTTPStatusError):
+        status_code = error.response.status_code
+    return status_code in RETRYABLE_STATUS_CODES
+
+def get_retry_policy(step_name: str = None) -> RetryPolicy:
+    """Get the retry policy of a step, with its timeout from LLM_STEP_TIMEOUTS.
+
+    Args:
+        step_name (str, optional): step making the call
+
+    Returns:
+        RetryPolicy: policy built from the settings
+    """
+    settings = get_settings()
+    return RetryPolicy(max_attempts= settings.retry_max_attempts,
+                       base_delay= settings.retry_base_delay,
+                       max_delay= settings.retry_max_delay,
+                       timeout= settings.llm_step_timeouts.get(step_name, settings.llm_timeout))
+
+def get_search_retry_policy() -> RetryPolicy:
+    settings = get_settings()
+    return RetryPolicy(max_attempts= settings.retry_max_attempts,
+                       base_delay= settings.retry_base_delay,
+                       max_delay= settings.retry_max_delay,
+                       timeout= settings.search_read_timeout)
+
+def get_retry_budget(destination: str) -> RetryBudget:
+    """Get the process wide retry budget of a destination.
+
+    Args:
+        destination (str): service called
+
+    Returns:
+        RetryBudget: budget shared by all the calls to the destination
+    """
+    with RETRY_BUDGETS_LOCK:
+        if destination not in RETRY_BUDGETS:
+            RETRY_BUDGETS[destination] = RetryBudget(ratio= get_settings().retry_budget_ratio)
+        return RETRY_BUDGETS[destination]
+
+def should_retry(error: Exception, attempt: int, policy: RetryPolicy, budget: RetryBudget, description: str) -> bool:
+    if not is_retryable_error(error):
+        logger.error(f"{description} failed with a fatal error: {error!r}")
+        return False
+    if attempt >= policy.max_attempts:
+        logger.error(f"{description} failed after {attempt} attempts: {error!r}")
+        return False
+    if not budget.try_spend():
+        logger.error(f"{description} failed and the retry budget is exhausted: {error!r}")
+        return False
+    return True
+
+def call_with_retry(function: Callable[..., T],
+                    *args,
+                    policy: RetryPolicy,
+                    budget: RetryBudget,
+                    description: str = "call",
+                    **kwargs) -> T:
+    """Call a function, retrying it on transient errors.
+
+    Args:
+        function (Callable[..., T]): function making the call
+        *args: arguments of the function
+        policy (RetryPolicy): attempts and backoff of the call
+        budget (RetryBudget): retry budget of the destination
+        description (str): name of the call in the logs
+        **kwargs: keyword arguments of the function
+
+    Returns:
+        T: result of the first successful attempt
+    """
+    budget.record_call()
+    attempt = 1
+    while True:
+        try:
+            return function(*args, **kwargs)
+        except Exception as e:
+            if not should_retry(e, attempt, policy, budget, description):
+                raise
+            delay = policy.get_delay(attempt, e)
+            logger.warning(f"{description} attempt {attempt} failed with {e!r}, retrying in {delay:.2f}s")
+            set_span_attributes(retries= attempt)
+            time.sleep(delay)
+            attempt += 1
+
+async def call_with_retry_async(function: Callable[..., Awaitable[T]],
+                                *args,
+                                policy: RetryPolicy,
+                                budget: RetryBudget,
+                                description: str = "call",
+                                **kwargs) -> T:
+    """Await a coroutine function, retrying it on transient errors.
+
+    Args:
+        function (Callable[..., Awaitable[T]]): coroutine function making the call
+        *args: arguments of the function
+        policy (RetryPolicy): attempts and backoff of the call
+        budget (RetryBudget): retry budget of the destination
+        description (str): name of the call in the logs
+        **kwargs: keyword arguments of the function
+
+    Returns:
+        T: result of the first successful attempt
+    """
+    budget.record_call()
+    attempt = 1
+    while True:
+        try:
+            return await function(*args, **kwargs)
+        except Exception as e:
+            if not should_retry(e, attempt, policy, budget, description):
+                raise
+            delay = policy.get_delay(attempt, e)
+            logger.warning(f"{description} attempt {attempt} failed with {e!r}, retrying in {delay:.2f}s")
+            set_span_attributes(retries= attempt)
+            await asyncio.sleep(delay)
+            attempt += 1
@@ -5,7 +5,7 @@ This module contains all system schemas used by LLM calls in various steps of th
 research pipeline to ensure consistency and make prompt management easier.
 """
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Literal
 
 class EnhancedSearchQuery(BaseModel):
     search_query: str = Field(...,description="The enhanced search query")
@@ -22,6 +22,22 @@ class SearchDates(BaseModel):
     from_date: str = Field(..., description="Search date start")
     to_date: str = Field(..., description="Search date end")
 
+class PreprocessedQuery(BaseModel):
+    search_query: str = Field(..., description="The enhanced search query")
+    reasoning: str = Field(..., description="Reasoning as to how the search query was generated")
+    from_date: str = Field(..., description="Search date start")
+    to_date: str = Field(..., description="Search date end")
+
+class NumberedPreprocessedQuery(BaseModel):
+    question_number: int = Field(..., description="Number of the question the search query was generated for")
+    search_query: str = Field(..., description="The enhanced search query")
+    reasoning: str = Field(..., description="Reasoning as to how the search query was generated")
+    from_date: str = Field(..., description="Search date start")
+    to_date: str = Field(..., description="Search date end")
+
+class PreprocessedQueryList(BaseModel):
+    queries: List[NumberedPreprocessedQuery] = Field(..., description="List of preprocessed queries, one per question")
+
 class NextQuestion(BaseModel):
     question: str = Field(..., description="Question to be explored to supplement the report")
     reasoning: str = Field(..., description="The reasoning for why this question should be explored")
@@ -29,6 +45,15 @@ class NextQuestion(BaseModel):
 class NextQuestionList(BaseModel):
     questions: List[NextQuestion] = Field(..., description="List of next questions")
 
+class ReportPatch(BaseModel):
+    operation: Literal["replace", "append", "add"] = Field(..., description="replace the content of a section, append content to it or add a new section after it")
+    section_number: int = Field(..., description="Number of the targeted section, for add the new section is inserted after it and 0 inserts it first")
+    title: str = Field(..., description="Title of the section, the new title for replace and add")
+    content: str = Field(..., description="New content of the section, or the content to append")
+
+class ReportPatchList(BaseModel):
+    patches: List[ReportPatch] = Field(..., description="List of patches to apply to the report")
+
 class Slide(BaseModel):
     title: str = Field(..., description="Title of the slide")
     content: str = Field(..., description="Content of the slide")
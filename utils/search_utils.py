@@ -1,31 +1,248 @@
 from linkup import LinkupClient
-from pydantic import SecretStr
-from typing import Literal, List
+from typing import Any, Dict, Literal, List, Optional
 from datetime import date
 from pydantic import BaseModel
-from linkup.types import LinkupSourcedAnswer
+from linkup.types import LinkupSearchResults, LinkupSourcedAnswer
 from utils.pydantic_models import QuerySearchResults, QuerySubQueryResults
+from utils.cache_utils import TieredCache, LRUCacheBackend, SQLiteCacheBackend, make_cache_key
+from utils.config import get_settings
+from utils.http_utils import get_http_client, get_async_http_client, get_http_timeout
+from utils.retry_utils import call_with_retry, call_with_retry_async, get_search_retry_policy, get_retry_budget
+from utils.rate_limit import get_rate_limiter
+from utils.metrics import track_step, track_provider_call
+from utils.tracing import set_span_attributes
+from utils.cassette import cassette_call, cassette_call_async
+from contextvars import ContextVar
+from functools import lru_cache, partial
+import asyncio
+import httpx
+import logging
+import os
+import threading
+import time
 
+logger = logging.getLogger(__name__)
 
-def get_linkup_client(api_key: SecretStr) -> LinkupClient:
+SEARCH_CACHE_LOCK = threading.Lock()
+LINKUP_CLIENT_LOCK = threading.Lock()
+
+
+LINKUP_BASE_URL = "https://api.linkup.so/v1"
+
+# monotonic time by which the search of the current thread or task must be over
+SEARCH_DEADLINE: ContextVar[Optional[float]] = ContextVar("search_deadline", default= None)
+
+class SearchTimeoutError(Exception):
+    """The search ran out of its timeout before its next attempt, it is not retried."""
+
+class PooledLinkupClient(LinkupClient):
+    """Linkup client sending its requests through the shared connection pools.
+
+    The SDK opens a new HTTP client, and so a new TLS connection, for every search and
+    disables the timeouts; this client reuses the pooled clients and their timeouts, shortened
+    to the time left before the deadline of a search given a timeout.
+    Server errors are raised as `httpx.HTTPStatusError` so they can be retried, the SDK
+    fails on their non JSON bodies.
+
+    Args:
+        api_key (str): The API key for the Linkup client.
+        base_url (str): Base URL of the Linkup API.
+    """
+
+    def __init__(self, api_key: str, base_url: str = LINKUP_BASE_URL):
+        super().__init__(api_key= api_key, base_url= base_url)
+        self.base_url = base_url.rstrip("/")
+
+    def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        if kwargs.get("timeout", httpx.USE_CLIENT_DEFAULT) is None:
+            kwargs["timeout"] = get_search_request_timeout()
+        response = get_http_client("linkup").request(method= method,
+                                                     url= f"{self.base_url}{url}",
+                                                     headers= self._headers(),
+                                                     **kwargs)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+    async def _async_request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        if kwargs.get("timeout", httpx.USE_CLIENT_DEFAULT) is None:
+            kwargs["timeout"] = get_search_request_timeout()
+        response = await get_async_http_client("linkup").request(method= method,
+                                                                 url= f"{self.base_url}{url}",
+                                                                 headers= self._headers(),
+                                                                 **kwargs)
+        if response.status_code >= 500:
+            response.raise_for_status()
+        return response
+
+def get_search_request_timeout() -> Any:
+    """Get the timeouts of a Linkup request, bounded by the deadline of the search.
+
+    Raises:
+        SearchTimeoutError: the deadline of the search is over
+
+    Returns:
+        Any: timeouts of the pooled client when the search has no deadline
+    """
+    deadline = SEARCH_DEADLINE.get()
+    if deadline is None:
+        return httpx.USE_CLIENT_DEFAULT
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise SearchTimeoutError("The search ran out of its timeout")
+    timeout = get_http_timeout("linkup")
+    return httpx.Timeout(connect= min(timeout.connect, remaining),
+                         read= min(timeout.read, remaining),
+                         write= min(timeout.write, remaining),
+                         pool= min(timeout.pool, remaining))
+
+def get_linkup_client(api_key: Optional[str] = None) -> LinkupClient:
     """Get the Linkup client.
 
     Args:
-        api_key (SecretStr): The API key for the Linkup client.
+        api_key (str, optional): The API key for the Linkup client, LINKUP_API_KEY by default.
 
     Returns:
         LinkupClient: The Linkup client.
     """
-    client = LinkupClient(api_key= api_key)
+    client = PooledLinkupClient(api_key= api_key or os.environ.get("LINKUP_API_KEY"),
+                                base_url= get_settings().linkup_base_url)
     return client
 
+def get_shared_linkup_client() -> LinkupClient:
+    """Get the process wide Linkup client, built on first use.
+
+    Returns:
+        LinkupClient: client of LINKUP_API_KEY sending its requests through the shared pools.
+    """
+    with LINKUP_CLIENT_LOCK:
+        return build_shared_linkup_client()
+
+@lru_cache
+def build_shared_linkup_client() -> LinkupClient:
+    return get_linkup_client()
+
+def get_search_cache() -> TieredCache:
+    """Get the process wide cache of the Linkup sourced answers.
+
+    Returns:
+        TieredCache: in-memory LRU tier in front of the SQLite tier.
+    """
+    with SEARCH_CACHE_LOCK:
+        return build_search_cache()
+
+@lru_cache
+def build_search_cache() -> TieredCache:
+    settings = get_settings()
+    backends = []
+    if settings.search_cache_memory_entries > 0:
+        backends.append(LRUCacheBackend(max_entries= settings.search_cache_memory_entries))
+    if settings.search_cache_max_bytes > 0:
+        backends.append(SQLiteCacheBackend(path= settings.search_cache_path,
+                                           max_size_bytes= settings.search_cache_max_bytes,
+                                           table= "search_results"))
+    return TieredCache(backends)
+
+def normalize_search_query(query: str) -> str:
+    """Normalize the query so that trivially different spellings share a cache entry.
+
+    Args:
+        query (str): search query.
+
+    Returns:
+        str: lower cased query with collapsed whitespaces.
+    """
+    return " ".join(query.lower().split())
+
+def get_search_cache_ttl(from_date: date = None,
+                         to_date: date = None,
+                         current_date: date = None) -> Optional[float]:
+    """Get how long a search result stays valid depending on its date window.
+
+    A window that ended before today cannot receive new results so it is cached forever.
+
+    Args:
+        from_date (date, optional): start of the search window.
+        to_date (date, optional): end of the search window.
+        current_date (date, optional): reference date. Defaults to today.
+
+    Returns:
+        Optional[float]: ttl in seconds, None for no expiry.
+    """
+    current_date = current_date or date.today()
+    if to_date is not None and to_date < current_date:
+        return None
+    return get_settings().search_cache_ttl
+
+def is_search_cacheable(output_type: str, structured_output_schema: BaseModel = None) -> bool:
+    return get_settings().search_cache_enabled and output_type == "sourcedAnswer" and structured_output_schema is None
+
+def make_search_cache_key(query: str, search_mode: str, output_type: str, from_date: date, to_date: date) -> str:
+    return make_cache_key(normalize_search_query(query), search_mode, output_type, from_date, to_date)
+
+def get_cached_search(cache_key: str) -> Optional[LinkupSourcedAnswer]:
+    """Get a cached search result, cache failures are treated as misses.
+
+    Args:
+        cache_key (str): hash of the search inputs.
+
+    Returns:
+        Optional[LinkupSourcedAnswer]: the cached sourced answer if any.
+    """
+    try:
+        cached_value = get_search_cache().get(cache_key)
+        if cached_value is not None:
+            return LinkupSourcedAnswer.model_validate_json(cached_value)
+    except Exception as e:
+        logger.warning(f"Could not read the search cache: {e}")
+    return None
+
+def cache_search(cache_key: str, search_response: LinkupSourcedAnswer, from_date: date, to_date: date):
+    """Store a search result in the cache, cache failures are only logged.
+
+    Args:
+        cache_key (str): hash of the search inputs.
+        search_response (LinkupSourcedAnswer): search result to store.
+        from_date (date): start of the search window.
+        to_date (date): end of the search window.
+    """
+    try:
+        get_search_cache().set(cache_key, search_response.model_dump_json(), get_search_cache_ttl(from_date, to_date))
+    except Exception as e:
+        logger.warning(f"Could not write to the search cache: {e}")
+
+def make_cassette_request(search_kwargs: Dict[str, Any]) -> Dict[str, Any]:
+    schema = search_kwargs.get("structured_output_schema")
+    if isinstance(schema, type) and issubclass(schema, BaseModel):
+        schema = schema.__name__
+    return {**search_kwargs, "structured_output_schema": schema, "step": "search"}
+
+def dump_search_response(search_response: Any) -> Any:
+    if isinstance(search_response, BaseModel):
+        return search_response.model_dump(mode= "json")
+    return search_response
+
+def load_search_response(data: Any,
+                         output_type: str,
+                         structured_output_schema: BaseModel = None) -> Any:
+    """Parse a recorded search response like the Linkup SDK parses the API responses."""
+    if output_type == "searchResults":
+        return LinkupSearchResults.model_validate(data)
+    if output_type == "sourcedAnswer":
+        return LinkupSourcedAnswer.model_validate(data)
+    if isinstance(structured_output_schema, type) and issubclass(structured_output_schema, BaseModel):
+        return structured_output_schema.model_validate(data)
+    return data
+
+@track_step("search")
 def search_linkup(client: LinkupClient,
                   query: str,
                   search_mode: Literal["standard", "deep"] = "standard",
                   output_type: Literal["searchResults", "sourcedAnswer", "structured"] = "sourcedAnswer",
                   structured_output_schema: BaseModel = None,
                   from_date: date = None,
-                  to_date: date = None) -> LinkupSourcedAnswer:
+                  to_date: date = None,
+                  timeout: float = None) -> LinkupSourcedAnswer:
     """Search the Linkup client.
 
     Args:
@@ -36,10 +253,12 @@ def search_linkup(client: LinkupClient,
         structured_output_schema: BaseModel = None: Pydantic structured output schema default to None.
         from_date: date = None: The from date default to None.
         to_date: date = None: The to date default to None.
+        timeout: float = None: Seconds the search may take with its retries, the read timeout of each attempt if None.
 
     Returns:
-        LinkupSourcedAnswer: The Linkup sourced answer.
+        LinkupSourcedAnswer: The Linkup sourced answer, served from the search cache for repeated searches.
     """
+    set_span_attributes(query= query)
     kwargs = {
         "query": query,
         "depth": search_mode,
@@ -49,9 +268,107 @@ def search_linkup(client: LinkupClient,
         "to_date": to_date
     }
     kwargs = {k: v for k, v in kwargs.items() if v is not None}
-    search_response = client.search(**kwargs)
+    use_cache = is_search_cacheable(output_type, structured_output_schema)
+    if use_cache:
+        cache_key = make_search_cache_key(query, search_mode, output_type, from_date, to_date)
+        cached_search = get_cached_search(cache_key)
+        if cached_search is not None:
+            logger.info(f"Search cache hit for {query}")
+            set_span_attributes(cache_hit= True)
+            return cached_search
+    deadline_token = SEARCH_DEADLINE.set(time.monotonic() + timeout if timeout else None)
+    try:
+        search_response = cassette_call("search",
+                                        make_cassette_request(kwargs),
+                                        partial(call_with_retry,
+                                                get_rate_limiter("linkup").wrap(track_provider_call(client.search, "linkup", search_mode)),
+                                                **kwargs,
+                                                policy= get_search_retry_policy(),
+                                                budget= get_retry_budget("linkup"),
+                                                description= f"Search of {query}"),
+                                        dump= dump_search_response,
+                                        load= partial(load_search_response,
+                                                      output_type= output_type,
+                                                      structured_output_schema= structured_output_schema))
+    finally:
+        SEARCH_DEADLINE.reset(deadline_token)
+    if use_cache:
+        cache_search(cache_key, search_response, from_date, to_date)
     return search_response
 
+@track_step("search")
+async def search_linkup_async(client: LinkupClient,
+                              query: str,
+                              search_mode: Literal["standard", "deep"] = "standard",
+                              output_type: Literal["searchResults", "sourcedAnswer", "structured"] = "sourcedAnswer",
+                              structured_output_schema: BaseModel = None,
+                              from_date: date = None,
+                              to_date: date = None,
+                              timeout: float = None) -> LinkupSourcedAnswer:
+    """Search the Linkup client without blocking the event loop.
+
+    Args:
+        client (LinkupClient): The Linkup client.
+        query: str: The query to be searched.
+        search_mode: Literal["standard", "deep"] = "standard": The search mode.
+        output_type: Literal["searchResults", "sourcedAnswer", "structured"] = "sourcedAnswer": Linkup output type.
+        structured_output_schema: BaseModel = None: Pydantic structured output schema default to None.
+        from_date: date = None: The from date default to None.
+        to_date: date = None: The to date default to None.
+        timeout: float = None: Seconds the search may take with its retries, the read timeout of each attempt if None.
+
+    Returns:
+        LinkupSourcedAnswer: The Linkup sourced answer, served from the search cache for repeated searches.
+    """
+    set_span_attributes(query= query)
+    kwargs = {
+        "query": query,
+        "depth": search_mode,
+        "output_type": output_type,
+        "structured_output_schema": structured_output_schema,
+        "from_date": from_date,
+        "to_date": to_date
+    }
+    kwargs = {k: v for k, v in kwargs.items() if v is not None}
+    use_cache = is_search_cacheable(output_type, structured_output_schema)
+    if use_cache:
+        cache_key = make_search_cache_key(query, search_mode, output_type, from_date, to_date)
+        cached_search = await asyncio.to_thread(get_cached_search, cache_key)
+        if cached_search is not None:
+            logger.info(f"Search cache hit for {query}")
+            set_span_attributes(cache_hit= True)
+            return cached_search
+    deadline_token = SEARCH_DEADLINE.set(time.monotonic() + timeout if timeout else None)
+    try:
+        search_response = await cassette_call_async("search",
+                                                    make_cassette_request(kwargs),
+                                                    partial(call_with_retry_async,
+                                                            get_rate_limiter("linkup").wrap_async(track_provider_call(client.async_search, "linkup", search_mode)),
+                                                            **kwargs,
+                                                            policy= get_search_retry_policy(),
+                                                            budget= get_retry_budget("linkup"),
+                                                            description= f"Search of {query}"),
+                                                    dump= dump_search_response,
+                                                    load= partial(load_search_response,
+                                                                  output_type= output_type,
+                                                                  structured_output_schema= structured_output_schema))
+    finally:
+        SEARCH_DEADLINE.reset(deadline_token)
+    if use_cache:
+        await asyncio.to_thread(cache_search, cache_key, search_response, from_date, to_date)
+    return search_response
+
+def fallback_search_output(query: str) -> LinkupSourcedAnswer:
+    """Placeholder search result for a query whose search failed or timed out.
+
+    Args:
+        query (str): query that could not be searched
+
+    Returns:
+        LinkupSourcedAnswer: empty sourced answer
+    """
+    return LinkupSourcedAnswer(answer=f"No search results could be retrieved for: {query}", sources=[])
+
 def format_outputs(queries: List[str], 
                    search_results: List[LinkupSourcedAnswer],
                    search_mode: Literal["standard", "deep"] = "standard") -> QuerySubQueryResults:
@@ -1,20 +1,50 @@
-import requests
 from typing import Dict
 from utils.pydantic_models import PresentenOutput
+from utils.http_utils import get_http_client, get_async_http_client
+from utils.metrics import track_provider_call
+from utils.config import get_settings
+from utils.cassette import cassette_call, cassette_call_async
+
+def keep_response(response):
+    # the slide responses are plain JSON, recorded and replayed as they are
+    return response
 
 def generate_slides(content, num_slides, language, template, export_type):
-    response = requests.post(
-        "http://localhost:4000/api/v1/ppt/presentation/generate",
-        json={
-            "content": content,
-            "n_slides": num_slides,
-            "language": language,
-            "template": template,
-            "export_as": export_type
-        }
-    )
-    # print(response.json())
-    return response.json()
+    payload = {
+        "content": content,
+        "n_slides": num_slides,
+        "language": language,
+        "template": template,
+        "export_as": export_type
+    }
+
+    def post_slides():
+        response = track_provider_call(get_http_client("slides").post, "slides")(
+            get_settings().slides_url,
+            json= payload
+        )
+        # print(response.json())
+        return response.json()
+
+    return cassette_call("slides", payload, post_slides, dump= keep_response, load= keep_response)
+
+async def generate_slides_async(content, num_slides, language, template, export_type):
+    payload = {
+        "content": content,
+        "n_slides": num_slides,
+        "language": language,
+        "template": template,
+        "export_as": export_type
+    }
+
+    async def post_slides():
+        response = await track_provider_call(get_async_http_client("slides").post, "slides")(
+            get_settings().slides_url,
+            json= payload
+        )
+        return response.json()
+
+    return await cassette_call_async("slides", payload, post_slides, dump= keep_response, load= keep_response)
 
 def format_presenten_outputs(response: Dict[str, str]) -> PresentenOutput:
     presentation_id = response["presentation_id"]
@@ -23,4 +53,4 @@ def format_presenten_outputs(response: Dict[str, str]) -> PresentenOutput:
     request_output = PresentenOutput(presentation_id= presentation_id,
                                      file_path= file_path,
                                      edit_path= edit_path)
-    return request_output
\ No newline at end of file
+    return request_output
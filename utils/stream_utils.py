@@ -0,0 +1,30 @@
+"""
+Helpers for streaming the pipeline progress to the clients as Server-Sent Events
+"""
+from pydantic_core import to_jsonable_python
+from typing import Any
+import json
+
+def format_sse_event(event: str, data: Any) -> str:
+    """Format a Server-Sent Event.
+
+    Args:
+        event (str): name of the event.
+        data (Any): payload of the event, pydantic objects are serialized to JSON.
+
+    Returns:
+        str: the event in the text/event-stream format.
+    """
+    payload = json.dumps(to_jsonable_python(data), ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+def format_sse_comment(comment: str) -> str:
+    """Format a Server-Sent Events comment, ignored by the clients but keeping the connection busy.
+
+    Args:
+        comment (str): text of the comment.
+
+    Returns:
+        str: the comment in the text/event-stream format.
+    """
+    return f": {comment}\n\n"
@@ -0,0 +1,217 @@
+"""
+Structured calls of the steps: the JSON schema response format of every schema and the
+validated parsing of the answers into the schema models.
+
+The response format of a schema is built once per model class and shared by all the calls
+asking for it, it must not be mutated. The answers are parsed and validated in a single pass
+by `model_validate_json`, or by `orjson` when STRUCTURED_OUTPUT_JSON_BACKEND=orjson and the
+package is installed.
+
+An answer that does not validate is repaired locally first (see utils/json_repair.py): the
+fences, trailing commas and truncated arrays are fixed without another round trip. The model
+is called again only when no repair validates, up to STRUCTURED_OUTPUT_MAX_RECALLS times,
+before the error reaches the fallback of the step. The answers parsed, repaired, recalled and
+failed are counted by step.
+"""
+from cerebras.cloud.sdk import Cerebras, AsyncCerebras
+from cerebras.cloud.sdk.types.chat.chat_completion import ChatCompletion
+from functools import lru_cache
+from pydantic import BaseModel, ValidationError
+from utils.config import get_settings
+from utils.json_repair import iter_json_repairs
+from utils.cache_utils import make_cache_key
+from utils.llm_utils import (format_output_schema,
+                             call_cerebras_model,
+                             call_cerebras_model_async,
+                             evict_completion,
+                             is_llm_cache_enabled)
+from utils.metrics import STRUCTURED_OUTPUTS
+from utils.tracing import set_span_attributes
+from typing import Any, Dict, Optional, Type, TypeVar
+import asyncio
+import importlib.util
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+SchemaModel = TypeVar("SchemaModel", bound= BaseModel)
+
+ORJSON_AVAILABLE = importlib.util.find_spec("orjson") is not None
+
+STRUCTURED_OUTPUT_STATS_LOCK = threading.Lock()
+STRUCTURED_OUTPUT_STATS: Dict[str, int] = {"parsed": 0, "repaired": 0, "recalled": 0, "failed": 0}
+
+@lru_cache(maxsize= None)
+def get_response_format(schema_model: Type[BaseModel]) -> Dict[str, Any]:
+    """Get the JSON schema response format of a schema, built on its first use.
+
+    Args:
+        schema_model (Type[BaseModel]): schema of the answer
+
+    Returns:
+        Dict[str, Any]: response format shared by every call, not to be mutated
+    """
+    return format_output_schema(schema_model.model_json_schema())
+
+def is_orjson_enabled() -> bool:
+    """Check whether the answers are parsed by orjson.
+
+    Returns:
+        bool: STRUCTURED_OUTPUT_JSON_BACKEND is orjson and the `orjson` package is installed.
+    """
+    settings = get_settings()
+    if settings.structured_output_json_backend == "orjson" and not ORJSON_AVAILABLE:
+        logger.debug("orjson requested but the orjson package is not installed, using the parser of pydantic")
+    return settings.structured_output_json_backend == "orjson" and ORJSON_AVAILABLE
+
+def record_structured_output(step_name: Optional[str], outcome: str):
+    """Count how the answer of a structured call was parsed.
+
+    Args:
+        step_name (str, optional): step making the call
+        outcome (str): parsed, repaired, recalled or failed
+    """
+    with STRUCTURED_OUTPUT_STATS_LOCK:
+        STRUCTURED_OUTPUT_STATS[outcome] += 1
+    STRUCTURED_OUTPUTS.labels(step_name or "unknown", outcome).inc()
+
+def get_structured_output_stats() -> Dict[str, int]:
+    """Answers of the structured calls parsed as is, repaired locally, recalled and failed since the start."""
+    with STRUCTURED_OUTPUT_STATS_LOCK:
+        return dict(STRUCTURED_OUTPUT_STATS)
+
+def validate_json(content: str, schema_model: Type[SchemaModel]) -> SchemaModel:
+    if is_orjson_enabled():
+        import orjson
+        try:
+            return schema_model.model_validate(orjson.loads(content))
+        except orjson.JSONDecodeError:
+            # raised again by pydantic as a ValidationError with the position of the error
+            pass
+    return schema_model.model_validate_json(content)
+
+def repair_structured_output(content: str, schema_model: Type[SchemaModel]) -> Optional[SchemaModel]:
+    """Validate the repaired versions of a malformed answer.
+
+    Args:
+        content (str): answer of the model
+        schema_model (Type[SchemaModel]): schema of the answer
+
+    Returns:
+        Optional[SchemaModel]: the first repair following the schema, None if no repair does
+    """
+    for candidate in iter_json_repairs(content):
+        try:
+            return validate_json(candidate, schema_model)
+        except ValueError:
+            continue
+    return None
+
+def parse_structured_output(completion: ChatCompletion,
+                            schema_model: Type[SchemaModel],
+                            step_name: str = None) -> SchemaModel:
+    """Parse and validate the answer of a structured call, repairing it when it is malformed.
+
+    Args:
+        completion (ChatCompletion): completion of the model
+        schema_model (Type[SchemaModel]): schema of the answer
+        step_name (str): step making the call, for the counts
+
+    Raises:
+        ValueError: the answer is empty
+        pydantic.ValidationError: the answer does not follow the schema and could not be repaired
+
+    Returns:
+        SchemaModel: the validated answer
+    """
+    content = completion.choices[0].message.content
+    if not content:
+        raise ValueError(f"Empty answer for the {schema_model.__name__} schema")
+    try:
+        parsed_output = validate_json(content, schema_model)
+    except ValidationError:
+        if not get_settings().structured_output_repair_enabled:
+            raise
+        parsed_output = repair_structured_output(content, schema_model)
+        if parsed_output is None:
+            raise
+        logger.info(f"Repaired a malformed {schema_model.__name__} answer of {step_name or 'a step'}")
+        set_span_attributes(structured_output= "repaired")
+        record_structured_output(step_name, "repaired")
+        return parsed_output
+    record_structured_output(step_name, "parsed")
+    return parsed_output
+
+def call_structured_model(client: Cerebras,
+                          system_prompt: str,
+                          model_name: str,
+                          prompt: str,
+                          schema_model: Type[SchemaModel],
+                          step_name: str = None) -> SchemaModel:
+    """Call the model with the response format of a schema and validate its answer.
+
+    An answer that can not be parsed nor repaired is evicted from the LLM cache and asked
+    again, up to STRUCTURED_OUTPUT_MAX_RECALLS times.
+
+    Args:
+        client (Cerebras): The Cerebras client.
+        system_prompt (str): The system prompt.
+        model_name (str): The name of the model to be used.
+        prompt (str): The prompt.
+        schema_model (Type[SchemaModel]): The schema of the answer.
+        step_name (str): The name of the calling step.
+
+    Raises:
+        ValueError: The last answer could not be parsed nor repaired.
+
+    Returns:
+        SchemaModel: The validated answer of the model.
+    """
+    response_format = get_response_format(schema_model)
+    max_recalls = get_settings().structured_output_max_recalls
+    for attempt in range(max_recalls + 1):
+        output = call_cerebras_model(client, system_prompt, model_name, prompt, response_format,
+                                     step_name= step_name, refresh_cache= attempt > 0)
+        try:
+            return parse_structured_output(output, schema_model, step_name)
+        except ValueError as e:
+            evict_invalid_output(system_prompt, model_name, prompt, response_format, step_name)
+            handle_invalid_output(schema_model, step_name, e, will_recall= attempt < max_recalls)
+
+async def call_structured_model_async(client: AsyncCerebras,
+                                      system_prompt: str,
+                                      model_name: str,
+                                      prompt: str,
+                                      schema_model: Type[SchemaModel],
+                                      step_name: str = None) -> SchemaModel:
+    """Call the model with the response format of a schema without blocking the event loop, see `call_structured_model`."""
+    response_format = get_response_format(schema_model)
+    max_recalls = get_settings().structured_output_max_recalls
+    for attempt in range(max_recalls + 1):
+        output = await call_cerebras_model_async(client, system_prompt, model_name, prompt, response_format,
+                                                 step_name= step_name, refresh_cache= attempt > 0)
+        try:
+            return parse_structured_output(output, schema_model, step_name)
+        except ValueError as e:
+            await asyncio.to_thread(evict_invalid_output, system_prompt, model_name, prompt, response_format, step_name)
+            handle_invalid_output(schema_model, step_name, e, will_recall= attempt < max_recalls)
+
+def evict_invalid_output(system_prompt: str,
+                         model_name: str,
+                         prompt: str,
+                         response_format: Dict[str, Any],
+                         step_name: Optional[str]):
+    """Remove an answer that could not be parsed nor repaired from the LLM cache, so it is never served again."""
+    if is_llm_cache_enabled(step_name):
+        evict_completion(make_cache_key(model_name, system_prompt, prompt, response_format))
+
+def handle_invalid_output(schema_model: Type[BaseModel], step_name: Optional[str], error: ValueError, will_recall: bool):
+    """Count an answer that could not be parsed nor repaired, raise the error when it is not asked again."""
+    if not will_recall:
+        record_structured_output(step_name, "failed")
+        raise error
+    reason = error.errors(include_input= False)[0]["msg"] if isinstance(error, ValidationError) else str(error)
+    logger.warning(f"Invalid {schema_model.__name__} answer of {step_name or 'a step'} could not be repaired, "
+                   f"calling the model again: {reason}")
+    record_structured_output(step_name, "recalled")
@@ -0,0 +1,200 @@
+"""
+Token budgets of the prompts built by the pipeline steps.
+
+Tokens are estimated from the number of characters with a ratio per model family,
+close enough to size the prompts without loading the tokenizers of every model.
+When a prompt does not fit in its budget, the variable parts (search results,
+analyses) are trimmed, the least valuable ones first, while the fixed parts
+(questions, instructions, existing report) are kept whole.
+"""
+from utils.config import get_settings
+from typing import List, Optional
+import logging
+import math
+import re
+
+logger = logging.getLogger(__name__)
+
+MODEL_CONTEXT_WINDOWS = {
+    "llama-4-scout-17b-16e-instruct": 32768,
+    "llama3.1-8b": 32768,
+    "llama-3.3-70b": 65536,
+    "qwen-3-32b": 65536,
+    "qwen-3-235b-a22b-instruct-2507": 65536,
+    "qwen-3-235b-a22b-thinking-2507": 65536,
+    "gpt-oss-120b": 65536,
+}
+DEFAULT_CONTEXT_WINDOW = 32768
+
+MODEL_FAMILY_CHARS_PER_TOKEN = {
+    "llama": 3.8,
+    "qwen": 3.5,
+    "gpt-oss": 4.0,
+}
+DEFAULT_CHARS_PER_TOKEN = 3.5
+
+TRIM_MARKER = " [...]"
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
+def get_chars_per_token(model_name: str) -> float:
+    """Get the average number of characters per token of the model tokenizer.
+
+    Args:
+        model_name (str): name of the model
+
+    Returns:
+        float: characters per token
+    """
+    for family, chars_per_token in MODEL_FAMILY_CHARS_PER_TOKEN.items():
+        if model_name.startswith(family):
+            return chars_per_token
+    return DEFAULT_CHARS_PER_TOKEN
+
+def estimate_tokens(text: str, model_name: str) -> int:
+    """Estimate the number of tokens of a text for a model.
+
+    Args:
+        text (str): text to count
+        model_name (str): name of the model
+
+    Returns:
+        int: estimated number of tokens
+    """
+    return math.ceil(len(text) / get_chars_per_token(model_name))
+
+def get_context_window(model_name: str) -> int:
+    """Get the context window of a model in tokens.
+
+    Args:
+        model_name (str): name of the model
+
+    Returns:
+        int: context window, DEFAULT_CONTEXT_WINDOW for unknown models
+    """
+    return MODEL_CONTEXT_WINDOWS.get(model_name, DEFAULT_CONTEXT_WINDOW)
+
+def compact_prompt(prompt: str) -> str:
+    """Remove the indentation the multiline f-strings inject and the extra blank lines.
+
+    Args:
+        prompt (str): prompt to compact
+
+    Returns:
+        str: compacted prompt
+    """
+    lines = [line.strip() for line in prompt.splitlines()]
+    return BLANK_LINES_PATTERN.sub("\n\n", "\n".join(lines)).strip()
+
+def trim_text(text: str, max_chars: int) -> str:
+    """Trim a text to a number of characters, cutting at a line or sentence end when possible.
+
+    Args:
+        text (str): text to trim
+        max_chars (int): maximum number of characters of the trimmed text
+
+    Returns:
+        str: trimmed text ending with TRIM_MARKER when it was cut
+    """
+    if len(text) <= max_chars:
+        return text
+    if max_chars <= len(TRIM_MARKER):
+        return ""
+    cut_text = text[:max_chars - len(TRIM_MARKER)]
+    boundary = max(cut_text.rfind("\n"), cut_text.rfind(". "))
+    if boundary > len(cut_text) // 2:
+        cut_text = cut_text[:boundary + 1]
+    return cut_text.rstrip() + TRIM_MARKER
+
+def allocate_token_budget(sizes: List[int], weights: List[float], budget: int) -> List[int]:
+    """Share a token budget between parts proportionally to their weights.
+
+    Parts smaller than their share keep their size and the rest of their share goes
+    to the other parts, so only the parts that do not fit are trimmed, the ones with
+    the lowest weight the most.
+
+    Args:
+        sizes (List[int]): tokens of each part
+        weights (List[float]): value of each part
+        budget (int): tokens available for all the parts
+
+    Returns:
+        List[int]: tokens allocated to each part
+    """
+    allocations = list(sizes)
+    if sum(sizes) <= budget:
+        return allocations
+    remaining_budget = max(budget, 0)
+    remaining_weight = sum(weights)
+    for i in sorted(range(len(sizes)), key=lambda i: sizes[i] / weights[i]):
+        share = int(remaining_budget * weights[i] / remaining_weight) if remaining_weight else 0
+        allocations[i] = min(sizes[i], share)
+        remaining_budget -= allocations[i]
+        remaining_weight -= weights[i]
+    return allocations
+
+class PromptBudget:
+    """Token budget of the prompt of a pipeline step.
+
+    The budget is a share of the model context window (PROMPT_BUDGET_RATIO), the rest
+    is left for the completion, unless PROMPT_MAX_TOKENS caps it. The system prompt
+    is counted against the budget.
+
+    Args:
+        model_name (str): Model receiving the prompt.
+        step_name (str): Step building the prompt, used in the logs.
+        system_prompt (str): System prompt sent along the prompt.
+        max_prompt_tokens (int, optional): Budget overriding the settings.
+    """
+
+    def __init__(self,
+                 model_name: str,
+                 step_name: str,
+                 system_prompt: str = "",
+                 max_prompt_tokens: Optional[int] = None):
+        settings = get_settings()
+        self.model_name = model_name
+        self.step_name = step_name
+        self.chars_per_token = get_chars_per_token(model_name)
+        if max_prompt_tokens is None:
+            max_prompt_tokens = int(get_context_window(model_name) * settings.prompt_budget_ratio)
+            if settings.prompt_max_tokens is not None:
+                max_prompt_tokens = min(max_prompt_tokens, settings.prompt_max_tokens)
+        self.max_prompt_tokens = max_prompt_tokens
+        self.system_tokens = self.count(system_prompt)
+
+    @property
+    def available_tokens(self) -> int:
+        return max(self.max_prompt_tokens - self.system_tokens, 0)
+
+    def count(self, text: str) -> int:
+        return math.ceil(len(text) / self.chars_per_token)
+
+    def fit(self, fixed_prompt: str, texts: List[str], weights: List[float]) -> List[str]:
+        """Trim the variable parts of a prompt so that the whole prompt fits in the budget.
+
+        Args:
+            fixed_prompt (str): prompt built with every variable part left empty
+            texts (List[str]): variable parts of the prompt
+            weights (List[float]): value of each variable part, the lowest are trimmed first
+
+        Returns:
+            List[str]: variable parts, trimmed when the prompt does not fit
+        """
+        texts = [compact_prompt(text) for text in texts]
+        budget = self.available_tokens - self.count(fixed_prompt)
+        sizes = [self.count(text) for text in texts]
+        allocations = allocate_token_budget(sizes, weights, budget)
+        if allocations == sizes:
+            return texts
+        logger.warning(f"{self.step_name} prompt over budget, trimming {sum(sizes) - sum(allocations)} "
+                       f"tokens out of {sum(sizes)} from {sum(1 for size, allocation in zip(sizes, allocations) if allocation < size)} parts")
+        return [trim_text(text, int(allocation * self.chars_per_token))
+                for text, allocation in zip(texts, allocations)]
+
+    def log_usage(self, prompt: str):
+        """Log the size of the prompt against the budget."""
+        prompt_tokens = self.system_tokens + self.count(prompt)
+        if prompt_tokens > self.max_prompt_tokens:
+            logger.warning(f"{self.step_name} prompt uses {prompt_tokens}/{self.max_prompt_tokens} tokens with {self.model_name}")
+        else:
+            logger.info(f"{self.step_name} prompt uses {prompt_tokens}/{self.max_prompt_tokens} tokens with {self.model_name}")
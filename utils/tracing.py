@@ -0,0 +1,321 @@
+"""
+Tracing of the pipeline requests: a root span per request, a child span per step and per
+outbound LLM, search or slide call.
+
+The current span is kept in a context variable, so the spans opened by the asynchronous
+tasks, `asyncio.to_thread` and the tasks of the pipeline executor are parented to the span
+that started them. When the root span ends, the trace is handed to a background exporter
+writing one JSON line per trace to TRACING_EXPORT_PATH and/or posting it in the OTLP/HTTP
+JSON format to TRACING_OTLP_ENDPOINT (an OpenTelemetry collector or any stand-in). Both are
+off by default; the file is never rotated, so it is meant for local runs.
+
+Every exported trace carries its critical path: the chain of spans that blocked the
+completion of the request, found by walking back from the end of each span through the
+children that finished last. The critical path is logged, and the full waterfall at the
+debug level.
+"""
+from contextvars import ContextVar
+from functools import lru_cache
+from utils.config import get_settings
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import contextlib
+import functools
+import httpx
+import inspect
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+TRACE_EXPORTER_LOCK = threading.Lock()
+
+SERVICE_NAME = "deep-search"
+OTLP_SPAN_KINDS = {"internal": 1, "server": 2, "client": 3}
+
+CURRENT_SPAN: ContextVar[Optional["Span"]] = ContextVar("current_span", default= None)
+
+class Span:
+    """A timed operation of a trace.
+
+    Args:
+        trace (Trace): Trace the span belongs to.
+        name (str): Name of the operation.
+        kind (str): internal for the steps, server for the requests, client for the outbound calls.
+        parent_id (str, optional): Id of the parent span, None for the root span.
+        attributes (Dict[str, Any]): Attributes of the operation.
+    """
+
+    def __init__(self, trace: "Trace", name: str, kind: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.name = name
+        self.kind = kind
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.attributes = {key: value for key, value in attributes.items() if value is not None}
+        self.start_time = time.time()
+        self.end_time: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end_time or time.time()) - self.start_time
+
+    def set_attributes(self, **attributes):
+        self.attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    def end(self, error: Optional[BaseException] = None):
+        self.end_time = time.time()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.trace.add_span(self)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"span_id": self.span_id,
+                "parent_id": self.parent_id,
+                "name": self.name,
+                "kind": self.kind,
+                "start_time": self.start_time,
+                "end_time": self.end_time,
+                "duration": self.duration,
+                "attributes": self.attributes,
+                "error": self.error}
+
+class Trace:
+    """Spans of a request, collected as they end."""
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List[Span] = []
+        self.root: Optional[Span] = None
+        self._lock = threading.Lock()
+
+    def add_span(self, span: Span):
+        with self._lock:
+            if self.root is not None and self.root.end_time is not None and span is not self.root:
+                # abandoned calls (timed out searches, cancelled chains) ending after the request
+                return
+            self.spans.append(span)
+        if span is self.root:
+            get_trace_exporter().export(self)
+
+@contextlib.contextmanager
+def start_span(name: str, kind: str = "internal", **attributes) -> Iterator[Optional[Span]]:
+    """Open a span as a child of the current span, a root span of a new trace if there is none.
+
+    Args:
+        name (str): name of the operation
+        kind (str): internal, server or client
+        **attributes: attributes of the operation, None values are dropped
+
+    Yields:
+        Optional[Span]: the span, None when tracing is disabled
+    """
+    if not get_settings().tracing_enabled:
+        yield None
+        return
+    parent = CURRENT_SPAN.get()
+    if parent is None:
+        trace = Trace()
+        span = Span(trace, name, kind, None, attributes)
+        trace.root = span
+    else:
+        span = Span(parent.trace, name, kind, parent.span_id, attributes)
+    token = CURRENT_SPAN.set(span)
+    try:
+        yield span
+    except BaseException as e:
+        span.end(e)
+        raise
+    else:
+        span.end()
+    finally:
+        CURRENT_SPAN.reset(token)
+
+def traced(name: str, kind: str = "internal", **attributes) -> Callable[[Callable], Callable]:
+    """Decorate a function or coroutine function to run it in a span, see `start_span`."""
+    def decorator(function: Callable) -> Callable:
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def traced_coroutine(*args, **kwargs):
+                with start_span(name, kind, **attributes):
+                    return await function(*args, **kwargs)
+            return traced_coroutine
+
+        @functools.wraps(function)
+        def traced_function(*args, **kwargs):
+            with start_span(name, kind, **attributes):
+                return function(*args, **kwargs)
+        return traced_function
+    return decorator
+
+def set_span_attributes(**attributes):
+    """Add attributes to the current span, if any."""
+    span = CURRENT_SPAN.get()
+    if span is not None:
+        span.set_attributes(**attributes)
+
+def get_critical_path(trace: Trace) -> List[Span]:
+    """Get the spans that blocked the completion of the request, from the root down.
+
+    The blocking children of a span are found by walking back from its end: the child that
+    finished last, then the child that finished last before that one started, and so on.
+
+    Args:
+        trace (Trace): finished trace
+
+    Returns:
+        List[Span]: spans of the critical path, in the order they ran, parents before children
+    """
+    children: Dict[str, List[Span]] = {}
+    for span in trace.spans:
+        if span.parent_id is not None:
+            children.setdefault(span.parent_id, []).append(span)
+
+    def walk(span: Span) -> List[Span]:
+        path = [span]
+        blockers = []
+        cursor = span.end_time
+        for child in sorted(children.get(span.span_id, []), key=lambda child: child.end_time, reverse=True):
+            if child.end_time <= cursor:
+                blockers.append(child)
+                cursor = child.start_time
+        for child in reversed(blockers):
+            path.extend(walk(child))
+        return path
+
+    return walk(trace.root) if trace.root is not None else []
+
+def describe_span(span: Span) -> str:
+    details = [f"{key}={value}" for key, value in span.attributes.items()
+               if key in ("model", "provider", "question", "query")]
+    description = f"{span.name}({', '.join(details)})" if details else span.name
+    return f"{description} {span.duration:.2f}s"
+
+def format_waterfall(trace: Trace, critical_path: List[Span]) -> str:
+    """Render the spans of a trace as a waterfall, the critical path marked with a star.
+
+    Args:
+        trace (Trace): finished trace
+        critical_path (List[Span]): spans of the critical path
+
+    Returns:
+        str: a line per span with its start offset, duration and depth
+    """
+    children: Dict[str, List[Span]] = {}
+    for span in trace.spans:
+        if span.parent_id is not None:
+            children.setdefault(span.parent_id, []).append(span)
+    critical_ids = {span.span_id for span in critical_path}
+    lines = []
+
+    def render(span: Span, depth: int):
+        offset = span.start_time - trace.root.start_time
+        marker = "*" if span.span_id in critical_ids else " "
+        error = f" ERROR {span.error}" if span.error else ""
+        lines.append(f"{marker} {offset:8.2f}s {span.duration:8.2f}s {'  ' * depth}{describe_span(span)}{error}")
+        for child in sorted(children.get(span.span_id, []), key=lambda child: child.start_time):
+            render(child, depth + 1)
+
+    render(trace.root, 0)
+    return "\n".join(lines)
+
+def to_otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """Convert a trace to the OTLP/HTTP JSON encoding of an ExportTraceServiceRequest."""
+    spans = []
+    for span in trace.spans:
+        otlp_span = {"traceId": trace.trace_id,
+                     "spanId": span.span_id,
+                     "name": span.name,
+                     "kind": OTLP_SPAN_KINDS.get(span.kind, 1),
+                     "startTimeUnixNano": str(int(span.start_time * 1e9)),
+                     "endTimeUnixNano": str(int(span.end_time * 1e9)),
+                     "attributes": [{"key": key, "value": to_otlp_value(value)} for key, value in span.attributes.items()],
+                     "status": {"code": 2, "message": span.error} if span.error else {"code": 1}}
+        if span.parent_id is not None:
+            otlp_span["parentSpanId"] = span.parent_id
+        spans.append(otlp_span)
+    return {"resourceSpans": [{"resource": {"attributes": [{"key": "service.name",
+                                                            "value": {"stringValue": SERVICE_NAME}}]},
+                               "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}]}]}
+
+class TraceExporter:
+    """Background thread exporting the finished traces, so that the requests do not wait for it.
+
+    Args:
+        export_path (str, optional): JSON lines file the traces are appended to.
+        otlp_endpoint (str, optional): Base URL of an OTLP/HTTP collector.
+    """
+
+    def __init__(self, export_path: Optional[str] = None, otlp_endpoint: Optional[str] = None):
+        self.export_path = export_path
+        self.otlp_endpoint = otlp_endpoint.rstrip("/") if otlp_endpoint else None
+        directory = os.path.dirname(export_path) if export_path else None
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._queue: "queue.Queue[Trace]" = queue.Queue()
+        self._thread = threading.Thread(target= self._run, name= "trace-exporter", daemon= True)
+        self._thread.start()
+
+    def export(self, trace: Trace):
+        self._queue.put(trace)
+
+    def flush(self, timeout: float = 5.0):
+        """Wait for the queued traces to be exported."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _run(self):
+        while True:
+            trace = self._queue.get()
+            try:
+                self._export(trace)
+            except Exception as e:
+                logger.warning(f"Could not export the trace {trace.trace_id}: {e!r}")
+            finally:
+                self._queue.task_done()
+
+    def _export(self, trace: Trace):
+        critical_path = get_critical_path(trace)
+        logger.info(f"Critical path of trace {trace.trace_id}: {' > '.join(describe_span(span) for span in critical_path)}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Waterfall of trace {trace.trace_id}:\n{format_waterfall(trace, critical_path)}")
+        if self.export_path:
+            record = {"trace_id": trace.trace_id,
+                      "name": trace.root.name,
+                      "duration": trace.root.duration,
+                      "critical_path": [span.span_id for span in critical_path],
+                      "spans": [span.as_dict() for span in sorted(trace.spans, key=lambda span: span.start_time)]}
+            with open(self.export_path, "a") as export_file:
+                export_file.write(json.dumps(record, default= str) + "\n")
+        if self.otlp_endpoint:
+            response = httpx.post(f"{self.otlp_endpoint}/v1/traces", json= to_otlp(trace), timeout= 10)
+            response.raise_for_status()
+
+def get_trace_exporter() -> TraceExporter:
+    """Get the process wide exporter of the traces.
+
+    Returns:
+        TraceExporter: exporter configured by TRACING_EXPORT_PATH and TRACING_OTLP_ENDPOINT.
+    """
+    with TRACE_EXPORTER_LOCK:
+        return build_trace_exporter()
+
+@lru_cache
+def build_trace_exporter() -> TraceExporter:
+    settings = get_settings()
+    return TraceExporter(export_path= settings.tracing_export_path,
+                         otlp_endpoint= settings.tracing_otlp_endpoint)
@@ -1,70 +1,29 @@
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
 from utils.pydantic_models import SubQueriesSearchMetadata, QuerySearchMetadata, QuerySubQueryResults
+from utils.search_utils import fallback_search_output
+from utils.executor import get_executor
 from datetime import date
-from typing import List, Tuple, Callable
-from cerebras.cloud.sdk import Cerebras
+from typing import List, Tuple, Callable, Dict
+import asyncio
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
-def parallel_run_metadata(function: Callable, 
-                          num_max_workers: int, 
-                          params: List[str], 
-                          client: Cerebras, 
-                          model_name: str)-> List[any]:
-    """Parallel run the metadata extraction function.
+def parallel_map(function: Callable, 
+                 params: List[Tuple], 
+                 max_concurrency: int = None)-> List[any]:
+    """Run the function on every argument tuple with the shared executor of the process.
 
     Args:
         function: The function to be run.
-        num_max_workers: The number of workers to be used.
-        params: The parameters to be used.
-        client: The client to be used.
-        model_name: The model name to be used.
-    """
-    with ThreadPoolExecutor(max_workers=num_max_workers) as executor:
-        futures = [executor.submit(function, param, client, model_name) for param in params]
-        results = [f.result() for f in futures]
-    return results
-
-
-def parallel_process_queries(function: Callable, 
-                             num_max_workers: int, 
-                             params: List[any], 
-                             client: Cerebras, 
-                             model_name: str):
-    """Parallel process the queries processing function.
-
-    Args:
-        function: The function to be run.
-        num_max_workers: The number of workers to be used.
-        params: The parameters to be used.
-        client: The client to be used.
-        model_name: The model name to be used.
-    """
-    with ThreadPoolExecutor(max_workers=num_max_workers) as executor:
-        futures = [executor.submit(function, param, client, model_name) for param in params]
-        results = [f.result() for f in futures]
-    return results
+        params: The arguments of each call.
+        max_concurrency: The maximum number of these calls running at the same time.
 
-def parallel_analyze_output(function: Callable, 
-                            num_max_workers: int, 
-                            params: List[Tuple[any, any]], 
-                            main_question: str, 
-                            client: Cerebras, 
-                            model_name: str):
-    """Parallel process the search output analysis function.
-
-    Args:
-        function: The function to be run.
-        num_max_workers: The number of workers to be used.
-        params: The parameters to be used.
-        client: The client to be used.
-        model_name: The model name to be used.
+    Returns:
+        List[any]: The results in the order of the params.
     """
-    with ThreadPoolExecutor(max_workers=num_max_workers) as executor:
-        futures = [executor.submit(function, main_question, sub_question, search_result, client, model_name) for sub_question, search_result in params]
-        results = [f.result() for f in futures]
-    return results
+    return get_executor().map(function, params, max_concurrency= max_concurrency)
 
 def format_search_outputs(search_output: QuerySubQueryResults) -> List[Tuple[str, str]]:
     search_analysis_params = []
@@ -95,6 +54,109 @@ def sequential_run_search(function: Callable,
     return results
 
 
+def concurrent_run_search(function: Callable, 
+                          params: List[Tuple[str, date, date]], 
+                          client, search_mode, output_type,
+                          max_concurrency: int,
+                          timeout: float) -> List[any]:
+    """Concurrently run the searching linkup api call with a bounded number of searches in flight.
+
+    The results are returned in the order of the params. A search that raises or runs longer
+    than the timeout is replaced by a fallback result so one slow query cannot hold the request.
+    The timeout is also given to the search itself, which bounds its HTTP requests and retries:
+    a search run in place by a nested wait would not be interrupted otherwise.
+
+    Args:
+        function: Linkup API call function.
+        params: The list of parameters to be used.
+        client: linkup client.
+        search_mode: The search mode to be used.
+        output_type: The output type to be parsed.
+        max_concurrency: The maximum number of searches running at the same time.
+        timeout: The number of seconds a single search may run.
+    """
+    results = [None] * len(params)
+    start_times: Dict[int, float] = {}
+
+    def run_search(index: int, query: str, from_date: date, to_date: date):
+        start_times[index] = time.monotonic()
+        logger.info(f"Searching: {query} ...")
+        return function(client, query, search_mode, output_type, None, from_date, to_date, timeout)
+
+    executor = get_executor()
+    futures = executor.submit_batch(run_search, 
+                                    [(i, query, from_date, to_date) for i, (query, from_date, to_date) in enumerate(params)],
+                                    max_concurrency= max_concurrency)
+    pending = {future: i for i, future in enumerate(futures)}
+    try:
+        while pending:
+            now = time.monotonic()
+            deadlines = [start_times[i] + timeout for i in pending.values() if i in start_times]
+            wait_time = max(0.0, min(deadlines) - now) if deadlines else timeout
+            done, _ = executor.wait(pending, timeout=wait_time, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = pending.pop(future)
+                query = params[index][0]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logger.warning(f"Search failed for {query}: {e}")
+                    results[index] = fallback_search_output(query)
+            now = time.monotonic()
+            for future, index in list(pending.items()):
+                if index in start_times and now - start_times[index] >= timeout:
+                    logger.warning(f"Search timed out after {timeout}s for {params[index][0]}")
+                    results[index] = fallback_search_output(params[index][0])
+                    future.cancel()
+                    del pending[future]
+    finally:
+        for future in pending:
+            future.cancel()
+    return results
+
+async def concurrent_run_search_async(function: Callable, 
+                                      params: List[Tuple[str, date, date]], 
+                                      client, search_mode, output_type,
+                                      max_concurrency: int,
+                                      timeout: float,
+                                      on_result: Callable[[int, any], None] = None) -> List[any]:
+    """Concurrently run the asynchronous linkup api call with a bounded number of searches in flight.
+
+    Args:
+        function: Asynchronous Linkup API call function.
+        params: The list of parameters to be used.
+        client: linkup client.
+        search_mode: The search mode to be used.
+        output_type: The output type to be parsed.
+        max_concurrency: The maximum number of searches running at the same time.
+        timeout: The number of seconds a single search may run.
+        on_result: Called with the index and the result of every search as soon as it is done.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def search(query: str, from_date: date, to_date: date):
+        async with semaphore:
+            logger.info(f"Searching: {query} ...")
+            try:
+                return await asyncio.wait_for(function(client, query, search_mode, output_type, None, from_date, to_date),
+                                              timeout= timeout)
+            except asyncio.TimeoutError:
+                logger.warning(f"Search timed out after {timeout}s for {query}")
+            except Exception as e:
+                logger.warning(f"Search failed for {query}: {e}")
+            return fallback_search_output(query)
+
+    async def run_search(index: int, query: str, from_date: date, to_date: date):
+        result = await search(query, from_date, to_date)
+        if on_result is not None:
+            on_result(index, result)
+        return result
+
+    results = await asyncio.gather(*[run_search(i, query, from_date, to_date) 
+                                     for i, (query, from_date, to_date) in enumerate(params)])
+    return list(results)
+
+
 def format_all_questions_output(parallel_output: List[QuerySearchMetadata]) -> SubQueriesSearchMetadata:
     """Format the all questions output.
 
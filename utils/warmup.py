@@ -0,0 +1,63 @@
+"""
+Warm-up of a worker before it serves its first request.
+
+The clients are built lazily so that importing the application stays cheap; the warm-up
+builds them on startup instead of on the first request, together with the caches, and
+opens the pooled connections to the providers so the first calls skip the TCP and TLS
+handshakes. Any HTTP answer leaves its connection in the pool, so the warm-up requests
+do not need to succeed, and a slow or unreachable provider only delays the startup by
+WARMUP_TIMEOUT.
+"""
+from utils.config import get_settings
+from utils.http_utils import Destination, get_http_client, get_async_http_client
+from utils.llm_router import get_llm_router, get_async_llm_router
+from utils.llm_utils import get_llm_cache
+from utils.search_utils import get_search_cache, get_shared_linkup_client
+from typing import List, Tuple
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+def get_warmup_targets() -> List[Tuple[Destination, str]]:
+    """Get the pooled clients to warm up and the URL each of them opens connections to."""
+    targets = [(backend.name, str(backend.client.base_url)) for backend in get_llm_router().backends]
+    targets.append(("linkup", get_shared_linkup_client().base_url))
+    return targets
+
+def open_connection(destination: Destination, url: str):
+    try:
+        get_http_client(destination).head(url)
+    except Exception as e:
+        logger.debug(f"Warm-up of the {destination} connections failed: {e!r}")
+
+async def open_connection_async(destination: Destination, url: str):
+    try:
+        await get_async_http_client(destination).head(url)
+    except Exception as e:
+        logger.debug(f"Warm-up of the {destination} connections failed: {e!r}")
+
+async def warm_up():
+    """Build the clients and the caches, and open the pooled connections of the providers."""
+    settings = get_settings()
+    if not settings.warmup_enabled:
+        return
+    start = time.perf_counter()
+    # the clients read their settings, build SSL contexts and open the cache databases
+    await asyncio.gather(asyncio.to_thread(get_llm_router),
+                         asyncio.to_thread(get_async_llm_router),
+                         asyncio.to_thread(get_shared_linkup_client),
+                         asyncio.to_thread(get_llm_cache),
+                         asyncio.to_thread(get_search_cache))
+    targets = get_warmup_targets()
+    connections = []
+    for destination, url in targets:
+        for _ in range(settings.warmup_connections):
+            connections.append(asyncio.to_thread(open_connection, destination, url))
+            connections.append(open_connection_async(destination, url))
+    try:
+        await asyncio.wait_for(asyncio.gather(*connections), timeout= settings.warmup_timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"Warm-up of the connections did not finish within {settings.warmup_timeout}s")
+    logger.info(f"Warmed up {len(targets)} destinations in {time.perf_counter() - start:.2f}s")